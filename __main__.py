@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+Command line entry point, see cli.py
+"""
+import sys
+
+from .cli import main
+
+# Worker processes import the main module again, which must not run a new batch
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk backup of original geometries, used to revert runs which bypass the edit
+buffer. QGIS independent: geometries are stored as WKB blobs in a SQLite file.
+
+The backup also journals the run itself: its target feature ids, its options and a
+checkpoint (the last feature id written), so that an interrupted run can be resumed.
+"""
+import contextlib
+import json
+import os
+import sqlite3
+
+
+class GeometryBackup:
+    """
+    SQLite file mapping feature ids to their original WKB geometry. The first saved
+    geometry of a feature is kept, so that saving twice never loses the original.
+    """
+
+    def __init__(self, path):
+        """Constructor. The file is created on first use.
+
+        Args:
+            path (str): Path of the SQLite file
+        """
+        self.path = path
+
+    def exists(self):
+        """Whether there is a backup. The file is only created when a run starts, and
+        deleted once reverted.
+
+        Returns:
+            bool: True if there is something to revert
+        """
+        return os.path.exists(self.path)
+
+    @contextlib.contextmanager
+    def connect(self):
+        """Open the backup, creating it if needed. The connection is committed and
+        closed on exit.
+
+        Yields:
+            sqlite3.Connection: Connection
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS originals "
+                    "(fid INTEGER PRIMARY KEY, wkb BLOB)"
+                )
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS targets (fid INTEGER PRIMARY KEY)"
+                )
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS run (key TEXT PRIMARY KEY, value)"
+                )
+                yield connection
+        finally:
+            connection.close()
+
+    def save(self, fids, blobs):
+        """Save original geometries, in a single transaction
+
+        Args:
+            fids (list): Feature ids
+            blobs (list): Original WKB geometries
+        """
+        with self.connect() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO originals (fid, wkb) VALUES (?, ?)",
+                zip(fids, map(bytes, blobs)),
+            )
+
+    def chunks(self, size):
+        """Read the saved geometries by chunks
+
+        Args:
+            size (int): Chunk size
+
+        Yields:
+            (list, list): Feature ids and their original WKB geometries
+        """
+        last = None
+        while True:
+            with self.connect() as connection:
+                rows = connection.execute(
+                    "SELECT fid, wkb FROM originals WHERE ? IS NULL OR fid > ? "
+                    "ORDER BY fid LIMIT ?",
+                    (last, last, size),
+                ).fetchall()
+            if not rows:
+                return
+            fids, blobs = zip(*rows)
+            last = fids[-1]
+            yield list(fids), list(blobs)
+
+    def begin_run(self, fids, options=None):
+        """Journal a new run
+
+        Args:
+            fids (iterable): Target feature ids
+            options (dict, optional): Run options, returned by pending_run. Must be
+                JSON serializable. Defaults to None.
+        """
+        with self.connect() as connection:
+            connection.execute("DELETE FROM targets")
+            connection.execute("DELETE FROM run")
+            connection.executemany(
+                "INSERT OR IGNORE INTO targets (fid) VALUES (?)",
+                ((fid,) for fid in fids),
+            )
+            connection.execute(
+                "INSERT INTO run (key, value) VALUES ('options', ?)",
+                (json.dumps(options or {}),),
+            )
+
+    def pending_run(self):
+        """Options of the journaled run, if it was interrupted
+
+        Returns:
+            dict: Run options, or None if there is no interrupted run
+        """
+        if not self.exists():
+            return None
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT value FROM run WHERE key = 'options'"
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def checkpoint(self, fid):
+        """Record that all the target features up to fid are written
+
+        Args:
+            fid (int): Last written feature id
+        """
+        with self.connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO run (key, value) VALUES ('checkpoint', ?)",
+                (fid,),
+            )
+
+    def remaining_count(self):
+        """Number of target features after the checkpoint
+
+        Returns:
+            int: Number of features left
+        """
+        with self.connect() as connection:
+            return connection.execute(
+                "SELECT COUNT(*) FROM targets WHERE fid > "
+                "COALESCE((SELECT value FROM run WHERE key = 'checkpoint'), -1 << 62)"
+            ).fetchone()[0]
+
+    def remaining(self, size):
+        """Target feature ids after the checkpoint, in increasing order, by chunks
+
+        Args:
+            size (int): Chunk size
+
+        Yields:
+            list: Feature ids
+        """
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT value FROM run WHERE key = 'checkpoint'"
+            ).fetchone()
+        last = None if row is None else row[0]
+        while True:
+            with self.connect() as connection:
+                fids = [
+                    fid
+                    for (fid,) in connection.execute(
+                        "SELECT fid FROM targets WHERE ? IS NULL OR fid > ? "
+                        "ORDER BY fid LIMIT ?",
+                        (last, last, size),
+                    )
+                ]
+            if not fids:
+                return
+            last = fids[-1]
+            yield fids
+
+    def end_run(self):
+        """Forget the journaled run. The original geometries are kept."""
+        with self.connect() as connection:
+            connection.execute("DELETE FROM targets")
+            connection.execute("DELETE FROM run")
+
+    def remove(self):
+        """Delete the backup file"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
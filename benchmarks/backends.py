@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""
+Differential benchmark of the minimum bounding box engines, on the synthetic
+polygons of suite.py. Every engine computes the box of every polygon, and the boxes
+are checked against the vectorized engine (the numpy rotating calipers): same area,
+same angle modulo 90 degrees, and containing all the polygon vertices.
+
+Engines:
+    vectorized  core.convex_hull and core.minimum_bounding_boxes, one polygon per
+                call
+    batch       core.search_bounding_boxes, all the polygons in one call, as the
+                rectanglify runs do. Its latency is the per polygon average
+    python      core.python_bounding_box
+    native      QgsGeometry.orientedMinimumBoundingBox, on the QGIS versions
+                where it is exact (utils.NATIVE_MINIMUM_VERSION)
+    auto        utils.minimum_bounding_box, picking the engine by vertex count
+
+With the QGIS bindings, the single polygon engines are timed through
+utils.minimum_bounding_box, conversions included.
+
+Usage:
+    python benchmarks/backends.py [--vertices 4,16,64,256] [--features 1000]
+        [--output results.json]
+
+The report ends with the thresholds measured on this machine, to compare with
+utils.PYTHON_MAX_VERTICES (largest vertex count up to which the python engine beats
+the vectorized one) and utils.NATIVE_MIN_VERTICES (smallest vertex count from which
+the native engine beats the batch). Polygons whose boxes agree in area but not in
+angle have several minimum bounding boxes, and are reported as ties. The exit status
+is 1 if the engines disagree.
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from suite import PLUGIN_DIR, environment, percentiles, workload
+
+VERTICES = (4, 5, 8, 16, 32, 64, 128, 256, 1024, 4096)
+
+FEATURES = 1000
+
+# Reference engine of the comparisons
+REFERENCE = "vectorized"
+
+
+class Engines:
+    """Minimum bounding box engines, each one returning the rectangle of a WKB
+    polygon"""
+
+    def __init__(self, package, qgis):
+        """Constructor
+
+        Args:
+            package (str): Name of the plugin package
+            qgis (bool): Whether the QGIS bindings are available
+        """
+        self.core = importlib.import_module(package + ".core")
+        self.utils = importlib.import_module(package + ".utils") if qgis else None
+
+    def names(self):
+        """Available engines
+
+        Returns:
+            list: Engine names
+        """
+        if self.utils is None:
+            return [REFERENCE, "batch", "python"]
+        return self.utils.bounding_box_backends() + ["batch", "auto"]
+
+    def prepare(self, blobs):
+        """Engine inputs: the WKB, and a QgsGeometry with QGIS
+
+        Args:
+            blobs (list): WKB polygons
+
+        Returns:
+            list: (blob, geometry) inputs
+        """
+        if self.utils is None:
+            return [(blob, None) for blob in blobs]
+        return [(blob, self.utils.wkb_geometry(blob)) for blob in blobs]
+
+    def engine(self, name):
+        """Function computing the box of an input, in the engine native form
+
+        Args:
+            name (str): Engine name, but batch
+
+        Returns:
+            callable: Engine
+        """
+        if self.utils is not None:
+            backend = None if name == "auto" else name
+            return lambda item: self.utils.minimum_bounding_box(item[1], backend)
+        if name == "python":
+            return lambda item: self.core.python_bounding_box(
+                self.core.wkb_points(item[0])
+            )
+
+        def vectorized(item):
+            coords = self.core.read_wkb([item[0]])[0]
+            hull = self.core.convex_hull(coords)
+            return self.core.minimum_bounding_boxes(hull, [0, len(hull)])[0]
+
+        return vectorized
+
+    def batch(self, inputs):
+        """Time the batch engine over all the inputs at once
+
+        Args:
+            inputs (list): Inputs
+
+        Returns:
+            (list, list): Rectangles and the average latency of each input
+        """
+        begin = time.perf_counter()
+        coords, ring_offsets, polygon_offsets = self.core.read_wkb(
+            [blob for blob, _ in inputs]
+        )[:3]
+        outer = polygon_offsets[:-1]
+        rectangles = self.core.search_bounding_boxes(
+            *self.core.take_segments(coords, ring_offsets, outer)
+        )
+        latency = (time.perf_counter() - begin) / len(inputs)
+        return list(rectangles), [latency] * len(inputs)
+
+    def rectangle(self, result):
+        """Rectangle of an engine result
+
+        Args:
+            result: Engine result, a rectangle or a (QgsGeometry, angle) tuple
+
+        Returns:
+            numpy.ndarray: (5,) rectangle
+        """
+        if self.utils is None or len(result) == 5:
+            return np.asarray(result, dtype=float)
+        blob = self.utils.geometry_wkb(result[0])
+        coords, ring_offsets = self.core.read_wkb([blob])[:2]
+        polygon_offsets = np.array([0, 1])
+        return self.core.rectangle_parameters(coords, ring_offsets, polygon_offsets)[0]
+
+
+def run(engine, inputs):
+    """Time an engine over each input
+
+    Args:
+        engine (callable): Engine
+        inputs (list): Inputs
+
+    Returns:
+        (list, list): Results and per input latencies
+    """
+    results, latencies = [], []
+    for item in inputs:
+        begin = time.perf_counter()
+        results.append(engine(item))
+        latencies.append(time.perf_counter() - begin)
+    return results, latencies
+
+
+def uncontained(rectangle, coords, tolerance):
+    """Whether points lie outside of a rectangle
+
+    Args:
+        rectangle (numpy.ndarray): (5,) rectangle
+        coords (numpy.ndarray): (n, 2) points
+        tolerance (float): Relative tolerance, to the rectangle size
+
+    Returns:
+        bool: True if a point is outside
+    """
+    theta = np.radians(rectangle[4])
+    cos, sin = np.cos(theta), np.sin(theta)
+    offsets = coords - rectangle[:2]
+    along = np.abs(offsets[:, 0] * cos + offsets[:, 1] * sin)
+    across = np.abs(offsets[:, 1] * cos - offsets[:, 0] * sin)
+    margin = tolerance * max(rectangle[2], rectangle[3], 1.0)
+    return bool(
+        along.max() > rectangle[2] / 2 + margin
+        or across.max() > rectangle[3] / 2 + margin
+    )
+
+
+def compare(rectangles, reference, coords, area_tolerance, angle_tolerance):
+    """Agreement of the rectangles of an engine with the reference ones
+
+    Args:
+        rectangles (numpy.ndarray): (s, 5) rectangles of the engine
+        reference (numpy.ndarray): (s, 5) rectangles of the reference engine
+        coords (list): (n, 2) vertices of each polygon
+        area_tolerance (float): Relative area tolerance
+        angle_tolerance (float): Angle tolerance in degrees
+
+    Returns:
+        dict: Number of area mismatches, ties and boxes not containing their polygon
+    """
+    areas = rectangles[:, 2] * rectangles[:, 3]
+    reference_areas = reference[:, 2] * reference[:, 3]
+    area_mismatch = np.abs(areas - reference_areas) > area_tolerance * np.maximum(
+        reference_areas, np.finfo(float).tiny
+    )
+    difference = np.mod(rectangles[:, 4] - reference[:, 4], 90)
+    angle_mismatch = np.minimum(difference, 90 - difference) > angle_tolerance
+    return {
+        "area_mismatches": int(area_mismatch.sum()),
+        "ties": int((angle_mismatch & ~area_mismatch).sum()),
+        "uncontained": sum(
+            uncontained(rectangle, points, area_tolerance)
+            for rectangle, points in zip(rectangles, coords)
+        ),
+    }
+
+
+def thresholds(results):
+    """Vertex counts where the engines of the dispatch cross over
+
+    Args:
+        results (list): Cases of the run
+
+    Returns:
+        dict: python_max_vertices, the largest vertex count up to which the python
+            engine is faster than the vectorized one, and native_min_vertices, the
+            smallest vertex count from which the native engine is faster than the
+            batch. None when not measured.
+    """
+    speed = {
+        (case["engine"], case["vertices"]): case["features_per_second"]
+        for case in results
+    }
+    counts = sorted({case["vertices"] for case in results})
+
+    def faster(engine, other, vertices):
+        return speed.get((engine, vertices), 0) > speed.get((other, vertices), 0)
+
+    python_max = None
+    for vertices in counts:
+        if not faster("python", REFERENCE, vertices):
+            break
+        python_max = vertices
+    native_min = None
+    for vertices in reversed(counts):
+        if not faster("native", "batch", vertices):
+            break
+        native_min = vertices
+    return {"python_max_vertices": python_max, "native_min_vertices": native_min}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--vertices",
+        default=",".join(map(str, VERTICES)),
+        help="Comma separated vertex counts of the polygons",
+    )
+    parser.add_argument(
+        "--features",
+        type=int,
+        default=FEATURES,
+        help="Number of polygons per vertex count",
+    )
+    parser.add_argument(
+        "--area-tolerance",
+        type=float,
+        default=1e-6,
+        help="Relative tolerance of the area comparisons",
+    )
+    parser.add_argument(
+        "--angle-tolerance",
+        type=float,
+        default=1e-4,
+        help="Tolerance of the angle comparisons, in degrees",
+    )
+    parser.add_argument("--output", help="Write the report to this file")
+    args = parser.parse_args()
+
+    # Headless QGIS, if available
+    qgis = True
+    try:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from qgis.core import QgsApplication
+
+        app = QgsApplication([], False)
+        app.initQgis()
+    except ImportError:
+        qgis = False
+
+    sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+    engines = Engines(os.path.basename(PLUGIN_DIR), qgis)
+    names = engines.names()
+
+    results, failed = [], False
+    for vertices in [int(count) for count in args.vertices.split(",") if count]:
+        blobs = workload(vertices, 0, 1, max(args.features, 1))
+        inputs = engines.prepare(blobs)
+        coords = [engines.core.read_wkb([blob])[0] for blob in blobs]
+
+        timings, rectangles = {}, {}
+        for name in names:
+            if name == "batch":
+                boxes, latencies = engines.batch(inputs)
+            else:
+                boxes, latencies = run(engines.engine(name), inputs)
+            timings[name] = latencies
+            rectangles[name] = np.array([engines.rectangle(box) for box in boxes])
+
+        reference_seconds = sum(timings[REFERENCE])
+        for name in names:
+            case = {
+                "vertices": vertices,
+                "features": len(blobs),
+                "engine": name,
+                "features_per_second": len(blobs) / sum(timings[name]),
+                "speedup": reference_seconds / sum(timings[name]),
+                "latency_us": percentiles(timings[name]),
+            }
+            case.update(
+                compare(
+                    rectangles[name],
+                    rectangles[REFERENCE],
+                    coords,
+                    args.area_tolerance,
+                    args.angle_tolerance,
+                )
+            )
+            failed |= bool(case["area_mismatches"] or case["uncontained"])
+            print(json.dumps(case), file=sys.stderr)
+            results.append(case)
+
+    report = {
+        "environment": environment(),
+        "engines": names,
+        "results": results,
+        "thresholds": thresholds(results),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    print(output)
+
+    if qgis:
+        app.exitQgis()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
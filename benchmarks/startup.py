@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Startup benchmark of the rectanglify plugin: how many milliseconds it adds to the
+QGIS launch. Each run loads the plugin in a fresh interpreter (offscreen
+QgsApplication, mocked QgisInterface), and times the package import, classFactory
+and initGui.
+
+Usage:
+    python benchmarks/startup.py [--runs 10]
+
+The report is printed on stdout as JSON.
+"""
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules which should only be loaded when the plugin is first used
+LAZY_MODULES = ["numpy", "resources", "settingsdialog", "utils", "core", "cache"]
+
+
+def measure():
+    """Load the plugin once, in the current interpreter
+
+    Returns:
+        dict: Duration of each step in milliseconds, and the lazy modules which
+            were loaded anyway
+    """
+    from unittest import mock
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from qgis.core import QgsApplication
+    from qgis.PyQt.QtWidgets import QMainWindow, QMenu, QToolBar
+
+    app = QgsApplication([], True)
+    app.initQgis()
+
+    window = QMainWindow()
+    iface = mock.MagicMock()
+    iface.mainWindow.return_value = window
+    iface.pluginMenu.return_value = QMenu(window)
+    iface.editMenu.return_value = QMenu(window)
+    iface.advancedDigitizeToolBar.return_value = QToolBar(window)
+    iface.activeLayer.return_value = None
+
+    name = os.path.basename(PLUGIN_DIR)
+    sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+    before = set(sys.modules)
+
+    start = time.perf_counter()
+    package = importlib.import_module(name)
+    plugin = package.classFactory(iface)
+    created = time.perf_counter()
+    plugin.initGui()
+    end = time.perf_counter()
+
+    loaded = set(sys.modules) - before
+    result = {
+        "import_ms": (created - start) * 1000,
+        "init_gui_ms": (end - created) * 1000,
+        "total_ms": (end - start) * 1000,
+        "eager_modules": sorted(
+            module
+            for module in LAZY_MODULES
+            if module in loaded or "{}.{}".format(name, module) in loaded
+        ),
+    }
+    plugin.unload()
+    app.exitQgis()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=10, help="Number of runs")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure()))
+        return
+
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, __file__, "--child"],
+            check=True,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    report = {"runs": len(runs), "eager_modules": runs[0]["eager_modules"]}
+    for key in ("import_ms", "init_gui_ms", "total_ms"):
+        values = [run[key] for run in runs]
+        report[key] = {
+            "median": statistics.median(values),
+            "min": min(values),
+            "max": max(values),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,509 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite of the rectanglify plugin, on synthetic polygon workloads of
+varying vertex counts, ring counts, multipart sizes and layer sizes. Workloads are
+generated from a fixed seed, so that runs on the same machine can be compared.
+
+Benchmarks:
+    core        core.rectanglify_wkb on WKB blobs, by chunks (no QGIS needed)
+    geometries  utils.rectanglify_geometries on QgsGeometry, by chunks
+    geometry    utils.rectanglify_geometry, feature by feature
+    mbb         utils.minimum_bounding_box, feature by feature
+    pipeline    What a plugin run does (see Rectanglify._rectanglify): read the
+                features of a memory layer by chunks, rectanglify them and apply
+                the new geometries to the layer edit buffer
+
+Usage:
+    python benchmarks/suite.py [--benchmarks core,pipeline] [--scale 0.1]
+        [--output results.json] [--compare baseline.json]
+
+Each case reports its throughput and its per-feature latency percentiles (for
+chunked benchmarks, the chunk duration divided by its size). Two untimed passes
+measure its memory: python_heap_peak_mb, the peak of the Python allocations traced
+by tracemalloc, which misses the QGIS and GEOS allocations, and peak_rss_mb, the
+peak resident set size of a fresh process generating the workload and running the
+case, interpreter and QGIS included (not on Windows). The report is printed as JSON.
+"""
+import argparse
+import gc
+import importlib
+import json
+import os
+import platform
+import struct
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (vertices per ring, holes per polygon, parts per geometry, features)
+WORKLOADS = (
+    [(vertices, 0, 1, 10000) for vertices in (5, 16, 64, 256, 1024)]
+    + [(16, holes, 1, 10000) for holes in (1, 4, 16)]
+    + [(16, 0, parts, 10000) for parts in (2, 8, 32)]
+    + [(16, 0, 1, features) for features in (1000, 100000, 1000000)]
+)
+
+# Fields identifying a workload in the report
+WORKLOAD_KEYS = ("vertices", "holes", "parts", "layer_features")
+
+# Per feature benchmarks are limited to this many features
+LATENCY_FEATURES = 10000
+
+CHUNK_SIZE = 1000
+
+
+def ring_coordinates(rng, count, vertices, radius, clockwise=False):
+    """Random star shaped rings, closed, around the origin
+
+    Args:
+        rng (numpy.random.Generator): Random generator
+        count (int): Number of rings
+        vertices (int): Number of distinct vertices per ring
+        radius (float): Maximum radius
+        clockwise (bool, optional): Orientation. Defaults to False.
+
+    Returns:
+        numpy.ndarray: (count, vertices + 1, 2) array of coordinates
+    """
+    angles = np.sort(rng.random((count, vertices)), axis=1) * 2 * np.pi
+    if clockwise:
+        angles = angles[:, ::-1]
+    radii = radius * (0.7 + 0.3 * rng.random((count, vertices)))
+
+    # Elongated and rotated, to look like buildings
+    rotation = rng.random((count, 1)) * np.pi
+    x = radii * np.cos(angles) * 2
+    y = radii * np.sin(angles)
+    coords = np.stack(
+        [
+            x * np.cos(rotation) - y * np.sin(rotation),
+            x * np.sin(rotation) + y * np.cos(rotation),
+        ],
+        axis=-1,
+    )
+    return np.concatenate([coords, coords[:, :1]], axis=1)
+
+
+def polygon_wkb(rings):
+    """WKB of a polygon
+
+    Args:
+        rings (list): (k, 2) arrays of closed ring coordinates
+
+    Returns:
+        bytes: WKB
+    """
+    return b"".join(
+        [struct.pack("<BII", 1, 3, len(rings))]
+        + [struct.pack("<I", len(ring)) + ring.tobytes() for ring in rings]
+    )
+
+
+def workload(vertices, holes, parts, features, seed=0):
+    """Synthetic geometries, laid out on a grid
+
+    Args:
+        vertices (int): Number of vertices per ring
+        holes (int): Number of holes per polygon
+        parts (int): Number of parts per geometry. If more than 1, geometries are
+            multipolygons
+        features (int): Number of geometries
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        list: WKB blobs
+    """
+    rng = np.random.default_rng(seed)
+    count = features * parts
+    side = int(np.ceil(np.sqrt(count)))
+    centers = np.stack([np.arange(count) % side, np.arange(count) // side], axis=1)
+    centers = centers * 100.0
+    exteriors = ring_coordinates(rng, count, vertices, 20) + centers[:, None]
+
+    # Holes are small rings spread inside the polygon core
+    interiors = []
+    if holes:
+        offsets = (rng.random((count, holes, 2)) - 0.5) * 10
+        interiors = (
+            ring_coordinates(
+                rng, count * holes, vertices, 10 / (holes + 1), clockwise=True
+            ).reshape(count, holes, vertices + 1, 2)
+            + (centers[:, None] + offsets)[:, :, None]
+        )
+
+    polygons = [
+        polygon_wkb([exteriors[i]] + [interiors[i][j] for j in range(holes)])
+        for i in range(count)
+    ]
+    if parts == 1:
+        return polygons
+    return [
+        struct.pack("<BII", 1, 6, parts)
+        + b"".join(polygons[i * parts : (i + 1) * parts])
+        for i in range(features)
+    ]
+
+
+def percentiles(latencies):
+    """Latency percentiles in microseconds
+
+    Args:
+        latencies (list): Per feature latencies in seconds
+
+    Returns:
+        dict: p50, p90, p99 and max
+    """
+    values = np.asarray(latencies) * 1e6
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p90": float(np.percentile(values, 90)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+    }
+
+
+def run_chunks(function, items):
+    """Time a function over chunks of items
+
+    Args:
+        function (callable): Called with each chunk
+        items (list): Items
+
+    Returns:
+        list: Per item latencies
+    """
+    latencies = []
+    for start in range(0, len(items), CHUNK_SIZE):
+        chunk = items[start : start + CHUNK_SIZE]
+        begin = time.perf_counter()
+        function(chunk)
+        latencies.extend([(time.perf_counter() - begin) / len(chunk)] * len(chunk))
+    return latencies
+
+
+def run_each(function, items):
+    """Time a function over each item
+
+    Args:
+        function (callable): Called with each item
+        items (list): Items
+
+    Returns:
+        list: Per item latencies
+    """
+    latencies = []
+    for item in items:
+        begin = time.perf_counter()
+        function(item)
+        latencies.append(time.perf_counter() - begin)
+    return latencies
+
+
+class Benchmarks:
+    """Benchmarks of the plugin entry points on a workload"""
+
+    def __init__(self, package, qgis):
+        """Constructor
+
+        Args:
+            package (str): Name of the plugin package
+            qgis (bool): Whether the QGIS bindings are available
+        """
+        self.core = importlib.import_module(package + ".core")
+        self.utils = importlib.import_module(package + ".utils") if qgis else None
+
+    def geometries(self, blobs):
+        """QgsGeometry of the blobs"""
+        return [self.utils.wkb_geometry(blob) for blob in blobs]
+
+    def bench_core(self, blobs):
+        """core.rectanglify_wkb, by chunks"""
+        return lambda: run_chunks(self.core.rectanglify_wkb, blobs)
+
+    def bench_geometries(self, blobs):
+        """utils.rectanglify_geometries, by chunks"""
+        geometries = self.geometries(blobs)
+        return lambda: run_chunks(self.utils.rectanglify_geometries, geometries)
+
+    def bench_geometry(self, blobs):
+        """utils.rectanglify_geometry, feature by feature"""
+        geometries = self.geometries(blobs[:LATENCY_FEATURES])
+        return lambda: run_each(self.utils.rectanglify_geometry, geometries)
+
+    def bench_mbb(self, blobs):
+        """utils.minimum_bounding_box, feature by feature"""
+        geometries = self.geometries(blobs[:LATENCY_FEATURES])
+        return lambda: run_each(self.utils.minimum_bounding_box, geometries)
+
+    def bench_pipeline(self, blobs):
+        """Read, rectanglify and apply the features of a memory layer"""
+        from qgis.core import QgsFeature, QgsVectorLayer, QgsWkbTypes
+
+        geometries = self.geometries(blobs)
+        layer = QgsVectorLayer(
+            "{}?crs=EPSG:3857".format(
+                QgsWkbTypes.displayString(geometries[0].wkbType())
+            ),
+            "benchmark",
+            "memory",
+        )
+        features = []
+        for geometry in geometries:
+            feature = QgsFeature()
+            feature.setGeometry(geometry)
+            features.append(feature)
+        layer.dataProvider().addFeatures(features)
+        del features, geometries
+
+        def run():
+            layer.startEditing()
+            latencies = []
+            chunks = self.utils.chunked(layer.getFeatures(), CHUNK_SIZE)
+            begin = time.perf_counter()
+            for chunk, new_geoms in self.utils.rectanglify_chunks(chunks):
+                for feature, geometry in zip(chunk, new_geoms):
+                    if geometry is not None:
+                        layer.changeGeometry(feature.id(), geometry, True)
+                end = time.perf_counter()
+                latencies.extend([(end - begin) / len(chunk)] * len(chunk))
+                begin = end
+            layer.rollBack()
+            return latencies
+
+        return run
+
+
+def measure(run, memory=True):
+    """Run a benchmark
+
+    Args:
+        run (callable): Runs the benchmark, returns per feature latencies
+        memory (bool, optional): If True, run it again with tracemalloc to measure
+            its peak Python heap. Defaults to True.
+
+    Returns:
+        dict: Results
+    """
+    gc.collect()
+    begin = time.perf_counter()
+    latencies = run()
+    seconds = time.perf_counter() - begin
+    result = {
+        "features": len(latencies),
+        "seconds": seconds,
+        "features_per_second": len(latencies) / seconds,
+        "latency_us": percentiles(latencies),
+    }
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        run()
+        result["python_heap_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result
+
+
+def max_rss_mb():
+    """Peak resident set size of this process
+
+    Returns:
+        float: Size in MB, None where unavailable
+    """
+    # On Linux, ru_maxrss keeps the peak of the parent process across exec: the
+    # peak of this process image is read from /proc instead
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 2 ** 10
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return rss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+
+def peak_rss(name, workload_case):
+    """Measure the peak resident set size of a case in a fresh process, which
+    accounts for the native QGIS and GEOS allocations
+
+    Args:
+        name (str): Benchmark name
+        workload_case (tuple): Vertices, holes, parts and features of the workload
+
+    Returns:
+        float: Peak resident set size of the process, in MB. None if unavailable.
+    """
+    if resource is None:
+        return None
+    process = subprocess.run(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--rss-case",
+            ",".join(map(str, (name,) + tuple(workload_case))),
+        ],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if process.returncode:
+        return None
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+def environment():
+    """Description of the machine and versions, to tell whether runs compare
+
+    Returns:
+        dict: Environment
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=PLUGIN_DIR,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        ).stdout.strip()
+    except OSError:
+        commit = None
+    try:
+        from qgis.core import Qgis
+
+        qgis_version = Qgis.QGIS_VERSION
+    except ImportError:
+        qgis_version = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "qgis": qgis_version,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "system": platform.platform(),
+    }
+
+
+def compare(results, baseline):
+    """Throughput ratios of the results over a baseline
+
+    Args:
+        results (list): Cases of this run
+        baseline (list): Cases of the baseline run
+
+    Returns:
+        list: Cases found in both runs, with their speedup
+    """
+
+    def key(case):
+        return tuple(case[name] for name in ("benchmark", *WORKLOAD_KEYS))
+
+    previous = {key(case): case for case in baseline}
+    return [
+        dict(
+            zip(("benchmark", *WORKLOAD_KEYS), key(case)),
+            speedup=case["features_per_second"]
+            / previous[key(case)]["features_per_second"],
+        )
+        for case in results
+        if key(case) in previous
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--benchmarks",
+        default="core,geometries,geometry,mbb,pipeline",
+        help="Comma separated benchmarks to run",
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Factor applied to the number of features of the workloads",
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true", help="Skip the peak memory pass"
+    )
+    parser.add_argument("--output", help="Write the report to this file")
+    parser.add_argument("--compare", help="Report of a previous run to compare to")
+    # Single case run by peak_rss, printing the peak resident set size
+    parser.add_argument("--rss-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Headless QGIS, if available. The core benchmark runs without it
+    qgis = True
+    try:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from qgis.core import QgsApplication
+
+        app = QgsApplication([], False)
+        app.initQgis()
+    except ImportError:
+        qgis = False
+
+    sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+    benchmarks = Benchmarks(os.path.basename(PLUGIN_DIR), qgis)
+
+    if args.rss_case:
+        name, *workload_case = args.rss_case.split(",")
+        run = getattr(benchmarks, "bench_" + name)(workload(*map(int, workload_case)))
+        run()
+        print(json.dumps(max_rss_mb()))
+        if qgis:
+            app.exitQgis()
+        return
+
+    names = [name for name in args.benchmarks.split(",") if name]
+    skipped = [name for name in names if name != "core" and not qgis]
+
+    results = []
+    for vertices, holes, parts, features in WORKLOADS:
+        features = max(1, int(features * args.scale))
+        blobs = workload(vertices, holes, parts, features)
+        for name in names:
+            if name in skipped:
+                continue
+            run = getattr(benchmarks, "bench_" + name)(blobs)
+            case = dict(
+                zip(WORKLOAD_KEYS, (vertices, holes, parts, features)), benchmark=name
+            )
+            case.update(measure(run, not args.no_memory))
+            if not args.no_memory:
+                case["peak_rss_mb"] = peak_rss(name, (vertices, holes, parts, features))
+            print(json.dumps(case), file=sys.stderr)
+            results.append(case)
+
+    report = {"environment": environment(), "skipped": skipped, "results": results}
+    if args.compare:
+        with open(args.compare) as file:
+            report["comparison"] = compare(results, json.load(file)["results"])
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    print(output)
+
+    if qgis:
+        app.exitQgis()
+
+
+if __name__ == "__main__":
+    main()
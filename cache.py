@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of the minimum bounding boxes of geometries. QGIS independent: entries
+are keyed by a hash of the geometry WKB and stored in a SQLite file.
+
+The minimum bounding box only depends on the geometry, not on the rectanglify
+settings, so that re-running with other settings, or on a mostly unchanged layer,
+skips the rotating calipers search.
+"""
+import contextlib
+import hashlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+# Default maximum number of cached geometries
+MAX_ENTRIES = 500000
+
+
+def geometry_key(blob):
+    """Cache key of a geometry
+
+    Args:
+        blob (bytes): WKB geometry
+
+    Returns:
+        bytes: 16 bytes hash of the WKB
+    """
+    return hashlib.blake2b(bytes(blob), digest_size=16).digest()
+
+
+class AnalysisCache:
+    """
+    SQLite file mapping geometry hashes to the minimum bounding boxes of their parts
+    outer rings. The least recently used entries are evicted beyond max_entries.
+    """
+
+    def __init__(self, path, max_entries=MAX_ENTRIES):
+        """Constructor. The file is created on first use.
+
+        Args:
+            path (str): Path of the SQLite file
+            max_entries (int, optional): Maximum number of entries. Defaults to
+                MAX_ENTRIES.
+        """
+        self.path = path
+        self.max_entries = max_entries
+
+    @contextlib.contextmanager
+    def connect(self):
+        """Open the cache, creating it if needed. The connection is committed and
+        closed on exit.
+
+        Yields:
+            sqlite3.Connection: Connection
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS entries "
+                    "(key BLOB PRIMARY KEY, boxes BLOB, used REAL)"
+                )
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS entries_used ON entries (used)"
+                )
+                yield connection
+        finally:
+            connection.close()
+
+    def get_many(self, keys):
+        """Look up cached boxes, and mark the hits as recently used
+
+        Args:
+            keys (list): Geometry keys, see geometry_key
+
+        Returns:
+            list: (parts, 5) array of boxes for each key, None if not cached
+        """
+        found = {}
+        now = time.time()
+        with self.connect() as connection:
+            unique = list(set(keys))
+            # Stay below the SQLite variables limit
+            for start in range(0, len(unique), 500):
+                batch = unique[start : start + 500]
+                placeholders = ",".join("?" * len(batch))
+                found.update(
+                    connection.execute(
+                        "SELECT key, boxes FROM entries WHERE key IN (%s)"
+                        % placeholders,
+                        batch,
+                    ).fetchall()
+                )
+                connection.execute(
+                    "UPDATE entries SET used = ? WHERE key IN (%s)" % placeholders,
+                    [now] + batch,
+                )
+        return [
+            np.frombuffer(found[key]).reshape(-1, 5) if key in found else None
+            for key in keys
+        ]
+
+    def put_many(self, keys, boxes):
+        """Store boxes, then evict the least recently used entries
+
+        Args:
+            keys (list): Geometry keys, see geometry_key
+            boxes (list): (parts, 5) array of boxes for each key
+        """
+        now = time.time()
+        with self.connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO entries (key, boxes, used) VALUES (?, ?, ?)",
+                (
+                    (key, np.asarray(value, dtype=float).tobytes(), now)
+                    for key, value in zip(keys, boxes)
+                ),
+            )
+            excess = (
+                connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                - self.max_entries
+            )
+            if excess > 0:
+                connection.execute(
+                    "DELETE FROM entries WHERE key IN "
+                    "(SELECT key FROM entries ORDER BY used LIMIT ?)",
+                    (excess,),
+                )
+
+    def clear(self):
+        """Delete the cache file"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
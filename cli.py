@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Rectanglify command line: streams the features of a polygon file to a new file,
+without the QGIS desktop nor a display.
+
+    python -m rectanglify buildings.gpkg rectangles.fgb --workers 4
+
+The output format is given by the extension of the output file (GeoPackage,
+Shapefile, FlatGeobuf, or any other OGR format, see --driver). The attributes are
+copied, empty and already rectangular features keep their geometry. The plugin
+directory must be in the Python path, e.g. run from the QGIS plugins directory.
+"""
+import argparse
+import os
+import sys
+import time
+
+from qgis.core import (
+    QgsApplication,
+    QgsCoordinateTransformContext,
+    QgsFeatureRequest,
+    QgsFeatureSink,
+    QgsVectorFileWriter,
+    QgsVectorLayer,
+    QgsWkbTypes,
+)
+
+from .cache import AnalysisCache
+from .stats import RunStats
+from .utils import (
+    ANGLE_ATTRIBUTE,
+    ANGLE_DOMINANT,
+    ANGLE_FIXED,
+    ANGLE_MINIMUM,
+    CHUNK_SIZE,
+    chunked,
+    feature_angles,
+    rectanglify_chunks,
+)
+
+# Minimum number of seconds between two progress lines
+PROGRESS_INTERVAL = 1.0
+
+
+def parse_args(argv=None):
+    """Command line arguments
+
+    Args:
+        argv (list, optional): Arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        argparse.Namespace: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m rectanglify",
+        description=__doc__.split("\n\n")[0].strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("input", help="Input polygon file")
+    parser.add_argument("output", help="Output file, overwritten if it exists")
+    parser.add_argument("--layer", help="Layer of the input file to read")
+    parser.add_argument(
+        "--output-layer", help="Layer of the output file. Defaults to the input name"
+    )
+    parser.add_argument(
+        "--driver",
+        help="OGR driver of the output file. Defaults to the driver of its extension",
+    )
+    parser.add_argument(
+        "--no-constant-area",
+        dest="constant_area",
+        action="store_false",
+        help="Keep the minimum bounding boxes instead of scaling them to the area of "
+        "the features",
+    )
+    parser.add_argument(
+        "--no-keep-rings",
+        dest="keep_rings",
+        action="store_false",
+        help="Drop the rings instead of rectanglifying them",
+    )
+    parser.add_argument(
+        "--no-rings-share-axes",
+        dest="rings_share_axes",
+        action="store_false",
+        help="Orient the rings independently of their outer polygon",
+    )
+    parser.add_argument(
+        "--no-skip",
+        dest="skip_unchanged",
+        action="store_false",
+        help="Compute the features which are already rectangles",
+    )
+    parser.add_argument(
+        "--area-tolerance",
+        type=float,
+        default=0.0,
+        help="Approximate the minimum bounding boxes within this area percentage",
+    )
+    parser.add_argument(
+        "--angle-mode",
+        choices=(ANGLE_MINIMUM, ANGLE_FIXED, ANGLE_ATTRIBUTE, ANGLE_DOMINANT),
+        default=ANGLE_MINIMUM,
+        help="Orientation of the rectangles",
+    )
+    parser.add_argument(
+        "--angle", type=float, default=0.0, help="Angle of the fixed mode, in degrees"
+    )
+    parser.add_argument("--angle-field", default="", help="Field of the attribute mode")
+    parser.add_argument(
+        "--radius",
+        type=float,
+        default=100.0,
+        help="Neighborhood radius of the dominant mode, in layer units",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Number of worker processes"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=CHUNK_SIZE,
+        help="Number of features rectanglified in a single batch",
+    )
+    parser.add_argument("--cache", help="SQLite file caching the bounding boxes")
+    parser.add_argument(
+        "--statistics", help="Write the run statistics to this JSON file"
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="Do not report the progress"
+    )
+    return parser.parse_args(argv)
+
+
+def open_writer(args, layer):
+    """Create the output file, with the fields and CRS of the input layer
+
+    Args:
+        args (argparse.Namespace): Command line arguments
+        layer (QgsVectorLayer): Input layer
+
+    Returns:
+        QgsVectorFileWriter: Writer of the output file
+    """
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = args.driver or QgsVectorFileWriter.driverForExtension(
+        os.path.splitext(args.output)[1]
+    )
+    options.layerName = args.output_layer or layer.name()
+    options.fileEncoding = "UTF-8"
+    # Rectangles are always linear and 2D
+    wkb_type = QgsWkbTypes.linearType(QgsWkbTypes.flatType(layer.wkbType()))
+    return QgsVectorFileWriter.create(
+        args.output,
+        layer.fields(),
+        wkb_type,
+        layer.crs(),
+        QgsCoordinateTransformContext(),
+        options,
+    )
+
+
+def run(args, layer, writer):
+    """Rectanglify the features of the input layer into the writer
+
+    Args:
+        args (argparse.Namespace): Command line arguments
+        layer (QgsVectorLayer): Input layer
+        writer (QgsVectorFileWriter): Writer of the output file
+
+    Returns:
+        RunStats: Statistics of the run, None if the output could not be written
+    """
+    stats = RunStats(layer.featureCount())
+    cache = AnalysisCache(args.cache) if args.cache else None
+    angles = feature_angles(
+        layer, args.angle_mode, args.angle, args.angle_field, args.radius
+    )
+
+    features = layer.getFeatures(QgsFeatureRequest())
+    results = rectanglify_chunks(
+        chunked(features, max(args.chunk_size, 1)),
+        args.constant_area,
+        args.keep_rings,
+        args.rings_share_axes,
+        max(args.workers, 1),
+        cache,
+        stats,
+        args.skip_unchanged,
+        angles,
+        args.area_tolerance / 100,
+    )
+    reported = time.perf_counter()
+    for chunk, geometries in results:
+        # Empty and skipped features keep their geometry
+        for feat, geometry in zip(chunk, geometries):
+            if geometry is not None:
+                feat.setGeometry(geometry)
+        with stats.stage("write"):
+            written = writer.addFeatures(chunk, QgsFeatureSink.FastInsert)
+        if not written:
+            results.close()
+            print(
+                "Cannot write to {}: {}".format(args.output, writer.lastError()),
+                file=sys.stderr,
+            )
+            return None
+        if not args.quiet and time.perf_counter() - reported >= PROGRESS_INTERVAL:
+            reported = time.perf_counter()
+            print(stats.status(), file=sys.stderr)
+    stats.finish()
+    return stats
+
+
+def main(argv=None):
+    """Entry point of the command line
+
+    Args:
+        argv (list, optional): Arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        int: Exit status
+    """
+    args = parse_args(argv)
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QgsApplication([], False)
+    app.initQgis()
+    try:
+        uri = args.input + ("|layername=" + args.layer if args.layer else "")
+        name = args.layer or os.path.splitext(os.path.basename(args.input))[0]
+        layer = QgsVectorLayer(uri, name, "ogr")
+        if not layer.isValid():
+            print("Cannot open {}".format(uri), file=sys.stderr)
+            return 1
+        if layer.geometryType() != QgsWkbTypes.PolygonGeometry:
+            print("{} is not a polygon layer".format(uri), file=sys.stderr)
+            return 1
+
+        writer = open_writer(args, layer)
+        if writer.hasError() != QgsVectorFileWriter.NoError:
+            print(writer.errorMessage(), file=sys.stderr)
+            return 1
+        try:
+            stats = run(args, layer, writer)
+        finally:
+            # The output file is complete once the writer is deleted
+            del writer
+        if stats is None:
+            return 1
+
+        if args.statistics:
+            stats.write(args.statistics)
+        if not args.quiet:
+            print(stats.report(), file=sys.stderr)
+        return 0
+    finally:
+        app.exitQgis()
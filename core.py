@@ -0,0 +1,1534 @@
+# -*- coding: utf-8 -*-
+"""
+QGIS independent geometry core of the rectanglify plugin. Only depends on numpy, so
+that it can run (and be profiled) outside of a QGIS process.
+
+Polygons are handled as struct-of-arrays batches:
+    - coords: (n, 2) array of all the vertices
+    - ring_offsets: (r + 1,) array, ring i spans coords[ring_offsets[i]:ring_offsets[i + 1]]
+    - polygon_offsets: (p + 1,) array, polygon j spans rings
+      polygon_offsets[j]:polygon_offsets[j + 1], the first one being the outer ring
+    - part_offsets: (g + 1,) array, geometry k spans polygons
+      part_offsets[k]:part_offsets[k + 1]
+
+Rectangles are (center x, center y, width, height, angle) rows, the angle being in
+degrees, counter-clockwise from the x axis.
+"""
+import contextlib
+import math
+import struct
+import time
+
+import numpy as np
+
+# Up to this number of vertices, the approximate bounding box search falls back to
+# the exact one, which is cheap for them
+APPROXIMATE_MIN_VERTICES = 64
+
+WKB_POLYGON = 3
+WKB_MULTIPOLYGON = 6
+
+# Relative tolerance of the already rectangular geometries detection
+RECTANGLE_TOLERANCE = 1e-6
+
+# Maximum number of directions sampled by the approximate bounding box search,
+# before falling back to the exact search
+APPROXIMATE_MAX_DIRECTIONS = 1024
+
+# Maximum number of point projections computed at once by the approximate search
+APPROXIMATE_BATCH = 1 << 22
+
+# Number of bins of the edge orientation histograms, spanning 90 degrees
+ORIENTATION_BINS = 90
+
+
+@contextlib.contextmanager
+def timed(profile, stage):
+    """Add the wall time of a block to profile[stage], unless profile is None
+
+    Args:
+        profile (dict): Seconds spent in each stage, or None
+        stage (str): Stage name
+    """
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile[stage] = profile.get(stage, 0.0) + time.perf_counter() - start
+
+
+def segment_ids(offsets):
+    """Index of the segment each element belongs to
+
+    Args:
+        offsets (numpy.ndarray): (s + 1,) segment offsets
+
+    Returns:
+        numpy.ndarray: (offsets[-1],) array of segment indices
+    """
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def take_segments(values, offsets, selection):
+    """Gather some segments of a segmented array
+
+    Args:
+        values (numpy.ndarray): Segmented array
+        offsets (numpy.ndarray): (s + 1,) segment offsets
+        selection (numpy.ndarray): Indices of the segments to gather
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray): Gathered values and their offsets
+    """
+    starts = offsets[:-1][selection]
+    counts = np.diff(offsets)[selection]
+    new_offsets = np.zeros(len(counts) + 1, dtype=int)
+    np.cumsum(counts, out=new_offsets[1:])
+    index = np.arange(new_offsets[-1]) - np.repeat(new_offsets[:-1] - starts, counts)
+    return values[index], new_offsets
+
+
+def segment_reduce(ufunc, values, offsets, empty=np.nan):
+    """Reduce each segment of an array with ufunc, handling empty segments
+
+    Args:
+        ufunc (numpy.ufunc): Reduction ufunc (np.minimum, np.maximum, np.add)
+        values (numpy.ndarray): Segmented array
+        offsets (numpy.ndarray): (s + 1,) segment offsets
+        empty (optional): Result for empty segments. Defaults to nan.
+
+    Returns:
+        numpy.ndarray: (s,) array of the reduced values
+    """
+    result = np.full(len(offsets) - 1, empty, dtype=float)
+    nonempty = np.diff(offsets) > 0
+    if nonempty.any():
+        result[nonempty] = ufunc.reduceat(values, offsets[:-1][nonempty])
+    return result
+
+
+def segment_argmin(values, offsets):
+    """Index of the first minimum of each segment. Segments must not be empty.
+
+    Args:
+        values (numpy.ndarray): Segmented array
+        offsets (numpy.ndarray): (s + 1,) segment offsets
+
+    Returns:
+        numpy.ndarray: (s,) array of indices into values
+    """
+    starts = offsets[:-1]
+    minimum = np.minimum.reduceat(values, starts)
+    index = np.arange(len(values))
+    index[values != np.repeat(minimum, np.diff(offsets))] = len(values)
+    return np.minimum.reduceat(index, starts)
+
+
+def ring_areas(coords, offsets):
+    """Signed area of each ring (shoelace formula), positive for counter-clockwise
+    rings. Rings can be closed or not.
+
+    Args:
+        coords (numpy.ndarray): (n, 2) array of vertices
+        offsets (numpy.ndarray): (r + 1,) ring offsets
+
+    Returns:
+        numpy.ndarray: (r,) array of areas
+    """
+    following = np.arange(len(coords)) + 1
+    counts = np.diff(offsets)
+    following[offsets[1:][counts > 0] - 1] = offsets[:-1][counts > 0]
+    cross = (
+        coords[:, 0] * coords[following, 1] - coords[following, 0] * coords[:, 1]
+    ) / 2
+    return np.bincount(segment_ids(offsets), cross, minlength=len(counts))
+
+
+def _cross(origin, a, b):
+    """Cross products of (a - origin) and (b - origin), positive when b is on the
+    left of the line from origin to a
+
+    Args:
+        origin, a, b (numpy.ndarray): (n, 2) arrays of points
+
+    Returns:
+        numpy.ndarray: (n,) array of cross products
+    """
+    return (a[:, 0] - origin[:, 0]) * (b[:, 1] - origin[:, 1]) - (
+        a[:, 1] - origin[:, 1]
+    ) * (b[:, 0] - origin[:, 0])
+
+
+def convex_hulls(coords, offsets):
+    """Quickhull convex hulls of many point sets, all advanced in lockstep.
+
+    Each hull starts as the Akl-Toussaint octagon of its set: its extreme points
+    along the axes and the diagonals. Only the points outside of the octagon are
+    kept, each one attached to the edge it lies beyond. Then, every iteration splits
+    all the edges which still have points at once, at their furthest point, and
+    drops the points which are not beyond one of the two new edges.
+
+    Args:
+        coords (numpy.ndarray): (n, 2) array of points
+        offsets (numpy.ndarray): (s + 1,) point set offsets
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray): Hull vertices (counter-clockwise, without
+            closing vertex, starting from the lowest leftmost one) and their offsets
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=int)
+    sizes = np.diff(offsets)
+    hull_offsets = np.zeros(len(sizes) + 1, dtype=int)
+    (nonempty,) = np.nonzero(sizes > 0)
+    if not len(nonempty):
+        return np.empty((0, 2)), hull_offsets
+    if len(nonempty) < len(sizes):
+        hulls, nonempty_offsets = convex_hulls(
+            *take_segments(coords, offsets, nonempty)
+        )
+        hull_offsets[nonempty + 1] = np.diff(nonempty_offsets)
+        np.cumsum(hull_offsets, out=hull_offsets)
+        return hulls, hull_offsets
+
+    count = len(sizes)
+    seg = segment_ids(offsets)
+    # Coordinates relative to the first point of their set, for accuracy. Rows are
+    # gathered with take, much faster than fancy indexing on (n, 2) arrays
+    local = coords - np.repeat(coords[offsets[:-1]], sizes, axis=0)
+    x, y = local[:, 0], local[:, 1]
+
+    # Octagon vertices, counter-clockwise from the lowest leftmost point: the
+    # extreme points along the axes and the diagonals, ties being broken along the
+    # perpendicular direction so that they are hull vertices. Repeated vertices are
+    # dropped at the end
+    total, difference = x + y, x - y
+    slots = (
+        (x, np.minimum, y, 1),
+        (total, np.minimum, difference, -1),
+        (y, np.minimum, x, -1),
+        (difference, np.maximum, total, -1),
+        (x, np.maximum, y, -1),
+        (total, np.maximum, difference, 1),
+        (y, np.maximum, x, 1),
+        (difference, np.minimum, total, 1),
+    )
+    octagon = np.empty((count, 8), dtype=int)
+    for slot, (key, extreme, tie_key, tie_sign) in enumerate(slots):
+        (candidates,) = np.nonzero(
+            key == np.repeat(extreme.reduceat(key, offsets[:-1]), sizes)
+        )
+        order = np.lexsort((tie_key[candidates] * tie_sign, seg[candidates]))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = seg[candidates[order[1:]]] != seg[candidates[order[:-1]]]
+        octagon[:, slot] = candidates[order[first]]
+    edge_start = octagon.ravel()
+    edge_end = np.roll(octagon, -1, axis=1).ravel()
+    edge_seg = np.repeat(np.arange(count), 8)
+
+    # Points beyond an octagon edge, on its right. The octagon being convex, such a
+    # point lies in the wedge of the edge vertices seen from the octagon center: the
+    # wedge is found from the point angle, then the point is tested against the
+    # line of its edge only
+    corners = local.take(octagon, axis=0)
+    center = corners.mean(axis=1)
+    angles = np.arctan2(
+        corners[:, :, 1] - center[:, 1:], corners[:, :, 0] - center[:, :1]
+    )
+    base = angles[:, 0]
+    angles = np.mod(angles - base[:, None], 2 * np.pi)
+    # Vertices back at the first one close the turn
+    angles[(angles == 0) & np.maximum.accumulate(angles > 0, axis=1)] = 2 * np.pi
+    angles = np.maximum.accumulate(angles, axis=1)
+    point_angles = np.mod(
+        np.arctan2(
+            y - np.repeat(center[:, 1], sizes), x - np.repeat(center[:, 0], sizes)
+        )
+        - np.repeat(base, sizes),
+        2 * np.pi,
+    )
+    # Binary search of the last vertex angle below the point angle
+    angles = angles.ravel()
+    point_edge = seg * 8
+    for step in (4, 2, 1):
+        following = point_edge + step
+        point_edge = np.where(point_angles >= angles[following], following, point_edge)
+
+    following = local.take(edge_end, axis=0)
+    normal_x = corners[:, :, 1].ravel() - following[:, 1]
+    normal_y = following[:, 0] - corners[:, :, 0].ravel()
+    level = normal_x * corners[:, :, 0].ravel() + normal_y * corners[:, :, 1].ravel()
+    depth = x * normal_x[point_edge] + y * normal_y[point_edge] - level[point_edge]
+    (points,) = np.nonzero(depth < 0)
+    edges, depth = point_edge[points], depth[points]
+
+    while len(points):
+        # Furthest point beyond each edge, that is the most negative depth. The
+        # points are kept grouped by edge: being mostly in ring order, the stable
+        # sort only merges a few runs
+        order = np.argsort(edges, kind="stable")
+        points, edges, depth = points[order], edges[order], depth[order]
+        groups = np.flatnonzero(np.diff(edges)) + 1
+        best = segment_argmin(depth, np.concatenate(([0], groups, [len(edges)])))
+        split, furthest = edges[best], points[best]
+
+        # Each split edge is replaced by two edges, through its furthest point
+        apex = np.empty(len(edge_start), dtype=int)
+        apex[split] = furthest
+        start = local.take(edge_start[edges], axis=0)
+        end = local.take(edge_end[edges], axis=0)
+        apex_coords = local.take(apex[edges], axis=0)
+        point_coords = local.take(points, axis=0)
+        repeats = np.ones(len(edge_start), dtype=int)
+        repeats[split] = 2
+        new_edges = np.cumsum(repeats) - repeats
+        edge_start = np.repeat(edge_start, repeats)
+        edge_end = np.repeat(edge_end, repeats)
+        edge_seg = np.repeat(edge_seg, repeats)
+        edge_end[new_edges[split]] = furthest
+        edge_start[new_edges[split] + 1] = furthest
+
+        # Points beyond the first new edge stay with it, the other ones move to the
+        # second one if they are beyond it, else they are inside the hull
+        depth = _cross(start, apex_coords, point_coords)
+        after = depth >= 0
+        depth = np.where(after, _cross(apex_coords, end, point_coords), depth)
+        beyond = depth < 0
+        points = points[beyond]
+        edges = (new_edges[edges] + after)[beyond]
+        depth = depth[beyond]
+
+    # Drop the empty edges, between repeated octagon vertices, but the first one of
+    # the single point sets
+    vertices = coords.take(edge_start, axis=0)
+    empty = np.all(vertices == coords.take(edge_end, axis=0), axis=1)
+    single = np.bincount(edge_seg[~empty], minlength=count) == 0
+    empty[np.searchsorted(edge_seg, np.nonzero(single)[0])] = False
+    np.cumsum(np.bincount(edge_seg[~empty], minlength=count), out=hull_offsets[1:])
+    return vertices[~empty], hull_offsets
+
+
+def convex_hull(points):
+    """Convex hull of a point set, see convex_hulls
+
+    Args:
+        points (numpy.ndarray): (n, 2) array of points
+
+    Returns:
+        numpy.ndarray: (h, 2) array of the hull vertices, counter-clockwise and
+            without the closing vertex
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    return convex_hulls(points, [0, len(points)])[0]
+
+
+def rectangle_from_extents(u_min, u_max, v_min, v_max, angle):
+    """Build rectangle parameters from the extents along the rotated axes
+
+    Args:
+        u_min, u_max (double or numpy.ndarray): Extent along the angle direction
+        v_min, v_max (double or numpy.ndarray): Extent along the normal direction
+        angle (double or numpy.ndarray): Angle in degrees
+
+    Returns:
+        numpy.ndarray: (..., 5) array of rectangles
+    """
+    theta = np.radians(angle)
+    cos, sin = np.cos(theta), np.sin(theta)
+    u_mid, v_mid = (u_min + u_max) / 2, (v_min + v_max) / 2
+    return np.stack(
+        np.broadcast_arrays(
+            u_mid * cos - v_mid * sin,
+            u_mid * sin + v_mid * cos,
+            u_max - u_min,
+            v_max - v_min,
+            angle,
+        ),
+        axis=-1,
+    ).astype(float)
+
+
+def oriented_bounding_boxes(coords, offsets, angles):
+    """Bounding boxes of many point sets, each one oriented at its own angle
+
+    Args:
+        coords (numpy.ndarray): (n, 2) array of points
+        offsets (numpy.ndarray): (s + 1,) point set offsets
+        angles (numpy.ndarray): (s,) angles in degrees
+
+    Returns:
+        numpy.ndarray: (s, 5) array of rectangles, nan for empty point sets
+    """
+    offsets = np.asarray(offsets, dtype=int)
+    angles = np.asarray(angles, dtype=float)
+    theta = np.radians(angles)[segment_ids(offsets)]
+    cos, sin = np.cos(theta), np.sin(theta)
+    along = coords[:, 0] * cos + coords[:, 1] * sin
+    across = coords[:, 1] * cos - coords[:, 0] * sin
+    return rectangle_from_extents(
+        segment_reduce(np.minimum, along, offsets),
+        segment_reduce(np.maximum, along, offsets),
+        segment_reduce(np.minimum, across, offsets),
+        segment_reduce(np.maximum, across, offsets),
+        angles,
+    )
+
+
+def minimum_bounding_boxes(hulls, offsets):
+    """Rotating calipers search of the minimum oriented bounding boxes of many
+    convex polygons.
+
+    All the hull edges are scored at once: edge angles are monotonic on a convex
+    polygon, so the four support vertices of every edge are found with a single
+    binary search instead of a rotation of the whole hull per edge.
+
+    Args:
+        hulls (numpy.ndarray): (n, 2) array of the convex hulls vertices,
+            counter-clockwise, without closing vertex
+        offsets (numpy.ndarray): (s + 1,) hull offsets
+
+    Returns:
+        numpy.ndarray: (s, 5) array of rectangles, nan for empty hulls
+    """
+    hulls = np.asarray(hulls, dtype=float).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=int)
+    result = np.full((len(offsets) - 1, 5), np.nan)
+
+    # Drop repeated vertices
+    following = np.arange(len(hulls)) + 1
+    sizes = np.diff(offsets)
+    following[offsets[1:][sizes > 0] - 1] = offsets[:-1][sizes > 0]
+    edges = hulls[following] - hulls
+    keep = np.any(edges != 0, axis=1)
+    seg = segment_ids(offsets)
+    sizes = np.bincount(seg[~keep], minlength=len(sizes))
+    sizes = np.diff(offsets) - sizes
+
+    # Single points
+    single = (np.diff(offsets) > 0) & (sizes == 0)
+    result[single, :2] = hulls[offsets[:-1][single]]
+    result[single, 2:] = 0
+
+    hulls, edges, seg = hulls[keep], edges[keep], seg[keep]
+    offsets = np.zeros(len(sizes) + 1, dtype=int)
+    np.cumsum(sizes, out=offsets[1:])
+    valid = sizes > 0
+    if not len(hulls):
+        return result
+    starts = offsets[:-1][seg]
+    sizes = sizes[seg]
+
+    # Unwrapped edge angles, strictly increasing over a single turn within each hull,
+    # each hull being shifted by 4 pi from the previous one so that the whole array
+    # is sorted
+    directions = np.arctan2(edges[:, 1], edges[:, 0])
+    base = directions[starts]
+    angles = np.maximum.accumulate(
+        np.mod(directions - base, 2 * np.pi) + 4 * np.pi * seg
+    )
+
+    def support(query):
+        """Index of the hull vertex furthest in the given directions"""
+        normals = np.mod(query + np.pi / 2 - base, 2 * np.pi) + 4 * np.pi * seg
+        index = np.searchsorted(angles, normals, side="right") - starts
+        return starts + index % sizes
+
+    cos, sin = np.cos(directions), np.sin(directions)
+
+    def project_along(index):
+        return hulls[index, 0] * cos + hulls[index, 1] * sin
+
+    def project_across(index):
+        return hulls[index, 1] * cos - hulls[index, 0] * sin
+
+    u_max = project_along(support(directions))
+    u_min = project_along(support(directions + np.pi))
+    v_max = project_across(support(directions + np.pi / 2))
+    v_min = project_across(np.arange(len(hulls)))
+
+    best = segment_argmin(
+        (u_max - u_min) * (v_max - v_min), np.append(offsets[:-1][valid], offsets[-1])
+    )
+    result[valid] = rectangle_from_extents(
+        u_min[best], u_max[best], v_min[best], v_max[best], np.degrees(directions[best])
+    )
+    return result
+
+
+def _monotone_chain(points):
+    """Monotone chain of sorted distinct points
+
+    Args:
+        points (list): (x, y) points, sorted
+
+    Returns:
+        list: Hull vertices, counter-clockwise and without the closing vertex
+    """
+    if len(points) < 3:
+        return list(points)
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower, upper = [], []
+    for point in points:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], point) <= 0:
+            lower.pop()
+        lower.append(point)
+    for point in reversed(points):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], point) <= 0:
+            upper.pop()
+        upper.append(point)
+    return lower[:-1] + upper[:-1]
+
+
+def _extents(points, theta):
+    """Extents of points along a direction and its normal
+
+    Args:
+        points (list): (x, y) points
+        theta (float): Direction, in radians
+
+    Returns:
+        (float, float, float, float): Minimum and maximum along the direction, then
+            along its normal
+    """
+    cos, sin = math.cos(theta), math.sin(theta)
+    along = [x * cos + y * sin for x, y in points]
+    across = [y * cos - x * sin for x, y in points]
+    return min(along), max(along), min(across), max(across)
+
+
+def python_bounding_box(points, angle=None):
+    """Oriented bounding box of a single small point set, in pure Python: it avoids
+    the per call overhead of the numpy functions, which dominates for a few
+    vertices. Without an angle, the minimum bounding box is searched over the edges
+    of the monotone chain hull, which is quadratic in the hull size.
+
+    Args:
+        points (list): (x, y) points, see wkb_points
+        angle (float, optional): Angle of the box, in degrees. Defaults to None, the
+            minimum bounding box.
+
+    Returns:
+        tuple: Rectangle, nan for an empty point set
+    """
+    if not points:
+        return (math.nan,) * 5
+    if angle is not None:
+        theta = math.radians(angle)
+        extents = _extents(points, theta)
+    else:
+        hull = _monotone_chain(sorted(set(points)))
+        theta, extents, best = 0.0, _extents(hull, 0.0), math.inf
+        for (x0, y0), (x1, y1) in zip(hull, hull[1:] + hull[:1]):
+            edge = math.atan2(y1 - y0, x1 - x0)
+            edge_extents = _extents(hull, edge)
+            area = (edge_extents[1] - edge_extents[0]) * (
+                edge_extents[3] - edge_extents[2]
+            )
+            if area < best:
+                theta, extents, best = edge, edge_extents, area
+
+    u_min, u_max, v_min, v_max = extents
+    u_mid, v_mid = (u_min + u_max) / 2, (v_min + v_max) / 2
+    cos, sin = math.cos(theta), math.sin(theta)
+    return (
+        u_mid * cos - v_mid * sin,
+        u_mid * sin + v_mid * cos,
+        u_max - u_min,
+        v_max - v_min,
+        math.degrees(theta) if angle is None else float(angle),
+    )
+
+
+def python_rectangle_parameters(points):
+    """Rectangle of a single ring of 4 or 5 vertices, in pure Python, see
+    rectangle_parameters
+
+    Args:
+        points (list): (x, y) vertices of the ring
+
+    Returns:
+        tuple: Rectangle
+    """
+    (x0, y0), (x1, y1), (x2, y2), (x3, y3) = points[:4]
+    width = math.hypot(x1 - x0, y1 - y0)
+    height = math.hypot(x2 - x1, y2 - y1)
+    if width >= height:
+        angle = math.atan2(y1 - y0, x1 - x0)
+    else:
+        angle = math.atan2(x1 - x2, y2 - y1)
+    return (
+        (x0 + x1 + x2 + x3) / 4,
+        (y0 + y1 + y2 + y3) / 4,
+        width,
+        height,
+        math.degrees(angle),
+    )
+
+
+def approximate_bounding_boxes(coords, offsets, area_tolerance, directions=None):
+    """Oriented bounding boxes of many point sets, whose area is within a relative
+    tolerance of the minimum bounding box area.
+
+    The exact minimum bounding box of the extreme points of a set along a few
+    directions gives an angle, and a lower bound of the minimum area since these
+    points are a subset of the set. The box of the whole set at that angle is kept
+    if its area is within the tolerance of this bound. Else, the search is repeated
+    with 4 times as many directions, up to APPROXIMATE_MAX_DIRECTIONS, and then
+    falls back to the exact search. Sets of up to APPROXIMATE_MIN_VERTICES points
+    always get the exact search, which is cheap for them.
+
+    Args:
+        coords (numpy.ndarray): (n, 2) array of points
+        offsets (numpy.ndarray): (s + 1,) point set offsets
+        area_tolerance (float): Relative area tolerance, for instance 0.01 for 1%
+        directions (int, optional): Number of directions first sampled. Defaults to
+            None, for a number after which most sets are within the tolerance: the
+            extreme points along m directions lose about (pi / m)^2 of the area.
+
+    Returns:
+        numpy.ndarray: (s, 5) array of rectangles, nan for empty point sets
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=int)
+    sizes = np.diff(offsets)
+    result = np.full((len(sizes), 5), np.nan)
+    (pending,) = np.nonzero(sizes > APPROXIMATE_MIN_VERTICES)
+    if directions is None:
+        directions = max(int(np.ceil(2 * np.pi / np.sqrt(area_tolerance))), 8)
+    while len(pending) and directions <= APPROXIMATE_MAX_DIRECTIONS:
+        theta = np.linspace(0, 2 * np.pi, directions, endpoint=False)
+        axes = np.stack((np.cos(theta), np.sin(theta)), axis=1)
+
+        # Batches of sets with a bounded number of projections
+        batches = np.cumsum(sizes[pending]) * directions // APPROXIMATE_BATCH
+        within = np.zeros(len(pending), dtype=bool)
+        for batch in np.unique(batches):
+            (selection,) = np.nonzero(batches == batch)
+            points, point_offsets = take_segments(coords, offsets, pending[selection])
+            projections = axes @ points.T
+            maxima = np.maximum.reduceat(projections, point_offsets[:-1], axis=1)
+            seg = segment_ids(point_offsets)
+            extreme = np.any(projections == maxima[:, seg], axis=0)
+            extreme_offsets = np.zeros(len(selection) + 1, dtype=int)
+            np.cumsum(
+                np.bincount(seg[extreme], minlength=len(selection)),
+                out=extreme_offsets[1:],
+            )
+            lower = minimum_bounding_boxes(
+                *convex_hulls(points[extreme], extreme_offsets)
+            )
+            boxes = oriented_bounding_boxes(points, point_offsets, lower[:, 4])
+            accepted = boxes[:, 2] * boxes[:, 3] <= (1 + area_tolerance) * (
+                lower[:, 2] * lower[:, 3]
+            )
+            result[pending[selection[accepted]]] = boxes[accepted]
+            within[selection[accepted]] = True
+        pending = pending[~within]
+        directions *= 4
+
+    (exact,) = np.nonzero((sizes > 0) & np.isnan(result[:, 0]))
+    result[exact] = minimum_bounding_boxes(
+        *convex_hulls(*take_segments(coords, offsets, exact))
+    )
+    return result
+
+
+def search_bounding_boxes(coords, offsets, area_tolerance=0.0, profile=None):
+    """Minimum bounding boxes of many point sets, exact or approximate
+
+    Args:
+        coords (numpy.ndarray): (n, 2) array of points
+        offsets (numpy.ndarray): (s + 1,) point set offsets
+        area_tolerance (float, optional): Relative area tolerance. If 0, the exact
+            minimum bounding boxes are computed. Else, see approximate_bounding_boxes.
+            Defaults to 0.
+        profile (dict, optional): Accumulates the seconds spent in the convex_hull
+            and angle_search stages. Defaults to None.
+
+    Returns:
+        numpy.ndarray: (s, 5) array of rectangles, nan for empty point sets
+    """
+    if area_tolerance > 0:
+        with timed(profile, "angle_search"):
+            return approximate_bounding_boxes(coords, offsets, area_tolerance)
+    with timed(profile, "convex_hull"):
+        hulls = convex_hulls(coords, offsets)
+    with timed(profile, "angle_search"):
+        return minimum_bounding_boxes(*hulls)
+
+
+def scale_geometry(rectangles, polygons, area_ratios):
+    """Scale polygons made of rectangles so that their new area is
+    area_ratio * old_area. The scaling is centered on each polygon centroid, which is
+    computed in closed form from the rectangles.
+
+    Args:
+        rectangles (numpy.ndarray): (k, 5) array of rectangles. The first one of each
+            polygon is the outer ring, the other ones are the inner rings
+        polygons (numpy.ndarray): (k,) index of the polygon of each rectangle
+        area_ratios (numpy.ndarray): (p,) Ratio of each polygon
+
+    Returns:
+        numpy.ndarray: Scaled rectangles. Note that the input array is modified
+            in-place
+    """
+    areas = rectangles[:, 2] * rectangles[:, 3]
+    first = np.ones(len(polygons), dtype=bool)
+    first[1:] = polygons[1:] != polygons[:-1]
+    areas[~first] *= -1
+
+    count = len(area_ratios)
+    total = np.bincount(polygons, areas, minlength=count)
+    centroids = np.zeros((count, 2))
+    centroids[polygons[first]] = rectangles[first, :2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for axis in range(2):
+            weighted = np.bincount(
+                polygons, areas * rectangles[:, axis], minlength=count
+            )
+            centroids[:, axis] = np.where(
+                total > 0, weighted / total, centroids[:, axis]
+            )
+
+    factors = np.sqrt(area_ratios)[polygons, None]
+    centroids = centroids[polygons]
+    rectangles[:, :2] = centroids + factors * (rectangles[:, :2] - centroids)
+    rectangles[:, 2:4] *= factors
+    return rectangles
+
+
+def exterior_boxes(
+    coords,
+    ring_offsets,
+    polygon_offsets,
+    angles=None,
+    exteriors=None,
+    profile=None,
+    area_tolerance=0.0,
+):
+    """Bounding boxes of the outer rings of a batch of polygons
+
+    Args:
+        coords (numpy.ndarray): (n, 2) array of all the polygons vertices
+        ring_offsets (numpy.ndarray): (r + 1,) ring offsets into coords
+        polygon_offsets (numpy.ndarray): (p + 1,) polygon offsets into rings
+        angles (numpy.ndarray, optional): (p,) angles in degrees. Polygons with a nan
+            angle get their minimum bounding box computed. Defaults to None.
+        exteriors (numpy.ndarray, optional): (p, 5) array of already known boxes (for
+            instance from a cache). Only its nan rows are computed. Defaults to None.
+        profile (dict, optional): Accumulates the seconds spent in the convex_hull
+            and angle_search stages. Defaults to None.
+        area_tolerance (float, optional): Relative area tolerance of the minimum
+            bounding boxes, see search_bounding_boxes. Defaults to 0.
+
+    Returns:
+        numpy.ndarray: (p, 5) array of rectangles, nan for empty polygons
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    ring_offsets = np.asarray(ring_offsets, dtype=int)
+    polygon_offsets = np.asarray(polygon_offsets, dtype=int)
+    polygon_count = len(polygon_offsets) - 1
+    if angles is None:
+        angles = np.full(polygon_count, np.nan)
+    angles = np.asarray(angles, dtype=float)
+    if exteriors is None:
+        exteriors = np.full((polygon_count, 5), np.nan)
+    exteriors = np.array(exteriors, dtype=float).reshape(-1, 5)
+
+    # If an angle is define use it. Else, compute miminum bounding box
+    (polygons,) = np.nonzero((np.diff(polygon_offsets) > 0) & np.isnan(exteriors[:, 0]))
+    rings = polygon_offsets[:-1][polygons]
+    fixed = ~np.isnan(angles[polygons])
+    exteriors[polygons[~fixed]] = search_bounding_boxes(
+        *take_segments(coords, ring_offsets, rings[~fixed]), area_tolerance, profile
+    )
+    with timed(profile, "angle_search"):
+        exteriors[polygons[fixed]] = oriented_bounding_boxes(
+            *take_segments(coords, ring_offsets, rings[fixed]), angles[polygons][fixed]
+        )
+    return exteriors
+
+
+def rectanglify_polygons(
+    coords,
+    ring_offsets,
+    polygon_offsets,
+    constant_area=True,
+    keep_rings=True,
+    rings_share_axes=True,
+    angles=None,
+    exteriors=None,
+    profile=None,
+    area_tolerance=0.0,
+):
+    """Rectanglifies a batch of polygons in a single vectorized pass.
+
+    Args:
+        coords (numpy.ndarray): (n, 2) array of all the polygons vertices
+        ring_offsets (numpy.ndarray): (r + 1,) ring offsets into coords
+        polygon_offsets (numpy.ndarray): (p + 1,) polygon offsets into rings
+        constant_area (bool, optional): If True, the rectanglified polygons are scaled
+            to be the same area as the old ones. Defaults to True.
+        keep_rings (bool, optional): If True, rectanglify will try to keep the rings.
+            Rings are always scaled to keep a constant area. Defaults to True.
+        rings_share_axes (bool, optional): If True, the rings orientation will match
+            the outer polygon orientation. Else, Rectanglify computes a minimum
+            oriented bounding box. Defaults to True.
+        angles (numpy.ndarray, optional): (p,) angles in degrees. Polygons with a nan
+            angle get their minimum bounding box computed. Defaults to None.
+        exteriors (numpy.ndarray, optional): (p, 5) array of already known outer ring
+            bounding boxes, see exterior_boxes. Defaults to None.
+        profile (dict, optional): Accumulates the seconds spent in the convex_hull,
+            angle_search, rings and scale stages. Defaults to None.
+        area_tolerance (float, optional): Relative area tolerance of the minimum
+            bounding boxes, see search_bounding_boxes. Defaults to 0.
+
+    Returns:
+        numpy.ndarray: (r, 5) array of rectangles, one per input ring. Rings which
+            are not kept (and empty ones) are nan.
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    ring_offsets = np.asarray(ring_offsets, dtype=int)
+    polygon_offsets = np.asarray(polygon_offsets, dtype=int)
+    polygon_count = len(polygon_offsets) - 1
+
+    rectangles = np.full((len(ring_offsets) - 1, 5), np.nan)
+    ring_polygons = segment_ids(polygon_offsets)
+    (polygons,) = np.nonzero(np.diff(polygon_offsets) > 0)
+    exteriors_rings = polygon_offsets[:-1][polygons]
+    interior = np.ones(len(ring_polygons), dtype=bool)
+    interior[exteriors_rings] = False
+
+    exteriors = exterior_boxes(
+        coords,
+        ring_offsets,
+        polygon_offsets,
+        angles,
+        exteriors,
+        profile,
+        area_tolerance,
+    )
+    rectangles[exteriors_rings] = exteriors[polygons]
+    angles = exteriors[:, 4]
+
+    with timed(profile, "rings"):
+        areas = np.abs(ring_areas(coords, ring_offsets))
+        rectanglify_rings(
+            coords,
+            ring_offsets,
+            rectangles,
+            ring_polygons,
+            interior,
+            areas,
+            angles,
+            keep_rings,
+            rings_share_axes,
+            area_tolerance,
+        )
+
+    # Scale geometries
+    if constant_area:
+        with timed(profile, "scale"):
+            scale_polygons(rectangles, ring_polygons, interior, areas, polygon_count)
+    return rectangles
+
+
+def rectanglify_rings(
+    coords,
+    ring_offsets,
+    rectangles,
+    ring_polygons,
+    interior,
+    areas,
+    angles,
+    keep_rings=True,
+    rings_share_axes=True,
+    area_tolerance=0.0,
+):
+    """Rectanglify the inner rings of a batch of polygons, always keeping their area
+
+    Args:
+        coords (numpy.ndarray): (n, 2) array of all the polygons vertices
+        ring_offsets (numpy.ndarray): (r + 1,) ring offsets into coords
+        rectangles (numpy.ndarray): (r, 5) array of rectangles, modified in-place
+        ring_polygons (numpy.ndarray): (r,) polygon of each ring
+        interior (numpy.ndarray): (r,) whether each ring is an inner ring
+        areas (numpy.ndarray): (r,) area of each ring
+        angles (numpy.ndarray): (p,) angle of each polygon outer rectangle
+        keep_rings, rings_share_axes, area_tolerance: See rectanglify_polygons
+    """
+    (rings,) = np.nonzero(interior)
+    if keep_rings and len(rings):
+        ring_coords, offsets = take_segments(coords, ring_offsets, rings)
+        if rings_share_axes:
+            rectangles[rings] = oriented_bounding_boxes(
+                ring_coords, offsets, angles[ring_polygons[rings]]
+            )
+        else:
+            rectangles[rings] = search_bounding_boxes(
+                ring_coords, offsets, area_tolerance
+            )
+        ring_rectangles = rectangles[rings]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            factors = np.sqrt(
+                areas[rings] / (ring_rectangles[:, 2] * ring_rectangles[:, 3])
+            )
+        factors[~np.isfinite(factors)] = 1
+        ring_rectangles[:, 2:4] *= factors[:, None]
+        rectangles[rings] = ring_rectangles
+
+
+def scale_polygons(rectangles, ring_polygons, interior, areas, polygon_count):
+    """Scale the rectangles of a batch of polygons to keep the polygons area
+
+    Args:
+        rectangles (numpy.ndarray): (r, 5) array of rectangles, modified in-place.
+            Rings which are not kept are nan.
+        ring_polygons (numpy.ndarray): (r,) polygon of each ring
+        interior (numpy.ndarray): (r,) whether each ring is an inner ring
+        areas (numpy.ndarray): (r,) area of each ring
+        polygon_count (int): Number of polygons
+    """
+    signed = np.where(interior, -areas, areas)
+    old_areas = np.bincount(ring_polygons, signed, minlength=polygon_count)
+
+    (kept,) = np.nonzero(~np.isnan(rectangles[:, 0]))
+    kept_polygons = ring_polygons[kept]
+    new_areas = rectangles[kept, 2] * rectangles[kept, 3]
+    new_areas = np.bincount(
+        kept_polygons,
+        np.where(interior[kept], -new_areas, new_areas),
+        minlength=polygon_count,
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios = np.where(new_areas > 0, old_areas / new_areas, 1)
+    rectangles[kept] = scale_geometry(rectangles[kept], kept_polygons, ratios)
+
+
+def rectangular_rings(coords, ring_offsets, tolerance=RECTANGLE_TOLERANCE):
+    """Detect the rings which are already rectangles: closed rings of 4 distinct
+    vertices whose opposite sides are equal and whose angles are right, up to a
+    tolerance relative to the ring size.
+
+    Args:
+        coords (numpy.ndarray): (n, 2) array of vertices
+        ring_offsets (numpy.ndarray): (r + 1,) ring offsets into coords
+        tolerance (float, optional): Relative tolerance. Defaults to
+            RECTANGLE_TOLERANCE.
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray): (r,) boolean mask of the rectangular rings
+            and (r,) angle of their first side modulo 90 degrees (nan for the other
+            rings)
+    """
+    counts = np.diff(ring_offsets)
+    rectangular = np.zeros(len(counts), dtype=bool)
+    angles = np.full(len(counts), np.nan)
+    (candidates,) = np.nonzero(counts == 5)
+    if not len(candidates):
+        return rectangular, angles
+
+    points = coords[ring_offsets[candidates][:, None] + np.arange(5)]
+    edges = np.diff(points, axis=1)
+    lengths = np.hypot(edges[..., 0], edges[..., 1])
+    size = lengths.max(axis=1)
+
+    def norm(vectors):
+        return np.hypot(vectors[:, 0], vectors[:, 1])
+
+    rectangular[candidates] = (
+        (lengths.min(axis=1) > tolerance * size)
+        & (norm(points[:, 4] - points[:, 0]) <= tolerance * size)
+        & (norm(edges[:, 0] + edges[:, 2]) <= tolerance * size)
+        & (norm(edges[:, 1] + edges[:, 3]) <= tolerance * size)
+        & (np.abs(np.sum(edges[:, 0] * edges[:, 1], axis=1)) <= tolerance * size ** 2)
+    )
+    angles[candidates] = np.degrees(np.arctan2(edges[:, 0, 1], edges[:, 0, 0])) % 90
+    angles[~rectangular] = np.nan
+    return rectangular, angles
+
+
+def orientation_histograms(coords, ring_offsets, offsets, bins=ORIENTATION_BINS):
+    """Edge orientation histograms of groups of rings. Directions are taken modulo
+    90 degrees, so each edge is a unit vector at 4 times its direction, weighted by
+    its length: each bin sums the vectors of its edges, as a complex number whose
+    modulus is the aligned edge length and whose argument is their mean direction.
+    Rings must be closed.
+
+    Args:
+        coords (numpy.ndarray): (n, 2) array of vertices
+        ring_offsets (numpy.ndarray): (r + 1,) ring offsets into coords
+        offsets (numpy.ndarray): (s + 1,) group offsets into rings, for instance the
+            polygon offsets
+        bins (int, optional): Number of bins. Defaults to ORIENTATION_BINS.
+
+    Returns:
+        numpy.ndarray: (s, bins) complex array
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    ring_offsets = np.asarray(ring_offsets, dtype=int)
+    offsets = np.asarray(offsets, dtype=int)
+    count = len(offsets) - 1
+
+    # Edges join consecutive vertices of the same ring
+    rings = segment_ids(ring_offsets)
+    (ends,) = np.nonzero(rings[1:] == rings[:-1])
+    ends += 1
+    groups = segment_ids(offsets)[rings[ends]]
+    edges = coords[ends] - coords[ends - 1]
+    lengths = np.hypot(edges[:, 0], edges[:, 1])
+    turns = 4 * np.arctan2(edges[:, 1], edges[:, 0])
+    index = groups * bins + np.mod(
+        np.floor(turns * bins / (2 * np.pi)).astype(int), bins
+    )
+    histograms = np.zeros(count * bins, dtype=complex)
+    histograms.real = np.bincount(index, lengths * np.cos(turns), count * bins)
+    histograms.imag = np.bincount(index, lengths * np.sin(turns), count * bins)
+    return histograms.reshape(count, bins)
+
+
+def dominant_angles(histograms):
+    """Dominant direction of orientation histograms: the mean direction of the
+    peak bin and its two (circular) neighbours
+
+    Args:
+        histograms (numpy.ndarray): (s, bins) complex array, see
+            orientation_histograms. Histograms can be summed.
+
+    Returns:
+        numpy.ndarray: (s,) angles in degrees, in [0, 90), nan for empty histograms
+    """
+    histograms = np.asarray(histograms, dtype=complex)
+    count, bins = histograms.shape
+    peak = np.argmax(np.abs(histograms), axis=1)
+    window = (peak[:, None] + np.arange(-1, 2)) % bins
+    mean = histograms[np.arange(count)[:, None], window].sum(axis=1)
+    angles = np.mod(np.degrees(np.angle(mean)) / 4, 90)
+    angles[np.abs(mean) == 0] = np.nan
+    return angles
+
+
+def unchanged_geometries(
+    coords,
+    ring_offsets,
+    polygon_offsets,
+    part_offsets,
+    keep_rings=True,
+    rings_share_axes=True,
+    tolerance=RECTANGLE_TOLERANCE,
+):
+    """Detect the geometries which rectanglify would leave unchanged, whatever the
+    constant area setting: all their rings are rectangles, and their inner rings are
+    kept, aligned with the outer ring if they must share its axes. Empty geometries
+    are unchanged too.
+
+    Args:
+        coords (numpy.ndarray): (n, 2) array of all the polygons vertices
+        ring_offsets (numpy.ndarray): (r + 1,) ring offsets into coords
+        polygon_offsets (numpy.ndarray): (p + 1,) polygon offsets into rings
+        part_offsets (numpy.ndarray): (g + 1,) geometry offsets into polygons
+        keep_rings, rings_share_axes: See rectanglify_polygons
+        tolerance (float, optional): Relative tolerance. Defaults to
+            RECTANGLE_TOLERANCE.
+
+    Returns:
+        numpy.ndarray: (g,) boolean mask of the unchanged geometries
+    """
+    rectangular, angles = rectangular_rings(coords, ring_offsets, tolerance)
+    ring_polygons = segment_ids(polygon_offsets)
+    interior = np.ones(len(ring_polygons), dtype=bool)
+    interior[polygon_offsets[:-1][np.diff(polygon_offsets) > 0]] = False
+    if not keep_rings:
+        rectangular &= ~interior
+    elif rings_share_axes:
+        (rings,) = np.nonzero(interior)
+        exteriors = polygon_offsets[:-1][ring_polygons[rings]]
+        difference = np.abs(angles[rings] - angles[exteriors])
+        rectangular[rings] &= np.minimum(difference, 90 - difference) <= np.degrees(
+            tolerance
+        )
+
+    polygons = segment_reduce(np.minimum, rectangular, polygon_offsets, empty=1)
+    return segment_reduce(np.minimum, polygons, part_offsets, empty=1) > 0
+
+
+def take_geometries(coords, ring_offsets, polygon_offsets, part_offsets, selection):
+    """Gather some geometries of a batch
+
+    Args:
+        coords (numpy.ndarray): (n, 2) array of all the polygons vertices
+        ring_offsets (numpy.ndarray): (r + 1,) ring offsets into coords
+        polygon_offsets (numpy.ndarray): (p + 1,) polygon offsets into rings
+        part_offsets (numpy.ndarray): (g + 1,) geometry offsets into polygons
+        selection (numpy.ndarray): Indices of the geometries to gather
+
+    Returns:
+        tuple: coords, ring_offsets, polygon_offsets and part_offsets of the
+            gathered geometries
+    """
+    polygons, part_offsets = take_segments(
+        np.arange(len(polygon_offsets) - 1), part_offsets, selection
+    )
+    rings, polygon_offsets = take_segments(
+        np.arange(len(ring_offsets) - 1), polygon_offsets, polygons
+    )
+    coords, ring_offsets = take_segments(coords, ring_offsets, rings)
+    return coords, ring_offsets, polygon_offsets, part_offsets
+
+
+def rectangles_coordinates(rectangles):
+    """Compute the closed rings of rectangles, counter-clockwise
+
+    Args:
+        rectangles (numpy.ndarray): (k, 5) array of rectangles
+
+    Returns:
+        numpy.ndarray: (k, 5, 2) array of the rectangles vertices
+    """
+    rectangles = np.asarray(rectangles, dtype=float).reshape(-1, 5)
+    theta = np.radians(rectangles[:, 4, None])
+    cos, sin = np.cos(theta), np.sin(theta)
+    corners = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1], [-1, -1]]) / 2
+    u = corners[:, 0] * rectangles[:, 2, None]
+    v = corners[:, 1] * rectangles[:, 3, None]
+    return np.stack(
+        (
+            rectangles[:, 0, None] + u * cos - v * sin,
+            rectangles[:, 1, None] + u * sin + v * cos,
+        ),
+        axis=-1,
+    )
+
+
+def rectangle_parameters(coords, ring_offsets, polygon_offsets):
+    """Recover the rectangles of rings written by write_wkb, each one being a closed
+    ring of 5 vertices. Interior rings, written clockwise, are read backwards from
+    their first vertex.
+
+    Args:
+        coords (numpy.ndarray): (n, 2) array of vertices
+        ring_offsets (numpy.ndarray): (r + 1,) ring offsets into coords
+        polygon_offsets (numpy.ndarray): (p + 1,) polygon offsets into rings
+
+    Returns:
+        numpy.ndarray: (r, 5) array of rectangles
+    """
+    points = coords[np.asarray(ring_offsets[:-1])[:, None] + np.arange(4)]
+    interior = np.ones(len(points), dtype=bool)
+    interior[polygon_offsets[:-1][np.diff(polygon_offsets) > 0]] = False
+    points[interior] = points[interior][:, [0, 3, 2, 1]]
+    edges = points[:, 1:3] - points[:, 0:2]
+    widths = np.hypot(edges[:, 0, 0], edges[:, 0, 1])
+    heights = np.hypot(edges[:, 1, 0], edges[:, 1, 1])
+
+    # The angle of the longest side is the most accurate, and defined for flat
+    # rectangles
+    angles = np.where(
+        widths >= heights,
+        np.arctan2(edges[:, 0, 1], edges[:, 0, 0]),
+        np.arctan2(-edges[:, 1, 0], edges[:, 1, 1]),
+    )
+    return np.column_stack((points.mean(axis=1), widths, heights, np.degrees(angles)))
+
+
+def _read_polygons(blob, offset, rings, polygons):
+    """Walk a Polygon or MultiPolygon in a WKB buffer, recording where its rings are.
+    Coordinates are not read.
+
+    Args:
+        blob (bytes): WKB buffer
+        offset (int): Offset of the geometry in the buffer
+        rings (list): Output list, (byte offset of the first vertex, vertex count,
+            dimensions, big endian) is appended for each ring
+        polygons (list): Output list, the ring count of each polygon is appended
+
+    Returns:
+        (int, bool): Offset after the geometry, and whether it is a multipolygon
+    """
+    big_endian = blob[offset] == 0
+    order = ">" if big_endian else "<"
+    (wkb_type,) = struct.unpack_from(order + "I", blob, offset + 1)
+    offset += 5
+
+    # Extended WKB flags (Z, M, SRID)
+    dimensions = 2 + bool(wkb_type & 0x80000000) + bool(wkb_type & 0x40000000)
+    if wkb_type & 0x20000000:
+        offset += 4
+    wkb_type &= 0x0FFFFFFF
+
+    # ISO WKB Z, M and ZM types
+    dimensions += (wkb_type // 1000 + 1) // 2
+    wkb_type %= 1000
+
+    (count,) = struct.unpack_from(order + "I", blob, offset)
+    offset += 4
+    if wkb_type == WKB_MULTIPOLYGON:
+        for _ in range(count):
+            offset, _ = _read_polygons(blob, offset, rings, polygons)
+        return offset, True
+    if wkb_type != WKB_POLYGON:
+        raise ValueError(f"Unsupported WKB geometry type: {wkb_type}")
+
+    unpack = struct.Struct(order + "I").unpack_from
+    for _ in range(count):
+        (size,) = unpack(blob, offset)
+        rings.append((offset + 4, size, dimensions, big_endian))
+        offset += 4 + 8 * size * dimensions
+    if count:
+        polygons.append(count)
+    return offset, False
+
+
+def wkb_points(blob):
+    """Vertices of a Polygon or MultiPolygon WKB blob, read in pure Python for a
+    single geometry, see read_wkb. Z and M values are dropped.
+
+    Args:
+        blob (bytes): WKB blob. None or empty blobs are empty geometries
+
+    Returns:
+        list: (x, y) points
+    """
+    if not blob:
+        return []
+    blob = bytes(blob)
+    rings = []
+    _read_polygons(blob, 0, rings, [])
+    points = []
+    for start, size, dimensions, big_endian in rings:
+        vertex = struct.Struct(
+            (">" if big_endian else "<") + "2d" + "8x" * (dimensions - 2)
+        )
+        points.extend(vertex.iter_unpack(blob[start : start + vertex.size * size]))
+    return points
+
+
+def read_wkb(blobs):
+    """Read Polygon and MultiPolygon WKB blobs into the struct-of-arrays
+    representation. Z and M values are dropped.
+
+    The blobs are joined into one buffer, whose headers only are walked in Python:
+    the x and y of every vertex are then gathered at once.
+
+    Args:
+        blobs (list): WKB blobs (bytes). None or empty blobs are empty geometries
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray):
+            coords, ring_offsets, polygon_offsets, part_offsets and whether each
+            geometry is a multipolygon
+    """
+    blobs = [bytes(blob) if blob else b"" for blob in blobs]
+    data = b"".join(blobs)
+    rings, polygons, part_offsets, multi = [], [], [0], []
+    offset = 0
+    for blob in blobs:
+        is_multi = False
+        if blob:
+            _, is_multi = _read_polygons(data, offset, rings, polygons)
+        offset += len(blob)
+        part_offsets.append(len(polygons))
+        multi.append(is_multi)
+
+    starts, sizes, dimensions, big_endian = np.array(rings, dtype=int).reshape(-1, 4).T
+    ring_offsets = np.zeros(len(rings) + 1, dtype=int)
+    np.cumsum(sizes, out=ring_offsets[1:])
+    polygon_offsets = np.zeros(len(polygons) + 1, dtype=int)
+    np.cumsum(polygons, out=polygon_offsets[1:])
+
+    # Byte offset of each vertex, its x and y being read through a view of the
+    # buffer holding a (possibly unaligned) float at every byte
+    ring = segment_ids(ring_offsets)
+    vertices = starts[ring] + 8 * dimensions[ring] * (
+        np.arange(ring_offsets[-1]) - ring_offsets[:-1][ring]
+    )
+    coords = np.empty((len(vertices), 2))
+    for big in np.unique(big_endian):
+        floats = np.ndarray(
+            (max(len(data) - 7, 0),),
+            dtype=">f8" if big else "<f8",
+            buffer=data,
+            strides=(1,),
+        )
+        selection = big_endian[ring] == big
+        coords[selection] = floats[vertices[selection, None] + [0, 8]]
+    return (
+        coords,
+        ring_offsets,
+        polygon_offsets,
+        np.array(part_offsets),
+        np.array(multi, dtype=bool),
+    )
+
+
+# Little endian WKB records: geometry header, and rectangle ring
+WKB_HEADER = np.dtype([("order", "u1"), ("type", "<u4"), ("count", "<u4")])
+WKB_RECTANGLE = np.dtype([("size", "<u4"), ("coords", "<f8", (5, 2))])
+
+
+def _scatter_records(buffer, starts, records):
+    """Copy packed records into a byte buffer
+
+    Args:
+        buffer (numpy.ndarray): Output uint8 buffer
+        starts (numpy.ndarray): (k,) byte offsets of the records
+        records (numpy.ndarray): (k,) structured array of records
+    """
+    size = records.dtype.itemsize
+    buffer[starts[:, None] + np.arange(size)] = records.view(np.uint8).reshape(-1, size)
+
+
+def write_wkb(rectangles, polygon_offsets, part_offsets, multi):
+    """Write rectangles as Polygon or MultiPolygon WKB blobs. Nan rectangles are
+    skipped. The blobs of all geometries are serialized at once into one buffer.
+
+    Args:
+        rectangles (numpy.ndarray): (r, 5) array of rectangles, one per ring
+        polygon_offsets (numpy.ndarray): (p + 1,) polygon offsets into rectangles
+        part_offsets (numpy.ndarray): (g + 1,) geometry offsets into polygons
+        multi (numpy.ndarray): (g,) whether each geometry is a multipolygon
+
+    Returns:
+        list: WKB blobs (bytes), None for geometries without any polygon
+    """
+    rectangles = np.asarray(rectangles, dtype=float).reshape(-1, 5)
+    multi = np.asarray(multi, dtype=bool)
+    valid = ~np.isnan(rectangles[:, 0])
+    ring_polygons = segment_ids(polygon_offsets)[valid]
+    ring_counts = np.bincount(ring_polygons, minlength=len(polygon_offsets) - 1)
+    polygon_geometries = segment_ids(part_offsets)
+    polygon_counts = np.diff(part_offsets)
+
+    # Byte layout: optional multipolygon header, then each polygon header followed
+    # by its rings
+    polygon_sizes = WKB_HEADER.itemsize + WKB_RECTANGLE.itemsize * ring_counts
+    geometry_sizes = WKB_HEADER.itemsize * multi + np.bincount(
+        polygon_geometries, polygon_sizes, minlength=len(multi)
+    ).astype(int)
+    geometry_starts = np.zeros(len(multi) + 1, dtype=int)
+    np.cumsum(geometry_sizes, out=geometry_starts[1:])
+    polygon_starts = (
+        np.cumsum(polygon_sizes)
+        - polygon_sizes
+        + np.cumsum(WKB_HEADER.itemsize * multi)[polygon_geometries]
+    )
+    ring_rank = np.arange(len(ring_polygons)) - np.repeat(
+        np.cumsum(ring_counts) - ring_counts, ring_counts
+    )
+    ring_starts = (
+        polygon_starts[ring_polygons]
+        + WKB_HEADER.itemsize
+        + WKB_RECTANGLE.itemsize * ring_rank
+    )
+
+    buffer = np.zeros(geometry_starts[-1], dtype=np.uint8)
+    headers = np.zeros(multi.sum(), dtype=WKB_HEADER)
+    headers["order"], headers["type"] = 1, WKB_MULTIPOLYGON
+    headers["count"] = polygon_counts[multi]
+    _scatter_records(buffer, geometry_starts[:-1][multi], headers)
+    headers = np.zeros(len(polygon_sizes), dtype=WKB_HEADER)
+    headers["order"], headers["type"], headers["count"] = 1, WKB_POLYGON, ring_counts
+    _scatter_records(buffer, polygon_starts, headers)
+
+    # Outer rings counter-clockwise, interior rings clockwise
+    coordinates = rectangles_coordinates(rectangles[valid])
+    interior = ring_rank > 0
+    coordinates[interior] = coordinates[interior, ::-1]
+    rings = np.zeros(len(coordinates), dtype=WKB_RECTANGLE)
+    rings["size"], rings["coords"] = 5, coordinates
+    _scatter_records(buffer, ring_starts, rings)
+
+    data = buffer.tobytes()
+    return [
+        data[start:end] if count else None
+        for start, end, count in zip(
+            geometry_starts[:-1].tolist(),
+            geometry_starts[1:].tolist(),
+            polygon_counts.tolist(),
+        )
+    ]
+
+
+def rectangle_wkb(rectangle):
+    """Write a single rectangle as a Polygon WKB blob, in pure Python, see write_wkb
+
+    Args:
+        rectangle (tuple): Rectangle
+
+    Returns:
+        bytes: WKB blob, None for a nan rectangle
+    """
+    cx, cy, width, height, angle = map(float, rectangle)
+    if math.isnan(cx):
+        return None
+    theta = math.radians(angle)
+    cos, sin = math.cos(theta), math.sin(theta)
+    coords = []
+    for u, v in ((-1, -1), (1, -1), (1, 1), (-1, 1), (-1, -1)):
+        u, v = u * width / 2, v * height / 2
+        coords += (cx + u * cos - v * sin, cy + u * sin + v * cos)
+    return struct.pack("<BIII10d", 1, WKB_POLYGON, 1, 5, *coords)
+
+
+def polygon_values(values, part_offsets, width=None):
+    """Expand per geometry values to per polygon values
+
+    Args:
+        values (list): One value per geometry: None (nan), a scalar or row shared by
+            all its parts, or a sequence with one value per part
+        part_offsets (numpy.ndarray): (g + 1,) geometry offsets into polygons
+        width (int, optional): Length of the value rows, None for scalar values.
+            Defaults to None.
+
+    Returns:
+        numpy.ndarray: (p,) or (p, width) array of values
+    """
+    shape = (part_offsets[-1],) if width is None else (part_offsets[-1], width)
+    result = np.full(shape, np.nan)
+    for i, value in enumerate(values):
+        if value is not None:
+            result[part_offsets[i] : part_offsets[i + 1]] = value
+    return result
+
+
+def rectanglify_wkb(
+    blobs,
+    constant_area=True,
+    keep_rings=True,
+    rings_share_axes=True,
+    angles=None,
+    boxes=None,
+    return_boxes=False,
+    profile=None,
+    skip_unchanged=False,
+    tolerance=RECTANGLE_TOLERANCE,
+    area_tolerance=0.0,
+):
+    """Rectanglifies Polygon and MultiPolygon WKB blobs. Each part of multipolygons is
+    rectanglified separately.
+
+    Args:
+        blobs (list): Input WKB blobs (bytes)
+        constant_area, keep_rings, rings_share_axes: See rectanglify_polygons
+        angles (list, optional): Angle of each geometry, or None to compute a
+            minimal bounding box. Defaults to None.
+        boxes (list, optional): Already known outer ring bounding boxes of each
+            geometry, as (parts, 5) arrays, or None to compute them. Defaults to None.
+        return_boxes (bool, optional): If True, also return the outer ring bounding
+            boxes of each geometry. Defaults to False.
+        profile (dict, optional): Accumulates the seconds spent in each stage
+            (read_wkb, convex_hull, angle_search, rings, scale, write_wkb), the
+            number of vertices read (vertices) and the number of vertices of each
+            geometry (feature_vertices, a list). Defaults to None.
+        skip_unchanged (bool, optional): If True, the geometries which are already
+            rectangles are neither computed nor written, see unchanged_geometries.
+            Defaults to False.
+        tolerance (float, optional): Relative tolerance of the rectangles
+            detection. Defaults to RECTANGLE_TOLERANCE.
+        area_tolerance (float, optional): Relative area tolerance of the minimum
+            bounding boxes, see search_bounding_boxes. Defaults to 0.
+
+    Returns:
+        list: Output WKB blobs, None for empty (and skipped) geometries. If
+            return_boxes is True, a (blobs, boxes) tuple, boxes being a list of
+            (parts, 5) arrays (None for skipped geometries and geometries with a
+            fixed angle).
+    """
+    with timed(profile, "read_wkb"):
+        coords, ring_offsets, polygon_offsets, part_offsets, multi = read_wkb(blobs)
+    if profile is not None:
+        profile["vertices"] = profile.get("vertices", 0) + len(coords)
+        profile.setdefault("feature_vertices", []).extend(
+            np.diff(ring_offsets[polygon_offsets[part_offsets]]).tolist()
+        )
+
+    # Only compute the geometries which would change
+    selection = np.arange(len(blobs))
+    if skip_unchanged:
+        with timed(profile, "skip_check"):
+            unchanged = unchanged_geometries(
+                coords,
+                ring_offsets,
+                polygon_offsets,
+                part_offsets,
+                keep_rings,
+                rings_share_axes,
+                tolerance,
+            )
+            # A fixed angle may rotate a rectangle
+            if angles is not None:
+                fixed = ~np.isnan(polygon_values(angles, part_offsets))
+                unchanged &= segment_reduce(np.maximum, fixed, part_offsets, 0) == 0
+            (selection,) = np.nonzero(~unchanged)
+            if len(selection) < len(blobs):
+                coords, ring_offsets, polygon_offsets, part_offsets = take_geometries(
+                    coords, ring_offsets, polygon_offsets, part_offsets, selection
+                )
+                multi = [multi[i] for i in selection]
+                if angles is not None:
+                    angles = [angles[i] for i in selection]
+                if boxes is not None:
+                    boxes = [boxes[i] for i in selection]
+
+    if angles is not None:
+        angles = polygon_values(angles, part_offsets)
+    if boxes is not None:
+        boxes = polygon_values(boxes, part_offsets, 5)
+
+        # A fixed angle overrides the known minimum bounding box
+        if angles is not None:
+            boxes[~np.isnan(angles)] = np.nan
+    exteriors = exterior_boxes(
+        coords, ring_offsets, polygon_offsets, angles, boxes, profile, area_tolerance
+    )
+    rectangles = rectanglify_polygons(
+        coords,
+        ring_offsets,
+        polygon_offsets,
+        constant_area,
+        keep_rings,
+        rings_share_axes,
+        exteriors=exteriors,
+        profile=profile,
+        area_tolerance=area_tolerance,
+    )
+    with timed(profile, "write_wkb"):
+        written = write_wkb(rectangles, polygon_offsets, part_offsets, multi)
+
+    result = [None] * len(blobs)
+    for index, blob in zip(selection, written):
+        result[index] = blob
+    if return_boxes:
+        # The boxes of fixed angles are not minimum bounding boxes
+        if angles is not None:
+            exteriors[~np.isnan(angles)] = np.nan
+        computed = [None] * len(blobs)
+        for index, box in zip(selection, np.split(exteriors, part_offsets[1:-1])):
+            if not np.isnan(box[:, 0]).any():
+                computed[index] = box
+        return result, computed
+    return result
+
+
+def rectanglify_job(job, **options):
+    """Process pool entry point
+
+    Args:
+        job (tuple): (blobs, boxes, angles) tuple, see rectanglify_wkb
+        options: Keyword arguments of rectanglify_wkb
+
+    Returns:
+        (list, list, dict): Output WKB blobs, outer ring bounding boxes and profile
+    """
+    blobs, boxes, angles = job
+    profile = {}
+    blobs, boxes = rectanglify_wkb(
+        blobs, angles=angles, boxes=boxes, return_boxes=True, profile=profile, **options
+    )
+    return blobs, boxes, profile
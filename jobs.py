@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Job queue of the rectanglify plugin. A job captures everything a run needs when it
+is submitted (the layer writer, the features to read and the options), so that runs
+on several layers can be queued and run concurrently, each in its own QgsTask. Only
+depends on qgis.core, so that the plugin can create the queue at startup.
+"""
+import functools
+
+from qgis.core import QgsApplication, QgsProject, QgsTask
+
+# Default maximum number of layers rectanglified at the same time
+MAX_RUNNING = 2
+
+
+class RectanglifyJob:
+    """
+    A run on one layer. Built in the main thread, when submitted: the task only reads
+    the features through prepare, and hands the new geometries to the writer.
+    """
+
+    def __init__(self, writer, prepare, options, source, cache=None, statistics=False):
+        """Constructor. Must be called from the main thread.
+
+        Args:
+            writer (GeometryWriter): Writer of the layer, started with the job
+            prepare (callable): Called by the task, returns the chunks of features to
+                rectanglify and their total count
+            options (dict): Rectanglify options, see Rectanglify.rectanglify_options
+            source (QgsVectorLayerFeatureSource): Source of the layer features, read
+                by the dominant angle mode
+            cache (AnalysisCache, optional): Cache of the minimum bounding boxes.
+                Defaults to None.
+            statistics (bool, optional): Whether to collect the run statistics.
+                Defaults to False.
+        """
+        self.writer = writer
+        self.layer = writer.layer
+        self.layer_id = writer.layer.id()
+        self.name = writer.layer.name()
+        self.prepare = prepare
+        self.options = options
+        self.source = source
+        self.cache = cache
+        self.statistics = statistics
+        self.task: QgsTask = None
+
+
+class JobQueue:
+    """
+    Runs the submitted jobs in the submission order, each in its own QgsTask, with at
+    most max_running tasks at once and a single job per layer, queued or running.
+    """
+
+    def __init__(self, run, on_started, on_finished, max_running=MAX_RUNNING):
+        """Constructor. Must be called from the main thread.
+
+        Args:
+            run (callable): Task function, called as run(task, job) in the task
+                thread
+            on_started (callable): Called as on_started(job) in the main thread,
+                right before the job task is started
+            on_finished (callable): Called as on_finished(job, exception) in the main
+                thread once the job task ended, exception being None on success
+            max_running (int, optional): Maximum number of running jobs. Defaults to
+                MAX_RUNNING.
+        """
+        self.run = run
+        self.on_started = on_started
+        self.on_finished = on_finished
+        self.max_running = max(max_running, 1)
+        self.pending = []
+        self.running = []
+        self.closed = False
+
+    def jobs(self):
+        """Running then pending jobs
+
+        Returns:
+            list: Jobs (RectanglifyJob)
+        """
+        return self.running + self.pending
+
+    def busy(self, layer_id=None):
+        """Whether a job is queued or running
+
+        Args:
+            layer_id (str, optional): Only consider the jobs of this layer. Defaults
+                to None.
+
+        Returns:
+            bool: True if there is a job
+        """
+        return any(layer_id is None or job.layer_id == layer_id for job in self.jobs())
+
+    def submit(self, job):
+        """Queue a job, and start it if there is room
+
+        Args:
+            job (RectanglifyJob): Job
+
+        Returns:
+            bool: False if the layer of the job already has a job, or the queue is
+                closed
+        """
+        if self.closed or self.busy(job.layer_id):
+            return False
+        self.pending.append(job)
+        self.start_next()
+        return True
+
+    def set_max_running(self, max_running):
+        """Change the maximum number of running jobs. Running jobs are not stopped
+        when it decreases.
+
+        Args:
+            max_running (int): Maximum number of running jobs
+        """
+        self.max_running = max(max_running, 1)
+        self.start_next()
+
+    def start_next(self):
+        """Start pending jobs while there is room. Jobs whose layer was removed from
+        the project are dropped."""
+        while not self.closed and self.pending and len(self.running) < self.max_running:
+            job = self.pending.pop(0)
+            if QgsProject.instance().mapLayer(job.layer_id) is None:
+                continue
+            self.on_started(job)
+            job.task = QgsTask.fromFunction(
+                "Rectanglify {}".format(job.name),
+                self.run,
+                job,
+                on_finished=functools.partial(self.finished, job),
+            )
+            self.running.append(job)
+            QgsApplication.taskManager().addTask(job.task)
+
+    def finished(self, job, exception, result=None):
+        """Task completion handler: report the job, and start the next ones"""
+        self.running.remove(job)
+        try:
+            self.on_finished(job, exception)
+        finally:
+            self.start_next()
+
+    def cancel(self):
+        """Drop the pending jobs, and cancel the running ones"""
+        self.pending.clear()
+        for job in self.running:
+            job.task.cancel()
+
+    def close(self):
+        """Cancel the jobs, and stop accepting new ones. The running tasks still
+        report their end to on_finished, which must then only clean up their job."""
+        self.closed = True
+        self.cancel()
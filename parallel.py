@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Process pool helpers of the rectanglify plugin. QGIS independent: the workers only
+import the numpy core.
+"""
+import collections
+import itertools
+import multiprocessing
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+
+def python_executable():
+    """Path of the python interpreter used to spawn the workers. Inside QGIS,
+    sys.executable is usually the QGIS binary itself, which must not be spawned.
+
+    Returns:
+        str: Path of the python interpreter
+    """
+    name = "python.exe" if sys.platform == "win32" else "python3"
+    candidates = (
+        sys.executable,
+        os.path.join(sys.exec_prefix, name),
+        os.path.join(sys.exec_prefix, "bin", name),
+        shutil.which(name),
+    )
+    for candidate in candidates:
+        if (
+            candidate
+            and os.path.basename(candidate).lower().startswith("python")
+            and os.path.isfile(candidate)
+        ):
+            return candidate
+    return sys.executable
+
+
+def process_pool(workers):
+    """Create a process pool whose workers are fresh python interpreters
+
+    Args:
+        workers (int): Number of worker processes
+
+    Returns:
+        concurrent.futures.ProcessPoolExecutor: Process pool
+    """
+    context = multiprocessing.get_context("spawn")
+    context.set_executable(python_executable())
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+def ordered_map(function, items, workers, window=None):
+    """Apply function to the payloads of items in a process pool, yielding the
+    results in submission order. At most window payloads are in flight at once, so
+    that items is consumed lazily.
+
+    A single payload is processed in this process, without starting a pool: its
+    startup would cost more than the work itself.
+
+    Pending payloads are cancelled and the pool is shut down as soon as the
+    generator is closed, for instance when the caller stops iterating early.
+
+    Args:
+        function (callable): Picklable function, called with each payload
+        items (iterable): (key, payload) pairs. Keys stay in this process
+        workers (int): Number of worker processes
+        window (int, optional): Maximum number of payloads in flight. Defaults to
+            twice the number of workers.
+
+    Yields:
+        (object, object): Key and result of function(payload)
+    """
+    iterator = iter(items)
+    first = next(iterator, None)
+    if first is None:
+        return
+    second = next(iterator, None)
+    if second is None:
+        key, payload = first
+        yield key, function(payload)
+        return
+
+    window = window or 2 * workers
+    pending = collections.deque()
+    pool = process_pool(workers)
+    try:
+        for key, payload in itertools.chain((first, second), iterator):
+            pending.append((key, pool.submit(function, payload)))
+            if len(pending) >= window:
+                key, future = pending.popleft()
+                yield key, future.result()
+        while pending:
+            key, future = pending.popleft()
+            yield key, future.result()
+    finally:
+        for _, future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
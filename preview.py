@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Live preview of the rectanglify plugin: a rubber band of the rectanglified selected
+features of the active layer, or of its visible features if none is selected. The
+geometries are computed in a background task, superseded as soon as the selection,
+the map extent or the settings change, and cached per feature id.
+"""
+import functools
+from contextlib import closing
+
+from PyQt5.QtCore import QTimer
+from PyQt5.QtGui import QColor
+
+from qgis.core import (
+    QgsApplication,
+    QgsFeatureRequest,
+    QgsGeometry,
+    QgsTask,
+    QgsVectorLayer,
+    QgsVectorLayerFeatureSource,
+    QgsWkbTypes,
+)
+from qgis.gui import QgsRubberBand
+
+from .utils import chunked, feature_angles, rectanglify_chunks
+
+# Maximum number of visible features previewed when none is selected
+MAX_FEATURES = 5000
+
+# Beyond this number of cached geometries, only the previewed ones are kept
+MAX_CACHED = 100000
+
+# Number of features rectanglified between two cancellation checks
+PREVIEW_CHUNK_SIZE = 250
+
+
+def preview_geometries(task, source, request, cached, options, angles):
+    """Rectanglify the previewed features which are not cached. Runs in the task
+    thread, and stops early once the task is canceled.
+
+    Args:
+        task (QgsTask): Preview task
+        source (QgsVectorLayerFeatureSource): Source of the layer features
+        request (QgsFeatureRequest): Request of the previewed features
+        cached (set): Ids of the features whose preview is cached
+        options (dict): Keyword arguments of rectanglify_chunks
+        angles (callable): Angles of the features, see feature_angles
+
+    Returns:
+        (list, dict): Ids of the previewed features and the new preview geometries
+            (QgsGeometry) by feature id, None if canceled
+    """
+    fids, missing = [], []
+    for feat in source.getFeatures(request):
+        if task.isCanceled():
+            return None
+        fids.append(feat.id())
+        if feat.id() not in cached:
+            missing.append(feat)
+
+    geometries = {}
+    results = rectanglify_chunks(
+        chunked(missing, PREVIEW_CHUNK_SIZE), angles=angles, **options
+    )
+    with closing(results):
+        for chunk, new_geoms in results:
+            if task.isCanceled():
+                return None
+            # Already rectangular features are previewed as is
+            for feat, geometry in zip(chunk, new_geoms):
+                geometries[feat.id()] = (
+                    feat.geometry() if geometry is None else geometry
+                )
+    return fids, geometries
+
+
+class LivePreview:
+    """
+    Rubber band previewing the rectanglified features of a layer. Updates are
+    coalesced by a timer, and each one supersedes the running computation.
+    """
+
+    def __init__(self, canvas, options, delay=100):
+        """Constructor. Must be called from the main thread.
+
+        Args:
+            canvas (QgsMapCanvas): Map canvas
+            options (callable): Returns the rectanglify options, see
+                Rectanglify.rectanglify_options
+            delay (int, optional): Delay in milliseconds between the last change and
+                the update. Defaults to 100.
+        """
+        self.canvas = canvas
+        self.options = options
+        self.layer: QgsVectorLayer = None
+        self.geometries = {}
+        self.angles = None
+        self.generation = 0
+        self.task: QgsTask = None
+
+        self.rubber_band = QgsRubberBand(canvas, QgsWkbTypes.PolygonGeometry)
+        self.rubber_band.setColor(QColor(255, 128, 0, 60))
+        self.rubber_band.setStrokeColor(QColor(255, 128, 0))
+        self.rubber_band.setWidth(2)
+
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.update)
+        self.canvas.extentsChanged.connect(self.schedule)
+
+    def signals(self, layer):
+        """Signals of a layer the preview depends on
+
+        Args:
+            layer (QgsVectorLayer): Layer
+
+        Returns:
+            list: (signal, slot) pairs
+        """
+        return [
+            (layer.selectionChanged, self.schedule),
+            (layer.geometryChanged, self.invalidate),
+            (layer.featureDeleted, self.invalidate),
+            (layer.editingStopped, self.reset),
+        ]
+
+    def set_layer(self, layer):
+        """Preview the features of a layer
+
+        Args:
+            layer (QgsMapLayer): Active layer, ignored unless it is a polygon layer
+        """
+        if self.layer is not None:
+            for signal, slot in self.signals(self.layer):
+                signal.disconnect(slot)
+        if not (
+            isinstance(layer, QgsVectorLayer)
+            and layer.geometryType() == QgsWkbTypes.PolygonGeometry
+        ):
+            layer = None
+        self.layer = layer
+        if layer is not None:
+            for signal, slot in self.signals(layer):
+                signal.connect(slot)
+        self.reset()
+
+    def invalidate(self, fid, *args):
+        """Forget the preview of a changed feature"""
+        self.geometries.pop(fid, None)
+        self.schedule()
+
+    def reset(self):
+        """Forget all the previews, typically after a settings change"""
+        self.geometries = {}
+        self.angles = None
+        self.schedule()
+
+    def schedule(self, *args):
+        """Update the preview once the changes are over"""
+        self.timer.start()
+
+    def cancel(self):
+        """Supersede the running computation, if any"""
+        self.generation += 1
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def update(self):
+        """Start the computation of the preview of the selected, or else visible,
+        features"""
+        self.cancel()
+        layer = self.layer
+        if layer is None:
+            self.rubber_band.reset(QgsWkbTypes.PolygonGeometry)
+            return
+
+        options = dict(self.options(), workers=1)
+        angle_options = options.pop("angles", None) or {}
+        request = QgsFeatureRequest().setSubsetOfAttributes([])
+        field = angle_options.get("field", "")
+        if (
+            angle_options.get("mode") == "attribute"
+            and layer.fields().indexOf(field) >= 0
+        ):
+            request.setSubsetOfAttributes([field], layer.fields())
+        if layer.selectedFeatureCount():
+            request.setFilterFids(layer.selectedFeatureIds())
+        else:
+            request.setFilterRect(
+                self.canvas.mapSettings().mapToLayerCoordinates(
+                    layer, self.canvas.extent()
+                )
+            )
+            request.setLimit(MAX_FEATURES)
+
+        source = QgsVectorLayerFeatureSource(layer)
+        # The neighborhood histograms of the dominant angle mode are kept across updates
+        if self.angles is None:
+            self.angles = feature_angles(source, **angle_options)
+
+        self.task = QgsTask.fromFunction(
+            "Rectanglify preview",
+            preview_geometries,
+            source,
+            request,
+            set(self.geometries),
+            options,
+            self.angles,
+            on_finished=functools.partial(self.on_finished, self.generation),
+        )
+        QgsApplication.taskManager().addTask(self.task)
+
+    def on_finished(self, generation, exception, result=None):
+        """Draw the preview, unless the computation was superseded"""
+        if generation != self.generation:
+            return
+        self.task = None
+        if exception is not None or result is None or self.layer is None:
+            return
+        fids, geometries = result
+        self.geometries.update(geometries)
+        if len(self.geometries) > MAX_CACHED:
+            self.geometries = {
+                fid: self.geometries[fid] for fid in fids if fid in self.geometries
+            }
+        self.draw(fids)
+
+    def draw(self, fids):
+        """Draw the preview of features
+
+        Args:
+            fids (list): Feature ids
+        """
+        geometries = [
+            self.geometries[fid]
+            for fid in fids
+            if fid in self.geometries and not self.geometries[fid].isEmpty()
+        ]
+        if not geometries:
+            self.rubber_band.reset(QgsWkbTypes.PolygonGeometry)
+            return
+        self.rubber_band.setToGeometry(
+            QgsGeometry.collectGeometry(geometries), self.layer
+        )
+
+    def stop(self):
+        """Remove the preview, and stop following the layer and the map canvas"""
+        self.timer.stop()
+        self.cancel()
+        self.canvas.extentsChanged.disconnect(self.schedule)
+        if self.layer is not None:
+            for signal, slot in self.signals(self.layer):
+                signal.disconnect(slot)
+            self.layer = None
+        self.rubber_band.reset(QgsWkbTypes.PolygonGeometry)
+        self.canvas.scene().removeItem(self.rubber_band)
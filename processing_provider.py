@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Processing provider of the rectanglify plugin
+"""
+import os
+
+from PyQt5.QtGui import QIcon
+
+from qgis.core import QgsProcessingProvider
+
+from .rectanglify_algorithm import RectanglifyAlgorithm
+
+
+class RectanglifyProvider(QgsProcessingProvider):
+    """Processing provider exposing the Rectanglify algorithms"""
+
+    def loadAlgorithms(self):
+        """Load the provider algorithms"""
+        self.addAlgorithm(RectanglifyAlgorithm())
+
+    def id(self):
+        """Unique provider id"""
+        return "rectanglify"
+
+    def name(self):
+        """Provider name, displayed in the Processing toolbox"""
+        return "Rectanglify"
+
+    def icon(self):
+        """Provider icon"""
+        return QIcon(os.path.join(os.path.dirname(__file__), "actionRectanglify.svg"))
@@ -21,20 +21,23 @@
  *                                                                         *
  ***************************************************************************/
 """
+import hashlib
 import os.path
 import traceback
+from contextlib import closing
 
-from PyQt5.QtCore import QSettings, QTranslator, QCoreApplication
+from PyQt5.QtCore import QSettings, QTimer, QTranslator, QCoreApplication
 from PyQt5.QtGui import QIcon
-from PyQt5.QtWidgets import QAction, QDialog
+from PyQt5.QtWidgets import QAction, QDialog, QMessageBox
 
 from qgis.core import (
+    QgsVectorDataProvider,
     QgsVectorLayer,
+    QgsVectorLayerFeatureSource,
     QgsFeatureRequest,
     QgsWkbTypes,
     QgsProject,
     QgsMapLayer,
-    QgsGeometry,
     QgsTask,
     QgsApplication,
     Qgis,
@@ -42,11 +45,14 @@ from qgis.core import (
 
 from qgis.utils import QgsMessageLog
 
-# Initialize Qt resources from file resources.py
-from .resources import *
-from .utils import BeginCommand, rectanglify_geometry
+# The geometry engine (numpy and the utils, core, backup and cache modules) and the
+# settings dialog are imported on first use, to keep QGIS startup fast
+from .jobs import MAX_RUNNING, JobQueue, RectanglifyJob
+from .processing_provider import RectanglifyProvider
+from .trackers import ActiveLayerTracker, ChangeTracker
 
-from .settingsdialog import Ui_SettingsDialog
+# Angle modes, in the settings dialog order (see utils.feature_angles)
+ANGLE_MODES = ("minimum", "fixed", "attribute", "dominant")
 
 
 class Rectanglify:
@@ -87,6 +93,51 @@ class Rectanglify:
         self.settings.setValue(
             "ringsShareAxes", self.settings.value("ringsShareAxes", True, bool)
         )
+        self.settings.setValue("workers", self.settings.value("workers", 1, int))
+        self.settings.setValue(
+            "concurrentLayers",
+            self.settings.value("concurrentLayers", MAX_RUNNING, int),
+        )
+        self.settings.setValue(
+            "directWrite", self.settings.value("directWrite", False, bool)
+        )
+        self.settings.setValue(
+            "rebuildSpatialIndex",
+            self.settings.value("rebuildSpatialIndex", True, bool),
+        )
+        self.settings.setValue(
+            "analysisCache", self.settings.value("analysisCache", True, bool)
+        )
+        self.settings.setValue(
+            "autoRectanglify", self.settings.value("autoRectanglify", False, bool)
+        )
+        self.settings.setValue(
+            "skipRectangles", self.settings.value("skipRectangles", True, bool)
+        )
+        self.settings.setValue(
+            "collectStatistics", self.settings.value("collectStatistics", False, bool)
+        )
+        self.settings.setValue(
+            "statisticsFile", self.settings.value("statisticsFile", "", str)
+        )
+        self.settings.setValue(
+            "areaTolerance", self.settings.value("areaTolerance", 0.0, float)
+        )
+        self.settings.setValue(
+            "angleMode", self.settings.value("angleMode", "minimum", str)
+        )
+        self.settings.setValue(
+            "fixedAngle", self.settings.value("fixedAngle", 0.0, float)
+        )
+        self.settings.setValue("angleField", self.settings.value("angleField", "", str))
+        self.settings.setValue(
+            "neighborhoodRadius",
+            self.settings.value("neighborhoodRadius", 100.0, float),
+        )
+        self.settings.setValue(
+            "compactUndoFeatures",
+            self.settings.value("compactUndoFeatures", 10000, int),
+        )
 
     # noinspection PyMethodMayBeStatic
     def tr(self, message):
@@ -103,11 +154,20 @@ class Rectanglify:
         # noinspection PyTypeChecker,PyArgumentList,PyCallByClass
         return QCoreApplication.translate("Rectanglify", message)
 
+    def initProcessing(self):
+        """Register the Processing provider. Also called by qgis_process, without
+        any GUI."""
+        self.provider = RectanglifyProvider()
+        QgsApplication.processingRegistry().addProvider(self.provider)
+
     def initGui(self):
         """Create the menu entries and toolbar icons inside the QGIS GUI."""
 
+        self.initProcessing()
+
+        icon = QIcon(os.path.join(self.plugin_dir, "actionRectanglify.svg"))
         self.rectanglify_action = QAction(
-            QIcon(":/plugins/rectanglify/actionRectanglify.svg"),
+            icon,
             self.tr("Rectanglify Selected Features"),
             parent=self.iface.mainWindow(),
         )
@@ -118,47 +178,122 @@ class Rectanglify:
         )
         self.settings_action.triggered.connect(self.open_settings)
 
+        self.revert_action = QAction(
+            QIcon(""),
+            self.tr("Revert Last Direct Write"),
+            parent=self.iface.mainWindow(),
+        )
+        self.revert_action.triggered.connect(self.revert_direct_write)
+
+        self.changed_action = QAction(
+            icon,
+            self.tr("Rectanglify Changed Features"),
+            parent=self.iface.mainWindow(),
+        )
+        self.changed_action.triggered.connect(self.rectanglify_changed)
+
+        self.extent_action = QAction(
+            icon,
+            self.tr("Rectanglify Features in Map Extent"),
+            parent=self.iface.mainWindow(),
+        )
+        self.extent_action.triggered.connect(self.rectanglify_map_extent)
+
+        self.draw_action = QAction(
+            icon,
+            self.tr("Rectanglify Features in Drawn Rectangle"),
+            parent=self.iface.mainWindow(),
+        )
+        self.draw_action.setCheckable(True)
+        self.draw_action.triggered.connect(self.draw_extent)
+
+        self.preview_action = QAction(
+            icon, self.tr("Preview Rectanglify"), parent=self.iface.mainWindow(),
+        )
+        self.preview_action.setCheckable(True)
+        self.preview_action.toggled.connect(self.toggle_preview)
+
+        self.all_layers_action = QAction(
+            icon,
+            self.tr("Rectanglify All Polygon Layers"),
+            parent=self.iface.mainWindow(),
+        )
+        self.all_layers_action.triggered.connect(self.rectanglify_all_layers)
+
         self.iface.advancedDigitizeToolBar().addAction(self.rectanglify_action)
         self.iface.editMenu().addAction(self.rectanglify_action)
 
-        self.plugin_menu = self.iface.pluginMenu().addMenu(
-            QIcon(":/plugins/rectanglify/actionRectanglify.svg"), "Rectanglify"
-        )
+        self.plugin_menu = self.iface.pluginMenu().addMenu(icon, "Rectanglify")
         self.plugin_menu.addAction(self.rectanglify_action)
+        self.plugin_menu.addAction(self.changed_action)
+        self.plugin_menu.addAction(self.extent_action)
+        self.plugin_menu.addAction(self.draw_action)
+        self.plugin_menu.addAction(self.all_layers_action)
+        self.plugin_menu.addAction(self.preview_action)
+        self.plugin_menu.addAction(self.revert_action)
         self.plugin_menu.addAction(self.settings_action)
         self.iface.editMenu().addAction(self.rectanglify_action)
 
-        self.iface.currentLayerChanged.connect(self.update_action_state)
-        self.attach_to_project()
-        self.update_action_state()
+        # Runs are queued, and run concurrently on different layers
+        self.jobs = JobQueue(
+            self._rectanglify,
+            self.start_job,
+            self.on_finished,
+            self.settings.value("concurrentLayers", MAX_RUNNING, int),
+        )
+        self.tracker = ChangeTracker(self.on_features_changed)
+        self.state = ActiveLayerTracker(self.update_action_state)
+
+        self.iface.currentLayerChanged.connect(self.state.set_layer)
+        self.state.set_layer(self.iface.activeLayer())
 
-        self.task_rectanglify: QgsTask = None
+        # Walking the project layers waits for the event loop, after QGIS startup
+        self.attached = False
+        self.attach_timer = QTimer()
+        self.attach_timer.setSingleShot(True)
+        self.attach_timer.timeout.connect(self.attach_to_project)
+        self.attach_timer.start(0)
 
-        self.dialog = QDialog(self.iface.mainWindow())
-        self.dialog.ui = Ui_SettingsDialog()
-        self.dialog.ui.setupUi(self.dialog)
+        # Throughput and ETA of runs collecting statistics. QgsTask descriptions
+        # cannot be changed once the task is created, so they go to the status bar
+        self.status_timer = QTimer()
+        self.status_timer.setInterval(1000)
+        self.status_timer.timeout.connect(self.show_status)
+
+        # The settings dialog is built when first opened, the extent map tool when
+        # first used
+        self.dialog = None
+        self.extent_tool = None
+        self.previous_tool = None
+        self.preview = None
 
     def attach_to_project(self):
-        """Connect newly added layers to monitor their selection and editing state"""
+        """Connect newly added layers to track their changed features. The
+        selection and editing state is only monitored on the active layer"""
+        if self.attached:
+            return
+        self.attached = True
         QgsProject.instance().layerWasAdded[QgsMapLayer].connect(self.connect_layer)
         for layer in QgsProject.instance().mapLayers().values():
             self.connect_layer(layer)
 
     def detach_from_project(self):
         """Disconnect all layers"""
+        self.attach_timer.stop()
+        if not self.attached:
+            return
+        self.attached = False
         QgsProject.instance().layerWasAdded[QgsMapLayer].disconnect(self.connect_layer)
         for layer in QgsProject.instance().mapLayers().values():
             self.disconnect_layer(layer)
 
     def connect_layer(self, layer):
-        """Connect layer to monitor their selection and editing state"""
+        """Connect layer to track their changed features"""
         if (
             isinstance(layer, QgsVectorLayer)
             and layer.geometryType() == QgsWkbTypes.PolygonGeometry
         ):
-            layer.editingStarted.connect(self.update_action_state)
-            layer.editingStopped.connect(self.update_action_state)
-            layer.selectionChanged.connect(self.update_action_state)
+            self.tracker.connect_layer(layer)
 
     def disconnect_layer(self, layer):
         """Diconnect from layer signals"""
@@ -166,111 +301,630 @@ class Rectanglify:
             isinstance(layer, QgsVectorLayer)
             and layer.geometryType() == QgsWkbTypes.PolygonGeometry
         ):
-            layer.editingStarted.disconnect(self.update_action_state)
-            layer.editingStopped.disconnect(self.update_action_state)
-            layer.selectionChanged.disconnect(self.update_action_state)
+            self.tracker.disconnect_layer(layer)
 
     def update_action_state(self):
         """Enable/Disable action"""
+        from .backup import GeometryBackup
+
         layer: QgsVectorLayer = self.iface.activeLayer()
-        enabled = (
+        is_polygon_layer = (
             isinstance(layer, QgsVectorLayer)
             and layer.geometryType() == QgsWkbTypes.PolygonGeometry
-            and layer.isEditable()
         )
 
+        # In direct write mode, the layer does not need to be in edition, but its
+        # provider must be able to change geometries
+        if is_polygon_layer and self.settings.value("directWrite", False, bool):
+            enabled = bool(
+                layer.dataProvider().capabilities()
+                & QgsVectorDataProvider.ChangeGeometries
+            )
+        else:
+            enabled = is_polygon_layer and layer.isEditable()
+
         self.rectanglify_action.setEnabled(enabled)
+        self.extent_action.setEnabled(enabled)
+        self.draw_action.setEnabled(enabled)
+        self.changed_action.setEnabled(
+            is_polygon_layer
+            and layer.isEditable()
+            and not self.jobs.busy(layer.id())
+            and self.tracker.count(layer) > 0
+        )
+        self.revert_action.setEnabled(
+            is_polygon_layer and GeometryBackup(self.backup_path(layer)).exists()
+        )
 
         if enabled:
-            if layer.selectedFeatureCount() in (0, layer.featureCount()):
+            selected = layer.selectedFeatureCount()
+            if selected == 0 or selected == self.state.feature_count(layer):
                 self.rectanglify_action.setText(self.tr("Rectanglify All Features"))
             else:
                 self.rectanglify_action.setText(
                     self.tr("Rectanglify Selected Features")
                 )
 
+    def backup_path(self, layer):
+        """Path of the backup of the original geometries of the last direct write on
+        a layer
+
+        :param layer: Layer
+        :type layer: QgsVectorLayer
+
+        :returns: Path of the backup SQLite file
+        :rtype: str
+        """
+        name = hashlib.md5(layer.source().encode()).hexdigest()
+        return os.path.join(
+            QgsApplication.qgisSettingsDirPath(),
+            "rectanglify",
+            "backups",
+            "{}.sqlite".format(name),
+        )
+
+    def analysis_cache(self):
+        """Cache of the minimum bounding boxes, shared by all the layers
+
+        :returns: Cache, or None if disabled in the settings
+        :rtype: AnalysisCache
+        """
+        from .cache import MAX_ENTRIES, AnalysisCache
+
+        if not self.settings.value("analysisCache", True, bool):
+            return None
+        return AnalysisCache(
+            os.path.join(
+                QgsApplication.qgisSettingsDirPath(),
+                "rectanglify",
+                "analysis_cache.sqlite",
+            ),
+            self.settings.value("analysisCacheSize", MAX_ENTRIES, int),
+        )
+
     def unload(self):
         """Removes the plugin menu item and icon from QGIS GUI."""
         self.iface.advancedDigitizeToolBar().removeAction(self.rectanglify_action)
         self.iface.editMenu().removeAction(self.rectanglify_action)
         self.iface.pluginMenu().removeAction(self.plugin_menu.menuAction())
         self.rectanglify_action.deleteLater()
+        self.changed_action.deleteLater()
+        self.all_layers_action.deleteLater()
+        self.extent_action.deleteLater()
+        self.preview_action.deleteLater()
+        self.toggle_preview(False)
+        self.draw_action.deleteLater()
+        if self.extent_tool is not None:
+            self.iface.mapCanvas().unsetMapTool(self.extent_tool)
+        self.revert_action.deleteLater()
+        self.jobs.close()
+        self.status_timer.stop()
+        self.iface.currentLayerChanged.disconnect(self.state.set_layer)
+        self.state.stop()
         self.detach_from_project()
+        QgsApplication.processingRegistry().removeProvider(self.provider)
 
     def rectanglify(self):
-        """Create a QgsTask that will perform the actual rectanglification"""
+        """Rectanglify the selected features of the active layer, or all its features
+        if none is selected"""
+        layer: QgsVectorLayer = self.iface.activeLayer()
+        self.rectanglify_layer(layer, layer.selectedFeatureCount() > 0)
 
-        # On finished will be called when the tasks ends, whether it failed
-        # or succeeded
-        self.task_rectanglify = QgsTask.fromFunction(
-            "Rectanglify", self._rectanglify, on_finished=self.on_finished,
-        )
-        QgsApplication.taskManager().addTask(self.task_rectanglify)
+    def rectanglify_map_extent(self):
+        """Rectanglify the features of the active layer within the map canvas
+        extent"""
+        layer: QgsVectorLayer = self.iface.activeLayer()
+        self.rectanglify_extent(layer, self.iface.mapCanvas().extent())
 
-    def _rectanglify(self, task: QgsTask):
-        """Rectanglify active layer's features"""
+    def draw_extent(self, checked=True):
+        """Let the user draw a rectangle on the map canvas, then rectanglify the
+        features of the active layer within it
 
-        layer: QgsVectorLayer = self.iface.activeLayer()
-        only_selected = layer.selectedFeatureCount() > 0
-        constant_area = self.settings.value("constantArea", True, bool)
-        keep_rings = self.settings.value("keepRings", True, bool)
-        rings_share_axes = self.settings.value("ringsShareAxes", True, bool)
-
-        with BeginCommand(
-            layer,
-            self.tr("Rectanglify selected features")
-            if only_selected
-            else self.tr("Rectanglify all features"),
+        :param checked: Whether the action was checked, else the map tool is left
+        :type checked: bool
+        """
+        from qgis.gui import QgsMapToolExtent
+
+        canvas = self.iface.mapCanvas()
+        if not checked:
+            self.restore_map_tool()
+            return
+        if self.extent_tool is None:
+            self.extent_tool = QgsMapToolExtent(canvas)
+            self.extent_tool.setAction(self.draw_action)
+            self.extent_tool.extentChanged.connect(self.on_extent_drawn)
+        self.previous_tool = canvas.mapTool()
+        canvas.setMapTool(self.extent_tool)
+
+    def on_extent_drawn(self, extent):
+        """Rectanglify the features of the active layer within the drawn rectangle,
+        and restore the previous map tool
+
+        :param extent: Drawn rectangle, in the map canvas CRS
+        :type extent: QgsRectangle
+        """
+        self.restore_map_tool()
+        if not extent.isEmpty():
+            self.rectanglify_extent(self.iface.activeLayer(), extent)
+
+    def restore_map_tool(self):
+        """Leave the extent map tool for the map tool used before"""
+        canvas = self.iface.mapCanvas()
+        self.extent_tool.clearRubberBand()
+        if self.previous_tool is not None:
+            canvas.setMapTool(self.previous_tool)
+        else:
+            canvas.unsetMapTool(self.extent_tool)
+        self.previous_tool = None
+
+    def rectanglify_extent(self, layer, extent):
+        """Rectanglify the features of a layer within a map canvas rectangle
+
+        :param layer: Polygon layer
+        :type layer: QgsVectorLayer
+
+        :param extent: Rectangle, in the map canvas CRS
+        :type extent: QgsRectangle
+        """
+        if (
+            not isinstance(layer, QgsVectorLayer)
+            or not self.rectanglify_action.isEnabled()
         ):
+            return
+        settings = self.iface.mapCanvas().mapSettings()
+        self.rectanglify_layer(
+            layer, extent=settings.mapToLayerCoordinates(layer, extent)
+        )
+
+    def toggle_preview(self, checked):
+        """Start or stop the live preview of the active layer
+
+        :param checked: Whether to show the preview
+        :type checked: bool
+        """
+        if checked and self.preview is None:
+            from .preview import LivePreview
+
+            self.preview = LivePreview(self.iface.mapCanvas(), self.rectanglify_options)
+            self.iface.currentLayerChanged.connect(self.preview.set_layer)
+            self.preview.set_layer(self.iface.activeLayer())
+        elif not checked and self.preview is not None:
+            self.iface.currentLayerChanged.disconnect(self.preview.set_layer)
+            self.preview.stop()
+            self.preview = None
+
+    def rectanglify_all_layers(self):
+        """Rectanglify all the features of all the polygon layers of the project. In
+        the edit buffer mode, the layers which are not in edition are put in edition,
+        so that the results can be reviewed before being saved"""
+        direct_write = self.settings.value("directWrite", False, bool)
+        submitted = 0
+        for layer in QgsProject.instance().mapLayers().values():
+            if (
+                not isinstance(layer, QgsVectorLayer)
+                or layer.geometryType() != QgsWkbTypes.PolygonGeometry
+                or self.jobs.busy(layer.id())
+            ):
+                continue
+            if direct_write:
+                if not (
+                    layer.dataProvider().capabilities()
+                    & QgsVectorDataProvider.ChangeGeometries
+                ):
+                    continue
+            elif not layer.isEditable() and not layer.startEditing():
+                continue
+            submitted += self.rectanglify_layer(layer)
+
+        self.iface.messageBar().pushMessage(
+            self.tr("Rectanglify: {} layers queued").format(submitted)
+        )
+
+    def rectanglify_layer(self, layer, only_selected=False, extent=None):
+        """Queue a job rectanglifying the features of a layer
 
-            if only_selected:
-                features = layer.getSelectedFeatures(
-                    QgsFeatureRequest().setSubsetOfAttributes([])
+        :param layer: Polygon layer, in edition unless writing directly to the data
+            source
+        :type layer: QgsVectorLayer
+
+        :param only_selected: Only rectanglify the selected features
+        :type only_selected: bool
+
+        :param extent: Only rectanglify the features whose bounding box intersects
+            this rectangle, in the layer CRS
+        :type extent: QgsRectangle
+
+        :returns: Whether a job was queued
+        :rtype: bool
+        """
+        from .backup import GeometryBackup
+        from .utils import (
+            CHUNK_SIZE,
+            ProviderWriter,
+            checkpointed_chunks,
+            chunked,
+            counted_chunks,
+        )
+
+        # A layer has a single job at a time, queued or running
+        if self.jobs.busy(layer.id()):
+            self.iface.messageBar().pushMessage(
+                self.tr("Rectanglify is already running on {}").format(layer.name()),
+                level=Qgis.Warning,
+            )
+            return False
+
+        # Everything touching the layer is captured here, in the main thread. The
+        # task only reads features from a detached feature source, and hands the
+        # new geometries to the writer, which applies them in the main thread.
+        request = QgsFeatureRequest().setSubsetOfAttributes([])
+        if only_selected:
+            request.setFilterFids(layer.selectedFeatureIds())
+            total = layer.selectedFeatureCount()
+            command_name = self.tr("Rectanglify selected features")
+        elif extent is not None:
+            # Candidates are found by the provider spatial index, and only counted
+            # by the task
+            request.setFilterRect(extent)
+            total = None
+            command_name = self.tr("Rectanglify features in extent")
+        else:
+            total = layer.featureCount()
+            command_name = self.tr("Rectanglify all features")
+
+        options = self.rectanglify_options()
+        source = QgsVectorLayerFeatureSource(layer)
+        if self.settings.value("directWrite", False, bool):
+
+            # Direct writes would be overwritten by pending edits on commit
+            if layer.isModified():
+                self.iface.messageBar().pushMessage(
+                    self.tr(
+                        "Rectanglify: save or discard the edits of {} before a "
+                        "direct write"
+                    ).format(layer.name()),
+                    level=Qgis.Warning,
                 )
-                total = layer.selectedFeatureCount()
-            else:
-                features = layer.getFeatures(
-                    QgsFeatureRequest().setSubsetOfAttributes([])
+                return False
+
+            backup = GeometryBackup(self.backup_path(layer))
+            resume = False
+            pending = backup.pending_run()
+            if pending is not None:
+                resume = (
+                    QMessageBox.question(
+                        self.iface.mainWindow(),
+                        self.tr("Rectanglify"),
+                        self.tr(
+                            "A previous direct write on {} was interrupted. Resume "
+                            "it?"
+                        ).format(layer.name()),
+                    )
+                    == QMessageBox.Yes
+                )
+                if resume:
+                    options = dict(pending, workers=options["workers"])
+                    # The journal holds the target features of the interrupted run:
+                    # the selection or extent of this action must not filter them
+                    request = QgsFeatureRequest().setSubsetOfAttributes([])
+                else:
+                    backup.end_run()
+
+            # Only the last direct write can be reverted, unless the previous one
+            # was interrupted: its backup is kept, and extended by the new run
+            elif backup.exists():
+                backup.remove()
+
+            writer = ProviderWriter(
+                layer, backup, self.settings.value("rebuildSpatialIndex", True, bool)
+            )
+
+            # Stream the features by chunks of feature ids, checkpointed after each
+            # written chunk
+            def prepare():
+                return checkpointed_chunks(source, request, backup, resume, options)
+
+        else:
+            writer = self.buffer_writer(layer, command_name, total or 0)
+
+            def prepare():
+                if total is None:
+                    return counted_chunks(source, request, CHUNK_SIZE)
+                return chunked(source.getFeatures(request), CHUNK_SIZE), total
+
+        self.request_angle_field(layer, request, options)
+        return self.submit(writer, prepare, options, source)
+
+    def buffer_writer(self, layer, command_name, count):
+        """Writer of a run through the edit buffer. Runs of many features are undone
+        by a compact command, instead of a command per feature
+
+        :param layer: Layer in edition
+        :type layer: QgsVectorLayer
+
+        :param command_name: Name of the undo command of the run
+        :type command_name: str
+
+        :param count: Number of features of the run
+        :type count: int
+
+        :returns: Writer
+        :rtype: GeometryWriter
+        """
+        from .undo import CompactGeometryWriter
+        from .utils import GeometryWriter
+
+        if count >= self.settings.value("compactUndoFeatures", 10000, int):
+            return CompactGeometryWriter(layer, command_name)
+        return GeometryWriter(layer, command_name)
+
+    def rectanglify_changed(self):
+        """Rectanglify the features added or modified since the last run on the active
+        layer, as a single undo command"""
+        layer: QgsVectorLayer = self.iface.activeLayer()
+        self.rectanglify_layer_changes(layer)
+
+    def rectanglify_layer_changes(self, layer):
+        """Create a QgsTask rectanglifying the changed features of a layer
+
+        :param layer: Layer in edition
+        :type layer: QgsVectorLayer
+        """
+        from .utils import CHUNK_SIZE, chunked
+
+        if self.jobs.busy(layer.id()):
+            return
+        fids = self.tracker.take(layer)
+        if not fids:
+            return
+        request = QgsFeatureRequest().setSubsetOfAttributes([]).setFilterFids(fids)
+        # Bursts of edits are small, and frequent in automatic mode: a process pool
+        # would cost more than the rectanglification
+        options = dict(self.rectanglify_options(), workers=1)
+        self.request_angle_field(layer, request, options)
+        source = QgsVectorLayerFeatureSource(layer)
+        writer = self.buffer_writer(
+            layer, self.tr("Rectanglify changed features"), len(fids)
+        )
+
+        def prepare():
+            return chunked(source.getFeatures(request), CHUNK_SIZE), len(fids)
+
+        self.submit(writer, prepare, options, source)
+
+    def on_features_changed(self):
+        """Called after bursts of feature changes. In automatic mode, rectanglify the
+        changed features of the layers in edition. Layers with a job are picked up
+        once it ends"""
+        self.update_action_state()
+        if not self.settings.value("autoRectanglify", False, bool):
+            return
+        for layer_id in self.tracker.layer_ids():
+            layer = QgsProject.instance().mapLayer(layer_id)
+            if layer is not None and layer.isEditable():
+                self.rectanglify_layer_changes(layer)
+
+    def request_angle_field(self, layer, request, options):
+        """In the attribute angle mode, fetch the angle field along with the
+        geometries
+
+        :param layer: Layer to rectanglify
+        :type layer: QgsVectorLayer
+
+        :param request: Request of the features to rectanglify, updated in place
+        :type request: QgsFeatureRequest
+
+        :param options: Rectanglify options
+        :type options: dict
+        """
+        angles = options.get("angles") or {}
+        if angles.get("mode") == "attribute":
+            if layer.fields().indexOf(angles.get("field", "")) < 0:
+                self.iface.messageBar().pushMessage(
+                    self.tr(
+                        "Rectanglify: no '{}' angle field, minimum bounding boxes "
+                        "are used instead"
+                    ).format(angles.get("field", "")),
+                    level=Qgis.Warning,
                 )
-                total = layer.featureCount()
+                return
+            request.setSubsetOfAttributes([angles["field"]], layer.fields())
+
+    def submit(self, writer, prepare, options, source):
+        """Queue a job, which starts the writer and runs _rectanglify in a QgsTask
+
+        :param writer: Writer of the layer, not started yet
+        :type writer: GeometryWriter
+
+        :param prepare: Called by the task, returns the chunks of features to
+            rectanglify and their total count
+        :type prepare: callable
 
-            for i, feat in enumerate(features, 1):
+        :param options: Rectanglify options, see rectanglify_options
+        :type options: dict
 
-                # Check if task is canceled. Raising an exception will revert any
-                # change made up to this point, thanks to the BeginCommand __exit__
-                # method
+        :param source: Source of the layer features, read by the dominant angle mode
+        :type source: QgsVectorLayerFeatureSource
+
+        :returns: Whether the job was queued
+        :rtype: bool
+        """
+        if self.jobs.closed:
+            return False
+        job = RectanglifyJob(
+            writer,
+            prepare,
+            options,
+            source,
+            self.analysis_cache(),
+            self.settings.value("collectStatistics", False, bool),
+        )
+        queued = self.jobs.submit(job)
+        self.update_action_state()
+        return queued
+
+    def start_job(self, job):
+        """Start the writer of a job, right before its task
+
+        :param job: Job
+        :type job: RectanglifyJob
+        """
+        from .stats import RunStats
+
+        if job.statistics:
+            job.writer.stats = RunStats()
+            self.status_timer.start()
+        job.writer.start()
+
+        # The changes made by rectanglify itself are not tracked, the ones made by
+        # the user during the run are
+        self.tracker.pause(job.layer, lambda: job.writer.applying)
+
+    def rectanglify_options(self):
+        """Rectanglify options, read from the plugin settings
+
+        :returns: Keyword arguments of rectanglify_chunks, and the angles options
+            of feature_angles
+        :rtype: dict
+        """
+        return {
+            "constant_area": self.settings.value("constantArea", True, bool),
+            "keep_rings": self.settings.value("keepRings", True, bool),
+            "rings_share_axes": self.settings.value("ringsShareAxes", True, bool),
+            "workers": self.settings.value("workers", 1, int),
+            "skip_unchanged": self.settings.value("skipRectangles", True, bool),
+            "area_tolerance": self.settings.value("areaTolerance", 0.0, float) / 100,
+            "angles": {
+                "mode": self.settings.value("angleMode", "minimum", str),
+                "angle": self.settings.value("fixedAngle", 0.0, float),
+                "field": self.settings.value("angleField", "", str),
+                "radius": self.settings.value("neighborhoodRadius", 100.0, float),
+            },
+        }
+
+    def _rectanglify(self, task: QgsTask, job):
+        """Rectanglify the features of a job. Runs in the task thread: the results
+        are not applied here, but handed to the job writer
+
+        :param job: Job, see RectanglifyJob
+        :type job: RectanglifyJob
+        """
+        from .utils import feature_angles, rectanglify_chunks
+
+        writer = job.writer
+        chunks, total = job.prepare()
+        if writer.stats is not None:
+            writer.stats.total = total
+
+        # Runs resumed from older backups have no angles options
+        options = dict(job.options)
+        angles = feature_angles(job.source, **(options.pop("angles", None) or {}))
+
+        done = 0
+        results = rectanglify_chunks(
+            chunks, cache=job.cache, stats=writer.stats, angles=angles, **options
+        )
+        with closing(results):
+            for chunk, new_geoms in results:
+
+                # Check if task is canceled. Raising an exception will make
+                # on_finished revert any change made up to this point. Closing the
+                # results stops the workers.
                 if task.isCanceled():
                     raise Exception("Canceled")
 
-                if feat.geometry().isMultipart():
-                    multi = [
-                        rectanglify_geometry(
-                            QgsGeometry.fromPolygonXY(polygon),
-                            constant_area,
-                            keep_rings,
-                            rings_share_axes,
-                        )
-                        for polygon in feat.geometry().asMultiPolygon()
-                    ]
-                    new_geom = QgsGeometry.collectGeometry(multi)
-                else:
-                    new_geom = rectanglify_geometry(
-                        feat.geometry(), constant_area, keep_rings, rings_share_axes
-                    )
-                layer.changeGeometry(feat.id(), new_geom)
+                writer.put(chunk, new_geoms, task)
 
                 # Report task progress
-                task.setProgress(i * 100 / total)
+                done += len(chunk)
+                task.setProgress(done * 100 / max(total, 1))
+
+    def show_status(self):
+        """Show the throughput and ETA of the running tasks in the status bar"""
+        statuses = [
+            "{}: {}".format(job.name, job.writer.stats.status())
+            for job in self.jobs.running
+            if job.writer.stats is not None
+        ]
+        if statuses:
+            self.iface.statusBarIface().showMessage(
+                self.tr("Rectanglify {}").format(" | ".join(statuses))
+            )
+        else:
+            self.status_timer.stop()
+            self.iface.statusBarIface().clearMessage()
+
+    def report_statistics(self, stats, name):
+        """Log the statistics of a finished run, and write them to the statistics
+        file, if any
 
-    def on_finished(self, exception, result=None):
-        """Task completion handler"""
+        :param stats: Run statistics
+        :type stats: RunStats
+
+        :param name: Name of the rectanglified layer
+        :type name: str
+        """
+        stats.finish()
+        QgsMessageLog.logMessage(
+            "Rectanglify statistics of {}:\n{}".format(name, stats.report()),
+            "Rectanglify",
+            Qgis.Info,
+        )
+        path = self.settings.value("statisticsFile", "", str)
+        if path:
+            try:
+                stats.write(path)
+            except OSError as error:
+                QgsMessageLog.logMessage(
+                    "Could not write the statistics to {}: {}".format(path, error),
+                    "Rectanglify",
+                    Qgis.Warning,
+                )
+
+    def on_finished(self, job, exception):
+        """Job completion handler
+
+        :param job: Finished job
+        :type job: RectanglifyJob
+
+        :param exception: Exception raised by the task, None on success
+        :type exception: Exception
+        """
+        from .utils import ProviderWriter
+
+        # Apply the remaining results and close the edit command, or revert
+        # everything if the task failed
+        writer = job.writer
+        writer.finish(exception is None)
+
+        # Tasks canceled by unload end after the plugin is gone
+        if self.jobs.closed:
+            return
+        self.tracker.resume(job.layer)
+        if writer.stats is not None:
+            self.report_statistics(writer.stats, job.name)
+        exception = exception or writer.error
+        self.update_action_state()
+
+        # Direct writes cannot be rolled back automatically
+        if exception and isinstance(writer, ProviderWriter) and writer.written:
+            self.iface.messageBar().pushMessage(
+                self.tr(
+                    "Rectanglify: {} features of {} were already written to the data "
+                    "source. Run Rectanglify again to resume, or use 'Revert Last "
+                    "Direct Write' to restore them."
+                ).format(writer.written, job.name),
+                level=Qgis.Warning,
+            )
 
         # Task is either canceled or another exception occured
         if exception:
 
             # If task is canceled, simply display a temporary info message
-            if self.task_rectanglify.isCanceled():
-                self.iface.messageBar().pushMessage(self.tr("Rectanglify canceled"))
+            if job.task.isCanceled():
+                self.iface.messageBar().pushMessage(
+                    self.tr("Rectanglify canceled on {}").format(job.name)
+                )
 
             # Else, display a warning message, and log exception in the Message log
             else:
@@ -280,19 +934,69 @@ class Rectanglify:
                     )
                 )
                 QgsMessageLog.logMessage(
-                    f"Exception during Rectanglify: {trace}",
+                    f"Exception during Rectanglify of {job.name}: {trace}",
                     "Rectanglify",
                     Qgis.Warning,
                 )
                 self.iface.messageBar().pushMessage(
-                    self.tr("Rectanglify failed. See message log for details."),
+                    self.tr(
+                        "Rectanglify failed on {}. See message log for details."
+                    ).format(job.name),
                     level=Qgis.Warning,
                 )
 
-        self.task_rectanglify = None
+        # Features already rectangular (or empty) were left untouched
+        elif writer.skipped:
+            self.iface.messageBar().pushMessage(
+                self.tr(
+                    "Rectanglify {}: {} features rectanglified, {} already "
+                    "rectangular or empty features skipped"
+                ).format(job.name, writer.changed, writer.skipped)
+            )
+
+        # Features changed during the run
+        self.tracker.timer.start()
+
+    def revert_direct_write(self):
+        """Restore the original geometries of the last direct write on the active
+        layer"""
+        from .backup import GeometryBackup
+        from .utils import revert_backup
+
+        layer: QgsVectorLayer = self.iface.activeLayer()
+        if self.jobs.busy(layer.id()):
+            self.iface.messageBar().pushMessage(
+                self.tr("Rectanglify is already running on {}").format(layer.name()),
+                level=Qgis.Warning,
+            )
+            return
+        backup = GeometryBackup(self.backup_path(layer))
+        if not backup.exists():
+            self.iface.messageBar().pushMessage(self.tr("Nothing to revert"))
+            return
+
+        revert_backup(layer, backup)
+        self.update_action_state()
+        self.iface.messageBar().pushMessage(self.tr("Direct write reverted"))
+
+    def update_angle_widgets(self):
+        """Only enable the settings of the selected angle mode"""
+        mode = ANGLE_MODES[self.dialog.ui.angleModeComboBox.currentIndex()]
+        self.dialog.ui.fixedAngleSpinBox.setEnabled(mode == "fixed")
+        self.dialog.ui.angleFieldLineEdit.setEnabled(mode == "attribute")
+        self.dialog.ui.radiusSpinBox.setEnabled(mode == "dominant")
 
     def open_settings(self):
         """Open the settings dialog"""
+        if self.dialog is None:
+            from .settingsdialog import Ui_SettingsDialog
+
+            self.dialog = QDialog(self.iface.mainWindow())
+            self.dialog.ui = Ui_SettingsDialog()
+            self.dialog.ui.setupUi(self.dialog)
+            self.dialog.ui.angleModeComboBox.currentIndexChanged.connect(
+                self.update_angle_widgets
+            )
 
         # Update Checkboxes from plugin settings
         self.dialog.ui.constantAreaCheckBox.setChecked(
@@ -304,6 +1008,45 @@ class Rectanglify:
         self.dialog.ui.sharedAxesCheckBox.setChecked(
             self.settings.value("ringsShareAxes", True, bool)
         )
+        self.dialog.ui.workersSpinBox.setValue(self.settings.value("workers", 1, int))
+        self.dialog.ui.concurrentLayersSpinBox.setValue(
+            self.settings.value("concurrentLayers", MAX_RUNNING, int)
+        )
+        self.dialog.ui.directWriteCheckBox.setChecked(
+            self.settings.value("directWrite", False, bool)
+        )
+        self.dialog.ui.spatialIndexCheckBox.setChecked(
+            self.settings.value("rebuildSpatialIndex", True, bool)
+        )
+        self.dialog.ui.analysisCacheCheckBox.setChecked(
+            self.settings.value("analysisCache", True, bool)
+        )
+        self.dialog.ui.autoCheckBox.setChecked(
+            self.settings.value("autoRectanglify", False, bool)
+        )
+        self.dialog.ui.skipCheckBox.setChecked(
+            self.settings.value("skipRectangles", True, bool)
+        )
+        self.dialog.ui.statisticsCheckBox.setChecked(
+            self.settings.value("collectStatistics", False, bool)
+        )
+        self.dialog.ui.areaToleranceSpinBox.setValue(
+            self.settings.value("areaTolerance", 0.0, float)
+        )
+        mode = self.settings.value("angleMode", "minimum", str)
+        self.dialog.ui.angleModeComboBox.setCurrentIndex(
+            ANGLE_MODES.index(mode) if mode in ANGLE_MODES else 0
+        )
+        self.dialog.ui.fixedAngleSpinBox.setValue(
+            self.settings.value("fixedAngle", 0.0, float)
+        )
+        self.dialog.ui.angleFieldLineEdit.setText(
+            self.settings.value("angleField", "", str)
+        )
+        self.dialog.ui.radiusSpinBox.setValue(
+            self.settings.value("neighborhoodRadius", 100.0, float)
+        )
+        self.update_angle_widgets()
 
         # If dialog is accepted (click on Ok button), update plugin settings
         if self.dialog.exec() == QDialog.Accepted:
@@ -316,3 +1059,45 @@ class Rectanglify:
             self.settings.setValue(
                 "ringsShareAxes", self.dialog.ui.sharedAxesCheckBox.isChecked()
             )
+            self.settings.setValue("workers", self.dialog.ui.workersSpinBox.value())
+            self.settings.setValue(
+                "concurrentLayers", self.dialog.ui.concurrentLayersSpinBox.value()
+            )
+            self.jobs.set_max_running(self.dialog.ui.concurrentLayersSpinBox.value())
+            self.settings.setValue(
+                "directWrite", self.dialog.ui.directWriteCheckBox.isChecked()
+            )
+            self.settings.setValue(
+                "rebuildSpatialIndex", self.dialog.ui.spatialIndexCheckBox.isChecked()
+            )
+            self.settings.setValue(
+                "analysisCache", self.dialog.ui.analysisCacheCheckBox.isChecked()
+            )
+            self.settings.setValue(
+                "autoRectanglify", self.dialog.ui.autoCheckBox.isChecked()
+            )
+            self.settings.setValue(
+                "skipRectangles", self.dialog.ui.skipCheckBox.isChecked()
+            )
+            self.settings.setValue(
+                "collectStatistics", self.dialog.ui.statisticsCheckBox.isChecked()
+            )
+            self.settings.setValue(
+                "areaTolerance", self.dialog.ui.areaToleranceSpinBox.value()
+            )
+            self.settings.setValue(
+                "angleMode",
+                ANGLE_MODES[self.dialog.ui.angleModeComboBox.currentIndex()],
+            )
+            self.settings.setValue(
+                "fixedAngle", self.dialog.ui.fixedAngleSpinBox.value()
+            )
+            self.settings.setValue(
+                "angleField", self.dialog.ui.angleFieldLineEdit.text()
+            )
+            self.settings.setValue(
+                "neighborhoodRadius", self.dialog.ui.radiusSpinBox.value()
+            )
+            self.update_action_state()
+            if self.preview is not None:
+                self.preview.reset()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Rectanglify Processing algorithm
+"""
+import os
+
+from PyQt5.QtCore import QCoreApplication
+from PyQt5.QtGui import QIcon
+
+from qgis.core import (
+    QgsFeatureRequest,
+    QgsFeatureSink,
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingFeatureSource,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterFeatureSource,
+    QgsWkbTypes,
+)
+
+
+class RectanglifyAlgorithm(QgsProcessingAlgorithm):
+    """Streams the features of a polygon source into a sink, replacing each geometry
+    by its rectanglified version"""
+
+    INPUT = "INPUT"
+    CONSTANT_AREA = "CONSTANT_AREA"
+    KEEP_RINGS = "KEEP_RINGS"
+    RINGS_SHARE_AXES = "RINGS_SHARE_AXES"
+    OUTPUT = "OUTPUT"
+
+    def tr(self, message):
+        """Get the translation for a string using Qt translation API."""
+        return QCoreApplication.translate("Rectanglify", message)
+
+    def createInstance(self):
+        """New instance of the algorithm"""
+        return RectanglifyAlgorithm()
+
+    def name(self):
+        """Unique algorithm name"""
+        return "rectanglify"
+
+    def displayName(self):
+        """Algorithm name, displayed in the Processing toolbox"""
+        return self.tr("Rectanglify")
+
+    def shortHelpString(self):
+        """Short help, displayed in the algorithm dialog"""
+        return self.tr(
+            "Replaces each feature's geometry by its minimum oriented bounding box"
+        )
+
+    def icon(self):
+        """Algorithm icon"""
+        return QIcon(os.path.join(os.path.dirname(__file__), "actionRectanglify.svg"))
+
+    def initAlgorithm(self, config=None):
+        """Declare the algorithm parameters"""
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.INPUT, self.tr("Input layer"), [QgsProcessing.TypeVectorPolygon],
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.CONSTANT_AREA, self.tr("Constant area"), defaultValue=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.KEEP_RINGS, self.tr("Keep rings"), defaultValue=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.RINGS_SHARE_AXES, self.tr("Rings share axes"), defaultValue=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(self.OUTPUT, self.tr("Rectanglified"))
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        """Rectanglify the source features chunk by chunk, and write them to the sink
+        as they are computed"""
+        # The geometry engine is only loaded when the algorithm runs
+        from .utils import CHUNK_SIZE, chunked, rectanglify_geometries
+
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(
+                self.invalidSourceError(parameters, self.INPUT)
+            )
+        constant_area = self.parameterAsBool(parameters, self.CONSTANT_AREA, context)
+        keep_rings = self.parameterAsBool(parameters, self.KEEP_RINGS, context)
+        rings_share_axes = self.parameterAsBool(
+            parameters, self.RINGS_SHARE_AXES, context
+        )
+
+        # Rectangles are always linear and 2D
+        wkb_type = QgsWkbTypes.linearType(QgsWkbTypes.flatType(source.wkbType()))
+        sink, dest_id = self.parameterAsSink(
+            parameters,
+            self.OUTPUT,
+            context,
+            source.fields(),
+            wkb_type,
+            source.sourceCrs(),
+        )
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        total = source.featureCount()
+        features = source.getFeatures(
+            QgsFeatureRequest(),
+            QgsProcessingFeatureSource.FlagSkipGeometryValidityChecks,
+        )
+        done = 0
+        for chunk in chunked(features, CHUNK_SIZE):
+            if feedback.isCanceled():
+                break
+
+            new_geoms = rectanglify_geometries(
+                [feat.geometry() for feat in chunk],
+                constant_area,
+                keep_rings,
+                rings_share_axes,
+            )
+            for feat, new_geom in zip(chunk, new_geoms):
+                feat.setGeometry(new_geom)
+            if not sink.addFeatures(chunk, QgsFeatureSink.FastInsert):
+                raise QgsProcessingException(
+                    self.writeFeatureError(sink, parameters, self.OUTPUT)
+                )
+
+            done += len(chunk)
+            if total > 0:
+                feedback.setProgress(done * 100 / total)
+
+        return {self.OUTPUT: dest_id}
@@ -11,7 +11,7 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 class Ui_SettingsDialog(object):
     def setupUi(self, SettingsDialog):
         SettingsDialog.setObjectName("SettingsDialog")
-        SettingsDialog.resize(232, 134)
+        SettingsDialog.resize(280, 475)
         self.verticalLayout = QtWidgets.QVBoxLayout(SettingsDialog)
         self.verticalLayout.setObjectName("verticalLayout")
         self.constantAreaCheckBox = QtWidgets.QCheckBox(SettingsDialog)
@@ -24,6 +24,101 @@ class Ui_SettingsDialog(object):
         self.sharedAxesCheckBox.setEnabled(False)
         self.sharedAxesCheckBox.setObjectName("sharedAxesCheckBox")
         self.verticalLayout.addWidget(self.sharedAxesCheckBox)
+        self.workersLayout = QtWidgets.QHBoxLayout()
+        self.workersLayout.setObjectName("workersLayout")
+        self.workersLabel = QtWidgets.QLabel(SettingsDialog)
+        self.workersLabel.setObjectName("workersLabel")
+        self.workersLayout.addWidget(self.workersLabel)
+        self.workersSpinBox = QtWidgets.QSpinBox(SettingsDialog)
+        self.workersSpinBox.setMinimum(1)
+        self.workersSpinBox.setMaximum(64)
+        self.workersSpinBox.setObjectName("workersSpinBox")
+        self.workersLayout.addWidget(self.workersSpinBox)
+        self.verticalLayout.addLayout(self.workersLayout)
+        self.concurrentLayersLayout = QtWidgets.QHBoxLayout()
+        self.concurrentLayersLayout.setObjectName("concurrentLayersLayout")
+        self.concurrentLayersLabel = QtWidgets.QLabel(SettingsDialog)
+        self.concurrentLayersLabel.setObjectName("concurrentLayersLabel")
+        self.concurrentLayersLayout.addWidget(self.concurrentLayersLabel)
+        self.concurrentLayersSpinBox = QtWidgets.QSpinBox(SettingsDialog)
+        self.concurrentLayersSpinBox.setMinimum(1)
+        self.concurrentLayersSpinBox.setMaximum(16)
+        self.concurrentLayersSpinBox.setObjectName("concurrentLayersSpinBox")
+        self.concurrentLayersLayout.addWidget(self.concurrentLayersSpinBox)
+        self.verticalLayout.addLayout(self.concurrentLayersLayout)
+        self.directWriteCheckBox = QtWidgets.QCheckBox(SettingsDialog)
+        self.directWriteCheckBox.setObjectName("directWriteCheckBox")
+        self.verticalLayout.addWidget(self.directWriteCheckBox)
+        self.spatialIndexCheckBox = QtWidgets.QCheckBox(SettingsDialog)
+        self.spatialIndexCheckBox.setEnabled(False)
+        self.spatialIndexCheckBox.setObjectName("spatialIndexCheckBox")
+        self.verticalLayout.addWidget(self.spatialIndexCheckBox)
+        self.analysisCacheCheckBox = QtWidgets.QCheckBox(SettingsDialog)
+        self.analysisCacheCheckBox.setObjectName("analysisCacheCheckBox")
+        self.verticalLayout.addWidget(self.analysisCacheCheckBox)
+        self.autoCheckBox = QtWidgets.QCheckBox(SettingsDialog)
+        self.autoCheckBox.setObjectName("autoCheckBox")
+        self.verticalLayout.addWidget(self.autoCheckBox)
+        self.skipCheckBox = QtWidgets.QCheckBox(SettingsDialog)
+        self.skipCheckBox.setObjectName("skipCheckBox")
+        self.verticalLayout.addWidget(self.skipCheckBox)
+        self.statisticsCheckBox = QtWidgets.QCheckBox(SettingsDialog)
+        self.statisticsCheckBox.setObjectName("statisticsCheckBox")
+        self.verticalLayout.addWidget(self.statisticsCheckBox)
+        self.areaToleranceLayout = QtWidgets.QHBoxLayout()
+        self.areaToleranceLayout.setObjectName("areaToleranceLayout")
+        self.areaToleranceLabel = QtWidgets.QLabel(SettingsDialog)
+        self.areaToleranceLabel.setObjectName("areaToleranceLabel")
+        self.areaToleranceLayout.addWidget(self.areaToleranceLabel)
+        self.areaToleranceSpinBox = QtWidgets.QDoubleSpinBox(SettingsDialog)
+        self.areaToleranceSpinBox.setMaximum(100.0)
+        self.areaToleranceSpinBox.setSingleStep(0.5)
+        self.areaToleranceSpinBox.setObjectName("areaToleranceSpinBox")
+        self.areaToleranceLayout.addWidget(self.areaToleranceSpinBox)
+        self.verticalLayout.addLayout(self.areaToleranceLayout)
+        self.angleModeLayout = QtWidgets.QHBoxLayout()
+        self.angleModeLayout.setObjectName("angleModeLayout")
+        self.angleModeLabel = QtWidgets.QLabel(SettingsDialog)
+        self.angleModeLabel.setObjectName("angleModeLabel")
+        self.angleModeLayout.addWidget(self.angleModeLabel)
+        self.angleModeComboBox = QtWidgets.QComboBox(SettingsDialog)
+        self.angleModeComboBox.setObjectName("angleModeComboBox")
+        self.angleModeComboBox.addItem("")
+        self.angleModeComboBox.addItem("")
+        self.angleModeComboBox.addItem("")
+        self.angleModeComboBox.addItem("")
+        self.angleModeLayout.addWidget(self.angleModeComboBox)
+        self.verticalLayout.addLayout(self.angleModeLayout)
+        self.fixedAngleLayout = QtWidgets.QHBoxLayout()
+        self.fixedAngleLayout.setObjectName("fixedAngleLayout")
+        self.fixedAngleLabel = QtWidgets.QLabel(SettingsDialog)
+        self.fixedAngleLabel.setObjectName("fixedAngleLabel")
+        self.fixedAngleLayout.addWidget(self.fixedAngleLabel)
+        self.fixedAngleSpinBox = QtWidgets.QDoubleSpinBox(SettingsDialog)
+        self.fixedAngleSpinBox.setMinimum(-180.0)
+        self.fixedAngleSpinBox.setMaximum(180.0)
+        self.fixedAngleSpinBox.setObjectName("fixedAngleSpinBox")
+        self.fixedAngleLayout.addWidget(self.fixedAngleSpinBox)
+        self.verticalLayout.addLayout(self.fixedAngleLayout)
+        self.angleFieldLayout = QtWidgets.QHBoxLayout()
+        self.angleFieldLayout.setObjectName("angleFieldLayout")
+        self.angleFieldLabel = QtWidgets.QLabel(SettingsDialog)
+        self.angleFieldLabel.setObjectName("angleFieldLabel")
+        self.angleFieldLayout.addWidget(self.angleFieldLabel)
+        self.angleFieldLineEdit = QtWidgets.QLineEdit(SettingsDialog)
+        self.angleFieldLineEdit.setObjectName("angleFieldLineEdit")
+        self.angleFieldLayout.addWidget(self.angleFieldLineEdit)
+        self.verticalLayout.addLayout(self.angleFieldLayout)
+        self.radiusLayout = QtWidgets.QHBoxLayout()
+        self.radiusLayout.setObjectName("radiusLayout")
+        self.radiusLabel = QtWidgets.QLabel(SettingsDialog)
+        self.radiusLabel.setObjectName("radiusLabel")
+        self.radiusLayout.addWidget(self.radiusLabel)
+        self.radiusSpinBox = QtWidgets.QDoubleSpinBox(SettingsDialog)
+        self.radiusSpinBox.setMaximum(1000000000.0)
+        self.radiusSpinBox.setObjectName("radiusSpinBox")
+        self.radiusLayout.addWidget(self.radiusSpinBox)
+        self.verticalLayout.addLayout(self.radiusLayout)
         spacerItem = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
         self.verticalLayout.addItem(spacerItem)
         self.horizontalLayout = QtWidgets.QHBoxLayout()
@@ -42,6 +137,7 @@ class Ui_SettingsDialog(object):
         self.okButton.clicked.connect(SettingsDialog.accept)
         self.cancelButton.clicked.connect(SettingsDialog.reject)
         self.keepRingsCheckBox.toggled['bool'].connect(self.sharedAxesCheckBox.setEnabled)
+        self.directWriteCheckBox.toggled['bool'].connect(self.spatialIndexCheckBox.setEnabled)
         QtCore.QMetaObject.connectSlotsByName(SettingsDialog)
 
     def retranslateUi(self, SettingsDialog):
@@ -53,6 +149,36 @@ class Ui_SettingsDialog(object):
         self.keepRingsCheckBox.setText(_translate("SettingsDialog", "Keep rings"))
         self.sharedAxesCheckBox.setToolTip(_translate("SettingsDialog", "If enabled, the rings will have the same orientation as the outer polygon"))
         self.sharedAxesCheckBox.setText(_translate("SettingsDialog", "Rings share axes"))
+        self.workersLabel.setToolTip(_translate("SettingsDialog", "Number of processes computing the rectangles. If 1, rectanglify runs in a single background thread"))
+        self.workersLabel.setText(_translate("SettingsDialog", "Parallel workers"))
+        self.concurrentLayersLabel.setToolTip(_translate("SettingsDialog", "Maximum number of layers rectanglified at the same time. The other runs are queued"))
+        self.concurrentLayersLabel.setText(_translate("SettingsDialog", "Concurrent layers"))
+        self.directWriteCheckBox.setToolTip(_translate("SettingsDialog", "If enabled, rectanglify writes the geometries straight to the data source, bypassing the edit buffer and the undo stack. The original geometries are saved, so that the last run can be reverted from the plugin menu"))
+        self.directWriteCheckBox.setText(_translate("SettingsDialog", "Write directly to the data source"))
+        self.spatialIndexCheckBox.setToolTip(_translate("SettingsDialog", "If enabled, the data source spatial index is rebuilt once all the geometries are written"))
+        self.spatialIndexCheckBox.setText(_translate("SettingsDialog", "Rebuild spatial index"))
+        self.analysisCacheCheckBox.setToolTip(_translate("SettingsDialog", "If enabled, the minimum bounding boxes are cached on disk, so that re-running on unchanged geometries skips their computation"))
+        self.analysisCacheCheckBox.setText(_translate("SettingsDialog", "Cache bounding box analysis"))
+        self.autoCheckBox.setToolTip(_translate("SettingsDialog", "If enabled, features added or modified in a layer in edition are rectanglified as soon as they are edited"))
+        self.autoCheckBox.setText(_translate("SettingsDialog", "Rectanglify features as they are edited"))
+        self.skipCheckBox.setToolTip(_translate("SettingsDialog", "If enabled, features which are already rectangles are neither computed nor written, which keeps the edit buffer and the undo stack small"))
+        self.skipCheckBox.setText(_translate("SettingsDialog", "Skip already rectangular features"))
+        self.statisticsCheckBox.setToolTip(_translate("SettingsDialog", "If enabled, the time spent in each stage of a run is measured. Throughput and ETA are shown in the status bar, and a summary is written to the message log"))
+        self.statisticsCheckBox.setText(_translate("SettingsDialog", "Collect run statistics"))
+        self.areaToleranceLabel.setToolTip(_translate("SettingsDialog", "If above 0, the minimum bounding boxes of dense polygons are approximated, their area being guaranteed to be within this percentage of the exact minimum. Approximate boxes are not cached"))
+        self.areaToleranceLabel.setText(_translate("SettingsDialog", "Bounding box area tolerance (%)"))
+        self.angleModeLabel.setToolTip(_translate("SettingsDialog", "Orientation of the rectangles. The minimum bounding box is searched for the features without an angle"))
+        self.angleModeLabel.setText(_translate("SettingsDialog", "Angle"))
+        self.angleModeComboBox.setItemText(0, _translate("SettingsDialog", "Minimum bounding box"))
+        self.angleModeComboBox.setItemText(1, _translate("SettingsDialog", "Fixed angle"))
+        self.angleModeComboBox.setItemText(2, _translate("SettingsDialog", "Angle field"))
+        self.angleModeComboBox.setItemText(3, _translate("SettingsDialog", "Dominant neighborhood orientation"))
+        self.fixedAngleLabel.setToolTip(_translate("SettingsDialog", "Angle of all the rectangles, in degrees counter-clockwise from the x axis"))
+        self.fixedAngleLabel.setText(_translate("SettingsDialog", "Fixed angle"))
+        self.angleFieldLabel.setToolTip(_translate("SettingsDialog", "Field holding the angle of each feature, in degrees counter-clockwise from the x axis"))
+        self.angleFieldLabel.setText(_translate("SettingsDialog", "Angle field"))
+        self.radiusLabel.setToolTip(_translate("SettingsDialog", "Radius, in layer units, of the neighborhood whose dominant edge orientation is used"))
+        self.radiusLabel.setText(_translate("SettingsDialog", "Neighborhood radius"))
         self.okButton.setText(_translate("SettingsDialog", "Ok"))
         self.cancelButton.setText(_translate("SettingsDialog", "Cancel"))
 
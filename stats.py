@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Run statistics of the rectanglify plugin: wall time per stage, feature and vertex
+counts, slowest features, throughput and ETA. QGIS independent, and safe to update
+from the task thread and the main thread.
+"""
+import contextlib
+import heapq
+import json
+import threading
+import time
+
+# Number of slowest features kept
+SLOWEST = 5
+
+
+class RunStats:
+    """
+    Accumulates the statistics of a run. Stages timed in worker processes (see
+    core.rectanglify_job) are summed over the workers, so that with several workers
+    the total of the stages may exceed the run wall time.
+
+    Chunks are computed as batches, so the time of a feature is estimated as its
+    share of the vertices of its chunk.
+    """
+
+    def __init__(self, total=0):
+        """Constructor. The run clock starts now.
+
+        Args:
+            total (int, optional): Number of features of the run. Defaults to 0.
+        """
+        self.total = total
+        self.start = time.perf_counter()
+        self.end = None
+        self.stages = {}
+        self.features = 0
+        self.vertices = 0
+        self.chunks = 0
+        self.slowest = []
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Add the wall time of a block to a stage
+
+        Args:
+            name (str): Stage name
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add({name: time.perf_counter() - start})
+
+    def add(self, profile):
+        """Add a profile to the stages
+
+        Args:
+            profile (dict): Seconds spent in each stage. A vertices entry is added
+                to the vertex count.
+        """
+        with self.lock:
+            for name, value in profile.items():
+                if name == "vertices":
+                    self.vertices += value
+                else:
+                    self.stages[name] = self.stages.get(name, 0.0) + value
+
+    def chunk(self, fids, seconds, vertices=None):
+        """Record a computed chunk
+
+        Args:
+            fids (list): Feature ids of the chunk
+            seconds (float): Time spent computing the chunk
+            vertices (list, optional): Number of vertices of each feature. Defaults
+                to None, the features then being given the same time.
+        """
+        if vertices is None:
+            vertices = [1] * len(fids)
+        total = sum(vertices) or 1
+        slowest = heapq.nlargest(SLOWEST, zip(vertices, fids))
+        with self.lock:
+            self.features += len(fids)
+            self.chunks += 1
+            for count, fid in slowest:
+                entry = (seconds * count / total, count, fid)
+                if len(self.slowest) < SLOWEST:
+                    heapq.heappush(self.slowest, entry)
+                else:
+                    heapq.heappushpop(self.slowest, entry)
+
+    def finish(self):
+        """Stop the run clock"""
+        self.end = time.perf_counter()
+
+    def elapsed(self):
+        """Wall time of the run
+
+        Returns:
+            float: Seconds since the start, or until the end of the run
+        """
+        return (self.end or time.perf_counter()) - self.start
+
+    def throughput(self):
+        """Features computed per second
+
+        Returns:
+            float: Throughput
+        """
+        elapsed = self.elapsed()
+        return self.features / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        """Estimated time left
+
+        Returns:
+            float: Seconds left, or None while unknown
+        """
+        throughput = self.throughput()
+        if not throughput or not self.total:
+            return None
+        return max(self.total - self.features, 0) / throughput
+
+    def status(self):
+        """One line progress status
+
+        Returns:
+            str: Throughput and ETA
+        """
+        eta = self.eta()
+        return "{}/{} features, {:.0f} features/s, ETA {}".format(
+            self.features,
+            self.total,
+            self.throughput(),
+            "?" if eta is None else "{:.0f} s".format(eta),
+        )
+
+    def summary(self):
+        """Statistics of the run
+
+        Returns:
+            dict: JSON serializable summary
+        """
+        with self.lock:
+            return {
+                "seconds": self.elapsed(),
+                "features": self.features,
+                "vertices": self.vertices,
+                "chunks": self.chunks,
+                "features_per_second": self.throughput(),
+                "stages": dict(sorted(self.stages.items(), key=lambda item: -item[1])),
+                "slowest_features": [
+                    {"fid": fid, "vertices": vertices, "seconds": seconds}
+                    for seconds, vertices, fid in sorted(self.slowest, reverse=True)
+                ],
+            }
+
+    def report(self):
+        """Human readable summary
+
+        Returns:
+            str: Summary
+        """
+        summary = self.summary()
+        lines = [
+            "{features} features, {vertices} vertices in {seconds:.2f} s "
+            "({features_per_second:.0f} features/s)".format(**summary)
+        ]
+        lines += [
+            "  {}: {:.3f} s".format(name, seconds)
+            for name, seconds in summary["stages"].items()
+        ]
+        lines += [
+            "  Slow feature {fid}: {vertices} vertices, about {seconds:.3f} s".format(
+                **feature
+            )
+            for feature in summary["slowest_features"]
+        ]
+        return "\n".join(lines)
+
+    def write(self, path):
+        """Write the summary to a JSON file
+
+        Args:
+            path (str): Output path
+        """
+        with open(path, "w") as file:
+            json.dump(self.summary(), file, indent=2)
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Trackers of the layers state for the rectanglify plugin. They only depend on Qt
+and qgis.core, so that the plugin can create them at startup without loading the
+geometry engine.
+"""
+import functools
+
+from PyQt5.QtCore import QTimer
+
+from qgis.core import QgsVectorLayer, QgsWkbTypes
+
+
+class ChangeTracker:
+    """
+    Keeps the ids of the features added or whose geometry changed in the edit buffer
+    of polygon layers, so that only those are rectanglified. Bursts of changes are
+    coalesced into a single callback, run from the event loop.
+
+    Only the changes made inside an edit command are tracked: undo and redo, which
+    replay commands, must not make features dirty again.
+    """
+
+    def __init__(self, callback, delay=0):
+        """Constructor. Must be called from the main thread.
+
+        Args:
+            callback (callable): Called without arguments after changes
+            delay (int, optional): Delay in milliseconds between the last change and
+                the callback. Defaults to 0.
+        """
+        self.dirty = {}
+        self.commands = {}
+        self.paused = {}
+        self.connections = {}
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(callback)
+
+    def connect_layer(self, layer):
+        """Track the changes of a layer
+
+        Args:
+            layer (QgsVectorLayer): Layer
+        """
+        if layer.id() in self.connections:
+            return
+        layer_id = layer.id()
+        connections = [
+            (
+                layer.editCommandStarted,
+                functools.partial(self.begin_command, layer_id),
+            ),
+            (layer.editCommandEnded, functools.partial(self.end_command, layer_id)),
+            (
+                layer.editCommandDestroyed,
+                functools.partial(self.commands.pop, layer_id, None),
+            ),
+            (layer.featureAdded, functools.partial(self.mark, layer_id)),
+            (layer.geometryChanged, lambda fid, geometry: self.mark(layer_id, fid),),
+            (layer.featureDeleted, functools.partial(self.discard, layer_id)),
+            # Added features ids change on commit, and rolled back features are gone
+            (layer.editingStopped, functools.partial(self.clear, layer_id)),
+        ]
+        for signal, slot in connections:
+            signal.connect(slot)
+        self.connections[layer_id] = connections
+
+    def disconnect_layer(self, layer):
+        """Stop tracking the changes of a layer
+
+        Args:
+            layer (QgsVectorLayer): Layer
+        """
+        for signal, slot in self.connections.pop(layer.id(), []):
+            signal.disconnect(slot)
+        self.clear(layer.id())
+
+    def begin_command(self, layer_id, text=None):
+        """Start recording the changes of an edit command"""
+        self.commands[layer_id] = set()
+
+    def mark(self, layer_id, fid):
+        """Mark a feature as changed by the current edit command, unless the change
+        is ignored by the pause of the layer"""
+        if layer_id not in self.commands:
+            return
+        if layer_id in self.paused:
+            writing = self.paused[layer_id]
+            if writing is None or writing():
+                return
+        self.commands[layer_id].add(fid)
+
+    def end_command(self, layer_id):
+        """Mark the features changed by an edit command as dirty"""
+        fids = self.commands.pop(layer_id, None)
+        if fids:
+            self.dirty.setdefault(layer_id, set()).update(fids)
+            self.timer.start()
+
+    def discard(self, layer_id, fid):
+        """Forget a deleted feature"""
+        self.commands.get(layer_id, set()).discard(fid)
+        self.dirty.get(layer_id, set()).discard(fid)
+
+    def clear(self, layer_id):
+        """Forget all the changes of a layer"""
+        self.dirty.pop(layer_id, None)
+        self.timer.start()
+
+    def pause(self, layer, writing=None):
+        """Ignore the changes of a layer, typically while rectanglify writes to it
+
+        Args:
+            layer (QgsVectorLayer): Layer
+            writing (callable, optional): Called without arguments on each change,
+                which is only ignored if it returns True, e.g. while a writer
+                applies its results. Defaults to None, all the changes being
+                ignored.
+        """
+        self.paused[layer.id()] = writing
+
+    def resume(self, layer):
+        """Track the changes of a layer again
+
+        Args:
+            layer (QgsVectorLayer): Layer
+        """
+        self.paused.pop(layer.id(), None)
+
+    def count(self, layer):
+        """Number of changed features of a layer
+
+        Args:
+            layer (QgsVectorLayer): Layer
+
+        Returns:
+            int: Number of changed features
+        """
+        return len(self.dirty.get(layer.id(), ()))
+
+    def layer_ids(self):
+        """Ids of the layers with changed features
+
+        Returns:
+            list: Layer ids
+        """
+        return [layer_id for layer_id, fids in self.dirty.items() if fids]
+
+    def take(self, layer):
+        """Pop the changed features of a layer
+
+        Args:
+            layer (QgsVectorLayer): Layer
+
+        Returns:
+            list: Feature ids
+        """
+        return sorted(self.dirty.pop(layer.id(), ()))
+
+
+class ActiveLayerTracker:
+    """
+    Follows the editing and selection state of the active layer only. Bursts of
+    signals (e.g. a rubber band selection) are coalesced into a single callback, and
+    the feature count, which may need a query on remote layers, is cached until the
+    layer features change.
+    """
+
+    def __init__(self, callback, delay=50):
+        """Constructor. Must be called from the main thread.
+
+        Args:
+            callback (callable): Called without arguments after state changes
+            delay (int, optional): Delay in milliseconds between the last signal and
+                the callback. Defaults to 50.
+        """
+        self.layer = None
+        self.counts = {}
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(callback)
+
+    def signals(self, layer):
+        """Signals of a layer and their slots
+
+        Args:
+            layer (QgsVectorLayer): Layer
+
+        Returns:
+            list: (signal, slot) pairs
+        """
+        return [
+            (layer.editingStarted, self.schedule),
+            (layer.editingStopped, self.invalidate),
+            (layer.selectionChanged, self.schedule),
+            (layer.featureAdded, self.invalidate),
+            (layer.featureDeleted, self.invalidate),
+            (layer.dataSourceChanged, self.invalidate),
+        ]
+
+    def set_layer(self, layer):
+        """Follow a new active layer
+
+        Args:
+            layer (QgsMapLayer): Active layer, may be None or not a polygon layer
+        """
+        if self.layer is not None:
+            try:
+                for signal, slot in self.signals(self.layer):
+                    signal.disconnect(slot)
+            except (RuntimeError, TypeError):
+                # The layer was already deleted
+                pass
+        self.layer = None
+        if (
+            isinstance(layer, QgsVectorLayer)
+            and layer.geometryType() == QgsWkbTypes.PolygonGeometry
+        ):
+            self.layer = layer
+            for signal, slot in self.signals(layer):
+                signal.connect(slot)
+        self.schedule()
+
+    def schedule(self, *args):
+        """Run the callback once the signals burst is over"""
+        self.timer.start()
+
+    def invalidate(self, *args):
+        """Forget the feature count of the active layer, and schedule the callback"""
+        if self.layer is not None:
+            self.counts.pop(self.layer.id(), None)
+        self.schedule()
+
+    def feature_count(self, layer):
+        """Cached feature count of a layer
+
+        Args:
+            layer (QgsVectorLayer): Layer
+
+        Returns:
+            int: Number of features
+        """
+        if layer is not self.layer:
+            return layer.featureCount()
+        if layer.id() not in self.counts:
+            self.counts[layer.id()] = layer.featureCount()
+        return self.counts[layer.id()]
+
+    def stop(self):
+        """Disconnect from the active layer"""
+        self.set_layer(None)
+        self.timer.stop()
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+Compact undo of the runs applied to the edit buffer. A regular run is one edit
+command holding a QgsGeometry change command per feature. Instead, the changes of a
+run are journaled by blocks: the new geometries, made of rectangles, as five doubles
+per ring, and the original geometries as compressed WKB. The journal is replayed by
+a single command of the layer undo stack, and large journals spill to a temporary
+file.
+"""
+import pickle
+import tempfile
+import zlib
+
+import numpy as np
+
+from PyQt5.QtWidgets import QUndoCommand
+
+from qgis.core import QgsVectorLayerUndoCommandChangeGeometry
+
+from .core import read_wkb, rectangle_parameters, write_wkb
+from .utils import GeometryWriter, geometry_wkb, wkb_geometry
+
+# Blocks are kept in memory up to this number of bytes, then written to a temporary
+# file
+SPILL_SIZE = 64 * 1024 * 1024
+
+
+def compress_blobs(blobs):
+    """Compress WKB blobs together
+
+    Args:
+        blobs (list): WKB blobs (bytes)
+
+    Returns:
+        (bytes, numpy.ndarray): Compressed blobs and their offsets
+    """
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    np.cumsum([len(blob) for blob in blobs], out=offsets[1:])
+    # The fastest level: blocks are compressed while the run goes on
+    return zlib.compress(b"".join(blobs), 1), offsets
+
+
+def decompress_blobs(data, offsets):
+    """Inverse of compress_blobs
+
+    Args:
+        data (bytes): Compressed blobs
+        offsets (numpy.ndarray): Blob offsets
+
+    Returns:
+        list: WKB blobs (bytes)
+    """
+    data = zlib.decompress(data)
+    return [
+        data[start:end]
+        for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())
+    ]
+
+
+def encode_block(fids, new_blobs, original_blobs):
+    """Encode the changes of a batch. New geometries whose rings are all rectangles
+    are kept as write_wkb arguments, the other ones as compressed WKB.
+
+    Args:
+        fids (list): Feature ids
+        new_blobs (list): WKB of the new geometries
+        original_blobs (list): WKB of the original geometries
+
+    Returns:
+        tuple: Block, see decode_block
+    """
+    coords, ring_offsets, polygon_offsets, part_offsets, multi = read_wkb(new_blobs)
+    if np.all(np.diff(ring_offsets) == 5):
+        new = (
+            rectangle_parameters(coords, ring_offsets, polygon_offsets),
+            polygon_offsets.astype(np.int32),
+            part_offsets.astype(np.int32),
+            multi,
+        )
+    else:
+        new = compress_blobs(new_blobs)
+    return np.asarray(fids, dtype=np.int64), new, compress_blobs(original_blobs)
+
+
+def decode_block(block):
+    """Decode a block of changes
+
+    Args:
+        block (tuple): Block, see encode_block
+
+    Returns:
+        (list, list, list): Feature ids, WKB of the new geometries and WKB of the
+            original geometries
+    """
+    fids, new, originals = block
+    new_blobs = write_wkb(*new) if len(new) == 4 else decompress_blobs(*new)
+    return fids.tolist(), new_blobs, decompress_blobs(*originals)
+
+
+def block_size(block):
+    """Approximate memory size of a block
+
+    Args:
+        block (tuple): Block, see encode_block
+
+    Returns:
+        int: Number of bytes
+    """
+    fids, new, originals = block
+    return sum(
+        value.nbytes if isinstance(value, np.ndarray) else len(value)
+        for value in (fids,) + new + originals
+    )
+
+
+class ChangeJournal:
+    """
+    Append only list of the blocks of changes of a run. Blocks are kept in memory
+    until they take spill_size bytes, the following ones are written to a temporary
+    file, deleted when the journal is closed or garbage collected.
+    """
+
+    def __init__(self, spill_size=SPILL_SIZE):
+        """Constructor
+
+        Args:
+            spill_size (int, optional): Maximum number of bytes kept in memory.
+                Defaults to SPILL_SIZE.
+        """
+        self.spill_size = spill_size
+        self.size = 0
+        self.blocks = []
+        self.file = None
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def append(self, block):
+        """Add a block
+
+        Args:
+            block (tuple): Block, see encode_block
+        """
+        size = block_size(block)
+        if self.size + size <= self.spill_size:
+            self.size += size
+            self.blocks.append(block)
+            return
+        if self.file is None:
+            self.file = tempfile.TemporaryFile(prefix="rectanglify_undo_")
+        self.file.seek(0, 2)
+        start = self.file.tell()
+        pickle.dump(block, self.file, pickle.HIGHEST_PROTOCOL)
+        self.blocks.append((start, self.file.tell() - start))
+
+    def read(self, reverse=False):
+        """Iterate over the decoded blocks
+
+        Args:
+            reverse (bool, optional): Start from the last block. Defaults to False.
+
+        Yields:
+            (list, list, list): See decode_block
+        """
+        for block in reversed(self.blocks) if reverse else self.blocks:
+            if len(block) == 2:
+                start, size = block
+                self.file.seek(start)
+                block = pickle.loads(self.file.read(size))
+            yield decode_block(block)
+
+    def close(self):
+        """Drop the blocks, and delete the temporary file"""
+        self.blocks = []
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def change_geometries(layer, fids, geometries, created=None):
+    """Change geometries in the edit buffer of a layer, without adding commands to
+    its undo stack
+
+    Args:
+        layer (QgsVectorLayer): Layer in edition
+        fids (list): Feature ids
+        geometries (list): New geometries (QgsGeometry)
+        created (list, optional): If given, the (fid, command) pairs of the features
+            of the provider whose geometry was not changed yet are appended to it:
+            undoing their command removes them from the changed geometries of the
+            edit buffer. Defaults to None.
+    """
+    buffer = layer.editBuffer()
+    if buffer is None:
+        raise Exception("{} is not in edition".format(layer.name()))
+    for fid, geometry in zip(fids, geometries):
+        command = QgsVectorLayerUndoCommandChangeGeometry(buffer, fid, geometry)
+        # Added features have negative ids
+        if (
+            created is not None
+            and fid >= 0
+            and not buffer.isFeatureGeometryChanged(fid)
+        ):
+            created.append((fid, command))
+        command.redo()
+    layer.updateExtents()
+    layer.triggerRepaint()
+
+
+class CompactUndoCommand(QUndoCommand):
+    """
+    Undo command replaying the journal of a run. It is pushed once the run is
+    applied, so its first redo does nothing.
+
+    Undoing restores the original geometries as changed geometries of the edit
+    buffer: saving the layer then writes them back unchanged.
+    """
+
+    def __init__(self, layer, text, journal):
+        """Constructor
+
+        Args:
+            layer (QgsVectorLayer): Edited layer
+            text (str): Name of the command
+            journal (ChangeJournal): Changes of the run, already applied
+        """
+        super().__init__(text)
+        self.layer = layer
+        self.journal = journal
+        self.applied = True
+
+    def redo(self):
+        """Apply the new geometries"""
+        if not self.applied:
+            for fids, new_blobs, _ in self.journal.read():
+                change_geometries(self.layer, fids, map(wkb_geometry, new_blobs))
+        self.applied = True
+
+    def undo(self):
+        """Restore the original geometries"""
+        for fids, _, original_blobs in self.journal.read(reverse=True):
+            change_geometries(self.layer, fids, map(wkb_geometry, original_blobs))
+        self.applied = False
+
+
+class CompactGeometryWriter(GeometryWriter):
+    """
+    Applies geometries to the edit buffer of a layer like GeometryWriter, but journals
+    them in a ChangeJournal instead of recording an undo command per feature. The
+    whole run is pushed as a single CompactUndoCommand when it finishes.
+
+    Until then, the change commands of the features whose geometry was not changed
+    before are kept, so that a canceled or failed run leaves them out of the edit
+    buffer, as a destroyed edit command would.
+    """
+
+    def __init__(
+        self,
+        layer,
+        command_name,
+        max_pending=8,
+        interval=100,
+        stats=None,
+        spill_size=SPILL_SIZE,
+    ):
+        """Constructor. Must be called from the main thread.
+
+        Args:
+            layer, command_name, max_pending, interval, stats: See GeometryWriter
+            spill_size (int, optional): See ChangeJournal. Defaults to SPILL_SIZE.
+        """
+        super().__init__(layer, command_name, max_pending, interval, stats)
+        self.command_name = command_name
+        self.journal = ChangeJournal(spill_size)
+        self.created = []
+
+    def start(self):
+        """Start the periodic application of results"""
+        self.timer.start()
+
+    def prepare(self, features, geometries):
+        """Build the queued batch, including the encoded block of changes"""
+        changed = [
+            (feat, geometry)
+            for feat, geometry in zip(features, geometries)
+            if geometry is not None
+        ]
+        self.changed += len(changed)
+        self.skipped += len(features) - len(changed)
+        fids = [feat.id() for feat, _ in changed]
+        new_geometries = [geometry for _, geometry in changed]
+        # The originals keep their curves, only the computation is segmentized
+        block = encode_block(
+            fids,
+            [geometry_wkb(geometry) for geometry in new_geometries],
+            [bytes(feat.geometry().asWkb()) for feat, _ in changed],
+        )
+        return fids, new_geometries, block
+
+    def apply(self, fids, geometries, block):
+        """Apply the new geometries, and journal them"""
+        if fids:
+            change_geometries(self.layer, fids, geometries, self.created)
+            self.journal.append(block)
+
+    def finish(self, success=True):
+        """Apply the remaining results and push the undo command of the run. On
+        failure, the applied results are reverted instead."""
+        self.timer.stop()
+        if success:
+            self.flush()
+        if success and self.error is None:
+            if len(self.journal):
+                self.layer.undoStack().push(
+                    CompactUndoCommand(self.layer, self.command_name, self.journal)
+                )
+        else:
+            self.rollback()
+            self.journal.close()
+        self.created = []
+
+    def rollback(self):
+        """Revert the applied results. The features whose geometry was not changed
+        before the run are removed from the changed geometries of the edit buffer,
+        the other ones get their previous geometry back."""
+        for _, command in reversed(self.created):
+            command.undo()
+        created = {fid for fid, _ in self.created}
+        for fids, _, original_blobs in self.journal.read(reverse=True):
+            changed = [
+                (fid, wkb_geometry(blob))
+                for fid, blob in zip(fids, original_blobs)
+                if fid not in created
+            ]
+            if changed:
+                change_geometries(self.layer, *zip(*changed))
+        self.layer.updateExtents()
+        self.layer.triggerRepaint()
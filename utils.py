@@ -1,18 +1,83 @@
 # -*- coding: utf-8 -*-
 """
 Utilities functions for the rectanglify plugin
+
+The geometry computations are done by the QGIS independent core module, the
+functions below only convert QgsGeometry from and to WKB.
 """
-import math
+import collections
+import contextlib
+import functools
+import itertools
+import queue
+import threading
+
+import numpy as np
 
-from PyQt5.QtGui import QTransform
+from PyQt5.QtCore import QTimer
 
 from qgis.core import (
+    Qgis,
+    QgsFeatureRequest,
+    QgsRectangle,
+    QgsSpatialIndex,
+    QgsVectorDataProvider,
     QgsVectorLayer,
     QgsGeometry,
-    QgsPointXY,
-    QgsGeometryUtils,
+    QgsWkbTypes,
 )
 
+from .core import (
+    ORIENTATION_BINS,
+    convex_hull,
+    dominant_angles,
+    minimum_bounding_boxes,
+    orientation_histograms,
+    oriented_bounding_boxes,
+    python_bounding_box,
+    python_rectangle_parameters,
+    read_wkb,
+    rectangle_wkb,
+    rectanglify_job,
+    rectanglify_wkb,
+    wkb_points,
+    write_wkb,
+)
+from .cache import geometry_key
+from .parallel import ordered_map
+
+# Number of features rectanglified in a single batch
+CHUNK_SIZE = 1000
+
+# Minimum bounding box engines: QgsGeometry.orientedMinimumBoundingBox, the numpy
+# core, or its pure Python search
+BACKEND_NATIVE = "native"
+BACKEND_VECTORIZED = "vectorized"
+BACKEND_PYTHON = "python"
+
+# First QGIS version whose orientedMinimumBoundingBox is exact
+# (https://github.com/qgis/QGIS/pull/34334)
+NATIVE_MINIMUM_VERSION = 31200
+
+# Up to this number of vertices, the pure Python search of a single geometry is
+# faster than the numpy one (see benchmarks/backends.py)
+PYTHON_MAX_VERTICES = 256
+
+# From this number of vertices, the runs in the current thread search the minimum
+# bounding boxes with the native engine instead of the numpy batch
+NATIVE_MIN_VERTICES = 256
+
+# Number of edge orientation histograms kept by the dominant angle mode, of 720
+# bytes each
+HISTOGRAM_CACHE_SIZE = 50000
+
+# Angle modes: search the minimum bounding box, or use a fixed angle, the angle read
+# from a field, or the dominant edge orientation of the neighborhood
+ANGLE_MINIMUM = "minimum"
+ANGLE_FIXED = "fixed"
+ANGLE_ATTRIBUTE = "attribute"
+ANGLE_DOMINANT = "dominant"
+
 
 class BeginCommand:
     """
@@ -24,96 +89,844 @@ class BeginCommand:
         self.command_name = command_name
 
     def __enter__(self):
+        self.begin()
+
+    def __exit__(self, exception_type, value, traceback):
+        self.end(exception_type is None)
+
+    def begin(self):
+        """Start the edit command, starting layer edition if needed"""
         if not self.layer.isEditable():
             self.layer.startEditing()
         self.layer.beginEditCommand(self.command_name)
 
-    def __exit__(self, exception_type, value, traceback):
-        if exception_type is not None:
+    def end(self, success=True):
+        """End the edit command, or destroy it (reverting its changes) on failure"""
+        if not success:
             self.layer.destroyEditCommand()
         else:
             self.layer.endEditCommand()
         self.layer.triggerRepaint()
 
 
-def oriented_bounding_box(geometry, angle=0):
-    """Compute the oriented bounding box of the geometry at a given angle
+class GeometryWriter:
+    """
+    Applies geometries computed in a background thread to a layer, from the main
+    thread. Results are queued by the worker thread, and applied by batches inside a
+    single edit command, so that a whole run is a single undo entry. The applying
+    attribute is True while a batch is applied, so that its changes can be told from
+    the other changes of the layer.
+    """
+
+    def __init__(self, layer, command_name, max_pending=8, interval=100, stats=None):
+        """Constructor. Must be called from the main thread.
+
+        Args:
+            layer (QgsVectorLayer): Edited layer
+            command_name (str): Name of the edit command
+            max_pending (int, optional): Maximum number of queued batches. Workers
+                wait when it is reached, which bounds the memory use. Defaults to 8.
+            interval (int, optional): Delay between two batches applications, in
+                milliseconds. Defaults to 100.
+            stats (RunStats, optional): If given, the batches applications are
+                timed in its write stage. Defaults to None.
+        """
+        self.layer: QgsVectorLayer = layer
+        self.command = BeginCommand(layer, command_name)
+        self.queue = queue.Queue(max_pending)
+        self.stats = stats
+        self.changed = 0
+        self.skipped = 0
+        self.error = None
+        self.applying = False
+        self.timer = QTimer()
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.flush)
+
+    def start(self):
+        """Start the edit command, and the periodic application of results"""
+        self.command.begin()
+        self.timer.start()
+
+    def put(self, features, geometries, task=None):
+        """Queue a batch of results. Called from the worker thread.
+
+        Args:
+            features (list): Features (QgsFeature), with their original geometry
+            geometries (list): New geometries (QgsGeometry), None for the features
+                to leave unchanged
+            task (QgsTask, optional): If given, stop waiting for room in the queue
+                as soon as the task is canceled. Defaults to None.
+        """
+        batch = self.prepare(features, geometries)
+        while True:
+            if self.error is not None:
+                raise self.error
+            if task is not None and task.isCanceled():
+                raise Exception("Canceled")
+            try:
+                self.queue.put(batch, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def prepare(self, features, geometries):
+        """Build the queued batch. Called from the worker thread.
+
+        Args:
+            features (list): Features (QgsFeature), with their original geometry
+            geometries (list): New geometries (QgsGeometry), None for the features
+                to leave unchanged
+
+        Returns:
+            tuple: Batch, passed to apply
+        """
+        changed = [
+            (feat.id(), geometry)
+            for feat, geometry in zip(features, geometries)
+            if geometry is not None
+        ]
+        self.changed += len(changed)
+        self.skipped += len(features) - len(changed)
+        fids, geometries = zip(*changed) if changed else ((), ())
+        return list(fids), list(geometries)
+
+    def flush(self):
+        """Apply all the queued results. Called from the main thread. If applying a
+        batch fails, the error is kept in self.error, and raised in the worker
+        thread on its next put."""
+        while self.error is None:
+            try:
+                batch = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            self.applying = True
+            try:
+                with stage(self.stats, "write"):
+                    self.apply(*batch)
+            except Exception as error:  # pylint: disable=broad-except
+                self.error = error
+                self.timer.stop()
+            finally:
+                self.applying = False
+
+    def apply(self, fids, geometries):
+        """Apply a batch of results. Called from the main thread.
+
+        The layer signals are blocked during the batch, which is then announced by
+        a single dataChanged signal and repaint, instead of one per feature.
+
+        Args:
+            fids (list): Feature ids
+            geometries (list): New geometries (QgsGeometry)
+        """
+        if not fids:
+            return
+        blocked = self.layer.blockSignals(True)
+        try:
+            for fid, geometry in zip(fids, geometries):
+                self.layer.changeGeometry(fid, geometry, True)
+        finally:
+            self.layer.blockSignals(blocked)
+        self.layer.dataChanged.emit()
+        self.layer.triggerRepaint()
+
+    def finish(self, success=True):
+        """Apply the remaining results and end the edit command. On failure, the
+        edit command is destroyed instead, reverting all the applied results.
+
+        Args:
+            success (bool, optional): Whether the computation succeeded. Defaults
+                to True.
+        """
+        self.timer.stop()
+        if success:
+            self.flush()
+        self.command.end(success and self.error is None)
+
+
+class ProviderWriter(GeometryWriter):
+    """
+    Writes geometries straight to the layer's data provider, bypassing the edit
+    buffer and the undo stack. Each batch is a single changeGeometryValues call, and
+    its original geometries are saved to a GeometryBackup first, so that the run can
+    still be reverted with revert_backup. A checkpoint is recorded after each batch:
+    batches must come in increasing feature ids order, see checkpointed_chunks.
+    """
+
+    def __init__(
+        self,
+        layer,
+        backup,
+        rebuild_spatial_index=True,
+        max_pending=8,
+        interval=100,
+        stats=None,
+    ):
+        """Constructor. Must be called from the main thread.
+
+        Args:
+            layer (QgsVectorLayer): Edited layer. Must not have pending edits.
+            backup (GeometryBackup): Backup of the original geometries
+            rebuild_spatial_index (bool, optional): If True, rebuild the provider
+                spatial index once all the batches are written. Defaults to True.
+            max_pending, interval, stats: See GeometryWriter
+        """
+        super().__init__(layer, "", max_pending, interval, stats)
+        self.backup = backup
+        self.rebuild_spatial_index = rebuild_spatial_index
+        self.written = 0
+
+    def start(self):
+        """Start the periodic application of results"""
+        self.timer.start()
+
+    def prepare(self, features, geometries):
+        """Build the queued batch, including the original WKB geometries of the
+        changed features (as is, curves included) and the last feature id of the
+        chunk"""
+        changed = [
+            (feat, geometry)
+            for feat, geometry in zip(features, geometries)
+            if geometry is not None
+        ]
+        self.changed += len(changed)
+        self.skipped += len(features) - len(changed)
+        fids = [feat.id() for feat, _ in changed]
+        # The originals keep their curves, only the computation is segmentized
+        originals = [bytes(feat.geometry().asWkb()) for feat, _ in changed]
+        last = max(feat.id() for feat in features) if features else None
+        return fids, [geometry for _, geometry in changed], originals, last
+
+    def apply(self, fids, geometries, originals, last):
+        """Back up the original geometries, then write the new ones"""
+        if fids:
+            self.backup.save(fids, originals)
+            provider = self.layer.dataProvider()
+            if not provider.changeGeometryValues(dict(zip(fids, geometries))):
+                raise Exception(
+                    "Could not write geometries: {}".format(
+                        "\n".join(provider.errors())
+                    )
+                )
+        if last is not None:
+            self.backup.checkpoint(last)
+        self.written += len(fids)
+
+    def finish(self, success=True):
+        """Write the remaining results (on success only), then refresh the layer.
+        Batches already written are kept on failure: use revert_backup to undo
+        them, or checkpointed_chunks to resume the run."""
+        self.timer.stop()
+        if success:
+            self.flush()
+            provider = self.layer.dataProvider()
+            if (
+                self.error is None
+                and self.rebuild_spatial_index
+                and provider.capabilities() & QgsVectorDataProvider.CreateSpatialIndex
+            ):
+                with stage(self.stats, "spatial_index"):
+                    provider.createSpatialIndex()
+            if self.error is None:
+                self.backup.end_run()
+        self.layer.reload()
+        self.layer.triggerRepaint()
+
+
+def stage(stats, name):
+    """Time a block in a stage of the run statistics, if any
+
+    Args:
+        stats (RunStats): Run statistics, or None
+        name (str): Stage name
+
+    Returns:
+        Context manager
+    """
+    return contextlib.nullcontext() if stats is None else stats.stage(name)
+
+
+def revert_backup(layer, backup, size=CHUNK_SIZE):
+    """Write back the original geometries saved in a backup to the layer's data
+    provider, then delete the backup
+
+    Args:
+        layer (QgsVectorLayer): Layer
+        backup (GeometryBackup): Backup of the original geometries
+        size (int, optional): Number of geometries written at once. Defaults to
+            CHUNK_SIZE.
+    """
+    provider = layer.dataProvider()
+    for fids, blobs in backup.chunks(size):
+        geometries = [wkb_geometry(blob) if blob else QgsGeometry() for blob in blobs]
+        if not provider.changeGeometryValues(dict(zip(fids, geometries))):
+            raise Exception(
+                "Could not write geometries: {}".format("\n".join(provider.errors()))
+            )
+    backup.remove()
+    layer.reload()
+    layer.triggerRepaint()
+
+
+def chunked(iterable, size):
+    """Split an iterable into lists of at most size elements
+
+    Args:
+        iterable (iterable): Input iterable
+        size (int): Chunk size
+
+    Yields:
+        list: Chunk
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def geometry_wkb(geometry):
+    """WKB of a geometry, curved geometries being segmentized first
 
     Args:
         geometry (QgsGeometry): Input geometry
-        angle (int, optional): Angle. Defaults to 0.
 
     Returns:
-        (QgsGemetry, double): Computed oriented bounding box and its area
+        bytes: WKB blob, empty for empty geometries
     """
-    hull = geometry.convexHull()
-    if hull.isEmpty():
-        return hull
-    point_0 = hull.vertexAt(0)
-    hull.rotate(angle, QgsPointXY(point_0.x(), point_0.y()))
-    oob = hull.boundingBox()
-    res = QgsGeometry.fromRect(oob)
-    res.rotate(-angle, QgsPointXY(point_0.x(), point_0.y()))
-    return res, oob.area()
+    if geometry.isEmpty():
+        return b""
+    if QgsWkbTypes.isCurvedType(geometry.wkbType()):
+        geometry = QgsGeometry(geometry.constGet().segmentize())
+    return bytes(geometry.asWkb())
 
 
-def minimum_bounding_box(geometry):
-    """Compute the minimum oriented bounding box for the given geometry
-    Works around a bug in QgsGeometry orientedMinimumBoundingBox
-    (https://github.com/qgis/QGIS/pull/34334)
+def wkb_geometry(blob):
+    """Build a geometry from a WKB blob
 
     Args:
-        geometry (QgsGeometry): Input feature
+        blob (bytes): WKB blob
 
     Returns:
-        QgsGeometry: Minimum bounding box
+        QgsGeometry: Geometry
     """
+    geometry = QgsGeometry()
+    geometry.fromWkb(blob)
+    return geometry
 
-    hull = geometry.convexHull()
-    if hull.isEmpty():
-        return hull
 
-    min_geom, min_area = None, math.inf
-    min_angle = None
+def rectangles_geometry(rectangles):
+    """Build a polygon geometry out of rectangles. The first rectangle is the outer
+    ring, the other ones are its inner rings
 
-    point_0 = None
-    for vertex in hull.vertices():
-        if point_0 is None:
-            point_0 = vertex
-            continue
-        point_1 = vertex
-        angle = -math.degrees(
-            QgsGeometryUtils.lineAngle(
-                point_0.x(), point_0.y(), point_1.x(), point_1.y()
-            )
+    Args:
+        rectangles (numpy.ndarray): (k, 5) array of rectangles
+
+    Returns:
+        QgsGeometry: Polygon geometry
+    """
+    rectangles = np.asarray(rectangles, dtype=float).reshape(-1, 5)
+    (blob,) = write_wkb(rectangles, [0, len(rectangles)], [0, 1], [False])
+    return wkb_geometry(blob)
+
+
+def rectanglify_geometries(
+    geometries, constant_area=True, keep_rings=True, rings_share_axes=True, angles=None
+):
+    """Rectanglifies many geometries at once. Each part of multipart geometries is
+    rectanglified separately.
+
+    Args:
+        geometries (list): Input geometries (QgsGeometry)
+        constant_area, keep_rings, rings_share_axes: See rectanglify_geometry
+        angles (list, optional): Angle of each geometry, or None to compute a
+            minimal bounding box. Defaults to None.
+
+    Returns:
+        list: Output rectanglified geometries. Empty geometries are returned as is
+    """
+    boxes = None
+    if native_minimum_bounding_box():
+        boxes = native_bounding_boxes(geometries, angles=angles)
+    blobs = rectanglify_wkb(
+        [geometry_wkb(geometry) for geometry in geometries],
+        constant_area,
+        keep_rings,
+        rings_share_axes,
+        angles,
+        boxes,
+    )
+    return [
+        QgsGeometry(geometry) if blob is None else wkb_geometry(blob)
+        for geometry, blob in zip(geometries, blobs)
+    ]
+
+
+def counted_chunks(source, request, size=CHUNK_SIZE):
+    """Split the features of a request whose count is not known upfront, such as a
+    filter rectangle, into chunks. Must be called from the worker thread: the feature
+    ids are counted first, without geometries nor attributes, which providers answer
+    from their spatial index for filter rectangles.
+
+    Args:
+        source (QgsAbstractFeatureSource): Feature source
+        request (QgsFeatureRequest): Request of the target features
+        size (int, optional): Chunk size. Defaults to CHUNK_SIZE.
+
+    Returns:
+        (iterable, int): Chunks of features and their number
+    """
+    ids_request = QgsFeatureRequest(request)
+    ids_request.setFlags(QgsFeatureRequest.NoGeometry)
+    ids_request.setNoAttributes()
+    total = sum(1 for _ in source.getFeatures(ids_request))
+    return chunked(source.getFeatures(request), size), total
+
+
+def checkpointed_chunks(
+    source, request, backup, resume=False, options=None, size=CHUNK_SIZE
+):
+    """Split the features of a run into chunks of increasing feature ids, each one
+    fetched by its own request, so that the run can be resumed from the checkpoint of
+    its backup. Must be called from the worker thread: a new run starts by reading
+    all the target feature ids.
+
+    Args:
+        source (QgsAbstractFeatureSource): Feature source
+        request (QgsFeatureRequest): Request of the target features
+        backup (GeometryBackup): Journal of the run
+        resume (bool, optional): If True, resume the run journaled in the backup.
+            Else, start a new one. Defaults to False.
+        options (dict, optional): Options of a new run. Defaults to None.
+        size (int, optional): Chunk size. Defaults to CHUNK_SIZE.
+
+    Returns:
+        (iterable, int): Chunks of features and the number of features left
+    """
+    if not resume:
+        ids_request = QgsFeatureRequest(request)
+        ids_request.setFlags(QgsFeatureRequest.NoGeometry)
+        ids_request.setNoAttributes()
+        backup.begin_run(
+            (feat.id() for feat in source.getFeatures(ids_request)), options
         )
-        geom, area = oriented_bounding_box(hull, angle)
-        if area < min_area:
-            min_geom, min_area = geom, area
-            min_angle = angle
-        point_0 = point_1
 
-    return min_geom, min_angle
+    def chunks():
+        for fids in backup.remaining(size):
+            chunk_request = QgsFeatureRequest(request)
+            chunk_request.setFilterFids(fids)
+            yield list(source.getFeatures(chunk_request))
+
+    return chunks(), backup.remaining_count()
+
+
+class NeighborhoodAngles:
+    """
+    Dominant edge orientation around features. For each chunk, the features within
+    a radius of its extent are read, and the angle of a feature is the peak of the
+    summed edge orientation histograms of the features within a radius of its
+    bounding box. The histograms of the most recently used features are kept, as
+    consecutive chunks share most of their neighbors.
+    """
+
+    def __init__(self, source, radius, cache_size=HISTOGRAM_CACHE_SIZE):
+        """Constructor
+
+        Args:
+            source (QgsAbstractFeatureSource): Features of the neighborhoods
+            radius (float): Neighborhood radius, in layer units
+            cache_size (int, optional): Maximum number of kept histograms. Defaults
+                to HISTOGRAM_CACHE_SIZE.
+        """
+        self.source = source
+        self.radius = radius
+        self.cache_size = cache_size
+        self.histograms = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def neighbors(self, chunk, extent):
+        """Features of a chunk and their neighbors, with their histograms. The
+        histograms of the chunk features are computed from their own geometries.
+
+        Args:
+            chunk (list): Features (QgsFeature)
+            extent (QgsRectangle): Extent of the neighbors
+
+        Returns:
+            (list, numpy.ndarray): Features, and their (m, ORIENTATION_BINS)
+                histograms
+        """
+        fids = {feat.id() for feat in chunk}
+        request = QgsFeatureRequest().setNoAttributes().setFilterRect(extent)
+        features = chunk + [
+            feat for feat in self.source.getFeatures(request) if feat.id() not in fids
+        ]
+        rows = [None] * len(features)
+        with self.lock:
+            for i, feat in enumerate(features):
+                rows[i] = self.histograms.get(feat.id())
+                if rows[i] is not None:
+                    self.histograms.move_to_end(feat.id())
+
+        missing = [i for i, row in enumerate(rows) if row is None]
+        for batch in chunked(missing, CHUNK_SIZE):
+            coords, ring_offsets, polygon_offsets, part_offsets, _ = read_wkb(
+                [geometry_wkb(features[i].geometry()) for i in batch]
+            )
+            histograms = orientation_histograms(
+                coords, ring_offsets, polygon_offsets[part_offsets]
+            ).astype(np.complex64)
+            for i, histogram in zip(batch, histograms):
+                rows[i] = histogram
+        with self.lock:
+            for i in missing:
+                self.histograms[features[i].id()] = rows[i]
+            while len(self.histograms) > self.cache_size:
+                self.histograms.popitem(last=False)
+
+        return features, np.array(rows).reshape(-1, ORIENTATION_BINS)
+
+    def __call__(self, chunk):
+        """Angles of a chunk of features
+
+        Args:
+            chunk (list): Features (QgsFeature)
+
+        Returns:
+            list: Angle of each feature, None if its neighborhood has no edges
+        """
+        boxes = [
+            None if feat.geometry().isEmpty() else feat.geometry().boundingBox()
+            for feat in chunk
+        ]
+        summed = np.zeros((len(chunk), ORIENTATION_BINS), dtype=complex)
+        extent = None
+        for box in boxes:
+            if box is None:
+                continue
+            if extent is None:
+                extent = QgsRectangle(box)
+            else:
+                extent.combineExtentWith(box)
+        if extent is not None:
+            features, histograms = self.neighbors(chunk, extent.buffered(self.radius))
+            index = QgsSpatialIndex()
+            rows = {}
+            for feat in features:
+                index.addFeature(feat)
+                rows[feat.id()] = len(rows)
+            for i, box in enumerate(boxes):
+                if box is not None:
+                    neighbors = index.intersects(box.buffered(self.radius))
+                    summed[i] = histograms[[rows[fid] for fid in neighbors]].sum(axis=0)
+        return [
+            None if np.isnan(angle) else float(angle)
+            for angle in dominant_angles(summed)
+        ]
+
+
+def attribute_angles(chunk, field):
+    """Angles read from a field. NULL and non numeric values are None
+
+    Args:
+        chunk (list): Features (QgsFeature)
+        field (str): Field name
+
+    Returns:
+        list: Angle of each feature
+    """
+    angles = []
+    for feat in chunk:
+        try:
+            angles.append(float(feat[field]))
+        except (KeyError, TypeError, ValueError):
+            angles.append(None)
+    return angles
+
+
+def feature_angles(source, mode=ANGLE_MINIMUM, angle=0.0, field="", radius=100.0):
+    """Function giving the angles of the features of a chunk, for an angle mode.
+    Features without an angle get their minimum bounding box searched.
+
+    Args:
+        source (QgsAbstractFeatureSource): Feature source, read by the dominant mode
+        mode (str, optional): Angle mode. Defaults to ANGLE_MINIMUM.
+        angle (float, optional): Angle of the fixed mode, in degrees. Defaults to 0.
+        field (str, optional): Field of the attribute mode. Defaults to "".
+        radius (float, optional): Neighborhood radius of the dominant mode, in layer
+            units. Defaults to 100.
+
+    Returns:
+        callable: Takes a list of features, returns their angles (None for no
+            angle). None in the minimum mode.
+    """
+    if mode == ANGLE_FIXED:
+        return lambda chunk: [angle] * len(chunk)
+    if mode == ANGLE_ATTRIBUTE:
+        return functools.partial(attribute_angles, field=field)
+    if mode == ANGLE_DOMINANT:
+        return NeighborhoodAngles(source, radius)
+    return None
+
+
+def rectanglify_chunks(
+    chunks,
+    constant_area=True,
+    keep_rings=True,
+    rings_share_axes=True,
+    workers=1,
+    cache=None,
+    stats=None,
+    skip_unchanged=False,
+    angles=None,
+    area_tolerance=0.0,
+):
+    """Rectanglifies chunks of features, either in the current thread or in a pool
+    of worker processes. Results are yielded in the chunks order.
+
+    Args:
+        chunks (iterable): Lists of features (QgsFeature)
+        constant_area, keep_rings, rings_share_axes: See rectanglify_geometry
+        workers (int, optional): Number of worker processes. If 1, the chunks are
+            rectanglified in the current thread. Defaults to 1.
+        cache (AnalysisCache, optional): Cache of the minimum bounding boxes. Cached
+            geometries skip the bounding box search, the other ones are added to the
+            cache. Defaults to None.
+        stats (RunStats, optional): Run statistics, updated with the time spent
+            in each stage and the computed chunks. Defaults to None.
+        skip_unchanged (bool, optional): If True, the features which are already
+            rectangles are not computed. Defaults to False.
+        angles (callable, optional): Takes a chunk, returns the angle of each feature
+            (None to search its minimum bounding box), see feature_angles. Called in
+            the current thread. Defaults to None.
+        area_tolerance (float, optional): Relative area tolerance of the minimum
+            bounding boxes, see core.search_bounding_boxes. Approximate boxes are not
+            added to the cache. Defaults to 0.
+
+    In the current thread, the exact minimum bounding boxes of dense geometries are
+    searched by the native engine, see native_bounding_boxes.
+
+    Yields:
+        (list, list): Chunk of features and their rectanglified geometries. The
+            geometry of empty (and skipped) features is None.
+    """
+    function = functools.partial(
+        rectanglify_job,
+        constant_area=constant_area,
+        keep_rings=keep_rings,
+        rings_share_axes=rings_share_axes,
+        skip_unchanged=skip_unchanged,
+        area_tolerance=area_tolerance,
+    )
+
+    native = workers <= 1 and area_tolerance <= 0 and native_minimum_bounding_box()
+
+    def items():
+        iterator = iter(chunks)
+        while True:
+            with stage(stats, "fetch"):
+                chunk = next(iterator, None)
+            if chunk is None:
+                return
+            with stage(stats, "to_wkb"):
+                blobs = [geometry_wkb(feat.geometry()) for feat in chunk]
+            keys = boxes = None
+            if cache is not None:
+                with stage(stats, "cache"):
+                    keys = [geometry_key(blob) for blob in blobs]
+                    boxes = cache.get_many(keys)
+            chunk_angles = None
+            if angles is not None:
+                with stage(stats, "angles"):
+                    chunk_angles = angles(chunk)
+            known = boxes
+            if native:
+                with stage(stats, "native_search"):
+                    known = native_bounding_boxes(
+                        [feat.geometry() for feat in chunk], boxes, chunk_angles
+                    )
+            yield (chunk, keys, boxes), (blobs, known, chunk_angles)
+
+    if workers <= 1:
+        results = ((key, function(job)) for key, job in items())
+    else:
+        results = ordered_map(function, items(), workers)
+    try:
+        for (chunk, keys, boxes), (blobs, new_boxes, profile) in results:
+            if stats is not None:
+                stats.add(profile)
+                stats.chunk(
+                    [feat.id() for feat in chunk],
+                    sum(
+                        value
+                        for name, value in profile.items()
+                        if name not in ("vertices", "feature_vertices")
+                    ),
+                    profile.get("feature_vertices"),
+                )
+            if cache is not None and area_tolerance <= 0:
+                missing = [
+                    i
+                    for i, cached in enumerate(boxes)
+                    if cached is None and new_boxes[i] is not None
+                ]
+                if missing:
+                    with stage(stats, "cache"):
+                        cache.put_many(
+                            [keys[i] for i in missing], [new_boxes[i] for i in missing]
+                        )
+            with stage(stats, "from_wkb"):
+                geometries = [
+                    None if blob is None else wkb_geometry(blob) for blob in blobs
+                ]
+            yield chunk, geometries
+    finally:
+        results.close()
+
+
+def native_minimum_bounding_box():
+    """Whether QgsGeometry.orientedMinimumBoundingBox can be used
+
+    Returns:
+        bool: True if the running QGIS version has the fix
+    """
+    return Qgis.QGIS_VERSION_INT >= NATIVE_MINIMUM_VERSION
+
+
+def bounding_box_backends():
+    """Minimum bounding box engines available in the running QGIS
+
+    Returns:
+        list: Backend names
+    """
+    backends = [BACKEND_VECTORIZED, BACKEND_PYTHON]
+    if native_minimum_bounding_box():
+        backends.insert(0, BACKEND_NATIVE)
+    return backends
+
+
+def bounding_box_backend(vertices):
+    """Fastest minimum bounding box engine for a single geometry
+
+    Args:
+        vertices (int): Number of vertices of the geometry
+
+    Returns:
+        str: Backend name
+    """
+    if vertices <= PYTHON_MAX_VERTICES:
+        return BACKEND_PYTHON
+    if native_minimum_bounding_box():
+        return BACKEND_NATIVE
+    return BACKEND_VECTORIZED
 
 
-def scale_geometry(geometry, area_ratio):
-    """Scale the geometry so that its new area is area_ratio * old_area
+def native_rectangle(geometry):
+    """Minimum bounding box of a geometry, searched by the native engine
+
+    Args:
+        geometry (QgsGeometry): Non empty geometry
+
+    Returns:
+        tuple: Rectangle, None if the native box is degenerate
+    """
+    points = wkb_points(geometry_wkb(geometry.orientedMinimumBoundingBox()[0]))
+    if len(points) != 5:
+        return None
+    return python_rectangle_parameters(points)
+
+
+def native_bounding_boxes(
+    geometries, boxes=None, angles=None, min_vertices=NATIVE_MIN_VERTICES
+):
+    """Outer ring minimum bounding boxes of the dense geometries of a chunk, searched
+    by the native engine, in the format of core.rectanglify_wkb. Only usable in the
+    current thread: the worker processes do not load QGIS.
+
+    Args:
+        geometries (list): Geometries (QgsGeometry)
+        boxes (list, optional): Already known boxes, kept. Defaults to None.
+        angles (list, optional): Angle of each geometry. Geometries with an angle are
+            skipped. Defaults to None.
+        min_vertices (int, optional): Geometries with fewer vertices are left to the
+            numpy batch. Defaults to NATIVE_MIN_VERTICES.
+
+    Returns:
+        list: (parts, 5) arrays, None for the geometries left to the core
+    """
+    result = [None] * len(geometries) if boxes is None else list(boxes)
+    for i, geometry in enumerate(geometries):
+        if (
+            result[i] is not None
+            or (angles is not None and angles[i] is not None)
+            or geometry.isEmpty()
+            or QgsWkbTypes.isCurvedType(geometry.wkbType())
+            or geometry.constGet().nCoordinates() < min_vertices
+        ):
+            continue
+        parts = (
+            geometry.asGeometryCollection() if geometry.isMultipart() else [geometry]
+        )
+        rectangles = [native_rectangle(part) for part in parts if not part.isEmpty()]
+        # Degenerate boxes are searched by the core
+        if rectangles and None not in rectangles:
+            result[i] = np.array(rectangles)
+    return result
+
+
+def oriented_bounding_box(geometry, angle=0):
+    """Compute the oriented bounding box of the geometry at a given angle. Small
+    geometries are computed in pure Python, see PYTHON_MAX_VERTICES.
 
     Args:
         geometry (QgsGeometry): Input geometry
-        area_ratio (double): Ratio
+        angle (int, optional): Angle. Defaults to 0.
 
     Returns:
-        QgsGeometry: Output Geometry. Note that the input geometry is modified in-place
+        (QgsGemetry, double): Computed oriented bounding box and its area
     """
+    if geometry.isEmpty():
+        return QgsGeometry(), 0
+    if geometry.constGet().nCoordinates() <= PYTHON_MAX_VERTICES:
+        rectangle = python_bounding_box(wkb_points(geometry_wkb(geometry)), angle)
+        return wkb_geometry(rectangle_wkb(rectangle)), rectangle[2] * rectangle[3]
+    coords = read_wkb([geometry_wkb(geometry)])[0]
+    rectangle = oriented_bounding_boxes(coords, [0, len(coords)], [angle])[0]
+    return rectangles_geometry(rectangle), rectangle[2] * rectangle[3]
 
-    centroid = geometry.centroid().asPoint()
-    transform = QTransform()
-    transform.translate(centroid.x(), centroid.y())
-    transform.scale(area_ratio ** 0.5, area_ratio ** 0.5)
-    transform.translate(-centroid.x(), -centroid.y())
-    geometry.transform(transform)
-    return geometry
+
+def minimum_bounding_box(geometry, backend=None):
+    """Compute the minimum oriented bounding box for the given geometry. The native
+    QgsGeometry orientedMinimumBoundingBox is only used on the QGIS versions where
+    it is fixed (https://github.com/qgis/QGIS/pull/34334)
+
+    Args:
+        geometry (QgsGeometry): Input feature
+        backend (str, optional): Engine, one of bounding_box_backends. Defaults to
+            None, the fastest one for the number of vertices of the geometry.
+
+    Returns:
+        (QgsGeometry, double): Minimum bounding box and its angle
+    """
+    if geometry.isEmpty():
+        return QgsGeometry(), None
+    if backend is None:
+        backend = bounding_box_backend(geometry.constGet().nCoordinates())
+    elif backend not in bounding_box_backends():
+        raise ValueError(f"Unavailable bounding box backend: {backend}")
+
+    rectangle = None
+    if backend == BACKEND_NATIVE:
+        rectangle = native_rectangle(geometry)
+    elif backend == BACKEND_PYTHON:
+        rectangle = python_bounding_box(wkb_points(geometry_wkb(geometry)))
+    if rectangle is None:
+        coords = read_wkb([geometry_wkb(geometry)])[0]
+        hull = convex_hull(coords)
+        rectangle = minimum_bounding_boxes(hull, [0, len(hull)])[0]
+    return wkb_geometry(rectangle_wkb(rectangle)), rectangle[4]
 
 
 def rectanglify_geometry(
@@ -137,29 +950,6 @@ def rectanglify_geometry(
     Returns:
         QgsGeometry: Output rectanglified geometry
     """
-    # If an angle is define use it. Else, compute miminum bounding box
-    if angle is None:
-        new_geom, angle = minimum_bounding_box(geometry)
-    else:
-        new_geom, _ = oriented_bounding_box(geometry, angle)
-
-    # Try to keep rings
-    if keep_rings:
-
-        # We just care about the rings here, not the outer polygon
-        _, *rings = geometry.asPolygon()
-
-        # Recursively call rectanglify_geometry on the rings
-        for ring in rings:
-            ring = rectanglify_geometry(
-                QgsGeometry.fromPolygonXY([ring]),
-                angle=angle if rings_share_axes else None,
-            ).asPolygon()[0]
-            new_geom.addRing(ring)
-
-    # Scale geometry
-    if constant_area:
-        old_area = geometry.area()
-        new_area = new_geom.area()
-        scale_geometry(new_geom, old_area / new_area)
-    return new_geom
+    return rectanglify_geometries(
+        [geometry], constant_area, keep_rings, rings_share_axes, [angle]
+    )[0]